@@ -1,3 +1,6 @@
+import os
+import sys
+
 # 导入OpenAI的聊天模型类
 # ChatOpenAI是LangChain提供的与OpenAI GPT模型交互的接口
 from langchain_openai import ChatOpenAI
@@ -6,10 +9,17 @@ from langchain_openai import ChatOpenAI
 # dotenv用于从.env文件中加载环境变量，比如API密钥
 from dotenv import load_dotenv
 
+# llm_cache.py 在仓库根目录；追加在搜索路径末尾，不会遮盖本目录的模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_cache import install_llm_cache  # noqa: E402
+
 # 加载.env文件中的环境变量
 # 这会将.env文件中的变量（如OPENAI_API_KEY）加载到系统环境中
 load_dotenv()
 
+# 全局 LLM 响应缓存：重复运行不再调用 API，LLM_CACHE=off 关闭（见仓库根目录的 llm_cache.py）
+install_llm_cache()
+
 # 创建ChatOpenAI实例
 # model参数指定使用的模型名称，这里使用GPT-4
 # 如果没有设置API密钥，会从环境变量OPENAI_API_KEY中获取
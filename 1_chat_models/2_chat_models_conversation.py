@@ -1,3 +1,6 @@
+import os
+import sys
+
 # 导入必要的模块
 # SystemMessage: 用于设置AI助手的系统角色和行为
 # HumanMessage: 表示用户输入的消息
@@ -10,9 +13,16 @@ from langchain_openai import ChatOpenAI
 # 导入环境变量加载工具，用于从.env文件加载API密钥等配置
 from dotenv import load_dotenv
 
+# llm_cache.py 在仓库根目录；追加在搜索路径末尾，不会遮盖本目录的模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_cache import install_llm_cache  # noqa: E402
+
 # 加载.env文件中的环境变量（如OPENAI_API_KEY）
 load_dotenv()
 
+# 全局 LLM 响应缓存：重复运行不再调用 API，LLM_CACHE=off 关闭（见仓库根目录的 llm_cache.py）
+install_llm_cache()
+
 # 创建ChatOpenAI实例，使用gpt-3.5-turbo模型
 # 这个模型是OpenAI提供的对话优化模型，适合聊天和问答任务
 llm = ChatOpenAI(model="gpt-3.5-turbo")
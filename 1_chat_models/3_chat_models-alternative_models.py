@@ -1,3 +1,6 @@
+import os
+import sys
+
 # 导入不同AI提供商的聊天模型接口
 # ChatGoogleGenerativeAI: Google的Gemini模型接口
 # ChatAnthropic: Anthropic的Claude模型接口  
@@ -10,12 +13,22 @@ from langchain_openai import ChatOpenAI
 from dotenv import load_dotenv
 from langchain_core.messages import HumanMessage, SystemMessage
 
+# 多提供商路由：并发调用、按延迟选择、对冲和降级（见 model_router.py）
+from model_router import ModelRouter
+
+# llm_cache.py 在仓库根目录；追加在搜索路径末尾，不会遮盖本目录的模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_cache import install_llm_cache  # noqa: E402
+
 # LangChain聊天模型文档链接
 # https://python.langchain.com/docs/integrations/chat/
 
 # 加载环境变量（包含各AI提供商的API密钥）
 load_dotenv()
 
+# 全局 LLM 响应缓存：重复运行不再调用 API，LLM_CACHE=off 关闭（见仓库根目录的 llm_cache.py）
+install_llm_cache()
+
 # 定义统一的对话消息
 # 包含系统指令和用户问题
 messages = [
@@ -27,11 +40,7 @@ messages = [
 
 # 创建OpenAI聊天模型实例
 # gpt-3.5-turbo是OpenAI的对话优化模型，性价比高
-model = ChatOpenAI(model="gpt-3.5-turbo")
-
-# 调用模型处理消息
-result = model.invoke(messages)
-print(f"Answer from OpenAI: {result.content}")
+openai_model = ChatOpenAI(model="gpt-3.5-turbo")
 
 
 # ===== Anthropic Claude模型示例 =====
@@ -39,11 +48,7 @@ print(f"Answer from OpenAI: {result.content}")
 # 创建Anthropic聊天模型实例
 # claude-3-opus-20240229是Claude 3系列中最强大的模型
 # Anthropic模型文档: https://docs.anthropic.com/en/docs/models-overview
-model = ChatAnthropic(model="claude-3-opus-20240229")
-
-# 调用模型处理相同的消息
-result = model.invoke(messages)
-print(f"Answer from Anthropic: {result.content}")
+anthropic_model = ChatAnthropic(model="claude-3-opus-20240229")
 
 
 # ===== Google Gemini模型示例 =====
@@ -52,8 +57,31 @@ print(f"Answer from Anthropic: {result.content}")
 # gemini-1.5-flash是Google的快速响应模型，适合实时应用
 # Google AI控制台: https://console.cloud.google.com/gen-app-builder/engines
 # Gemini API文档: https://ai.google.dev/gemini-api/docs/models/gemini
-model = ChatGoogleGenerativeAI(model="gemini-1.5-flash")
+google_model = ChatGoogleGenerativeAI(model="gemini-1.5-flash")
+
+models = {"OpenAI": openai_model, "Anthropic": anthropic_model, "Google": google_model}
+
+
+# ===== 同时询问三个模型 =====
+
+# 原来依次调用三个模型，总延迟是三次调用之和；
+# mode="all" 把相同的消息同时发给所有模型，总延迟只取决于最慢的那个，
+# 某个提供商出错也不会影响其他两个的回答
+answers = ModelRouter(models, mode="all").invoke(messages)
+for provider, result in answers.items():
+    if isinstance(result, Exception):
+        print(f"Error from {provider}: {result}")
+    else:
+        print(f"Answer from {provider}: {result.content}")
+
+
+# ===== 只需要一个回答时：按延迟路由 =====
 
-# 调用模型处理相同的消息
-result = model.invoke(messages)
-print(f"Answer from Google: {result.content}")
+# 先发给延迟中位数最低的模型；1 秒内没有返回就同时发给下一个模型（对冲），
+# 出错则立即换下一个模型（降级）
+# 还没有测量数据的模型会先各试一次（前三次调用），之后总是先发给最快的模型
+router = ModelRouter(models, hedge_delay=1.0)
+for _ in range(4):
+    result = router.invoke(messages)
+print(f"Routed answer from {result.response_metadata['routed_to']}: {result.content}")
+print(f"Router stats: {router.stats()}")
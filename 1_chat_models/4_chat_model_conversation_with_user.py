@@ -1,23 +1,29 @@
 # 导入必要的模块
 from dotenv import load_dotenv  # 用于加载环境变量
 from langchain_openai import ChatOpenAI  # OpenAI聊天模型接口
-from langchain_core.messages import AIMessage, HumanMessage, SystemMessage  # 消息类型定义
+from langchain_core.messages import SystemMessage  # 消息类型定义
+from chat_history_manager import TokenBudgetedHistory  # 按 token 预算管理聊天历史（见 chat_history_manager.py）
+from streaming_output import format_stats, stream_reply, summarize_turns  # 流式输出（见 streaming_output.py）
 
 # 从.env文件加载环境变量（包含API密钥等配置）
 load_dotenv()
 
 # 创建ChatOpenAI模型实例
 # 使用gpt-4o模型，这是OpenAI最新的多模态模型，支持文本和图像输入
-model = ChatOpenAI(model="gpt-3.5-turbo")
-
-# 初始化聊天历史记录列表
-# 用于存储整个对话过程中的所有消息
-chat_history = []
+# stream_usage=True：流式输出的最后一个片段会带上 token 用量
+model = ChatOpenAI(model="gpt-3.5-turbo", stream_usage=True)
 
 # 设置初始系统消息（可选）
 # 系统消息用于定义AI助手的行为和角色
 system_message = SystemMessage(content="You are a helpful AI assistant.")
-chat_history.append(system_message)  # 将系统消息添加到聊天历史中
+
+# 初始化聊天历史
+# 不再把所有消息无限追加到一个列表里：系统消息和最近 4 轮对话原样保留，
+# 更早的对话由模型增量折叠成一段摘要，发送给模型的历史始终不超过 2000 个 token
+chat_history = TokenBudgetedHistory(model, system_message, max_tokens=2000, keep_last_turns=4)
+
+# 每一轮的首 token 延迟和生成速度
+turn_stats = []
 
 # 开始交互式聊天循环
 while True:
@@ -28,25 +34,27 @@ while True:
     if query.lower() == "exit":
         break
     
-    # 将用户消息添加到聊天历史中
-    # HumanMessage表示用户输入的消息
-    chat_history.append(HumanMessage(content=query))
+    # 将用户消息添加到聊天历史中（内部包装成 HumanMessage）
+    chat_history.add_user_message(query)
 
-    # 使用完整的聊天历史调用AI模型
-    # 这样AI可以记住之前的对话内容，实现上下文连贯的对话
-    result = model.invoke(chat_history)
+    # 使用"系统消息 + 摘要 + 最近几轮"调用AI模型
+    # 这样AI既能记住之前的对话内容，提示长度又不会随对话无限增长
+    # 流式调用：回复边生成边打印，结束后得到完整的 AIMessage
+    result, stats = stream_reply(model, chat_history.messages())
     response = result.content
+    turn_stats.append(stats)
     
-    # 将AI的回复添加到聊天历史中
-    # AIMessage表示AI助手的回复消息
-    chat_history.append(AIMessage(content=response))
+    # 将AI的回复添加到聊天历史中（内部包装成 AIMessage）
+    # 如果有对话滑出了窗口，会在这里折叠进摘要
+    chat_history.add_ai_message(response)
 
-    # 打印AI的回复
-    print(f"AI: {response}")
+    print(format_stats(stats))
+    print(f"[history: {chat_history.total_tokens()} tokens, {chat_history.summarized_turns} turns summarized]")
 
-# 程序结束后，打印完整的消息历史记录
+# 程序结束后，打印最后一次发送给模型的消息历史（系统消息 + 摘要 + 最近几轮）
 # 这有助于调试和了解对话的完整流程
 print("---- Message History ----")
-print(chat_history)
+print(chat_history.messages())
+print(summarize_turns(turn_stats))
 
 # 实际生产中，chat_history存在云端，用户回来后，可以随时查看对话历史
@@ -6,8 +6,12 @@ from dotenv import load_dotenv  # 环境变量管理
 from google.cloud import firestore  # Google Firestore数据库客户端
 from langchain_google_firestore import FirestoreChatMessageHistory  # LangChain的Firestore消息历史集成
 from langchain_openai import ChatOpenAI  # OpenAI聊天模型
+import os
 import time  # 用于添加延迟和调试
 
+from streaming_output import format_stats, stream_reply, summarize_turns  # 流式输出（见 streaming_output.py）
+from write_behind_history import WriteBehindChatMessageHistory  # 本地缓冲、后台批量写回（见 write_behind_history.py）
+
 """
 设置步骤说明（复制此示例的步骤）:
 1. 创建Firebase账户，网址是https://firebase.google.com/ (注意不要使用学校邮箱，我用的是zdsjtu@gmail.com)
@@ -21,6 +25,10 @@ import time  # 用于添加延迟和调试
 5. 安装依赖: pip install langchain-google-firestore
 6. 在Google Cloud Console中启用Firestore API:
     - 启用链接: https://console.cloud.google.com/apis/enableflow?apiid=firestore.googleapis.com&project=crewai-automation
+
+本地调试也可以使用Firestore模拟器，不需要真实的Firebase项目:
+    gcloud emulators firestore start --host-port=localhost:8080
+    export FIRESTORE_EMULATOR_HOST=localhost:8080
 """
 
 # 加载环境变量（包含API密钥等配置）
@@ -30,6 +38,8 @@ load_dotenv()
 PROJECT_ID = "langchain-e6855"  # Firebase项目ID，需要替换为你自己的项目ID
 SESSION_ID = "user_session_new"  # 会话ID，可以是用户名或唯一标识符
 COLLECTION_NAME = "chat_history"  # Firestore集合名称，用于存储聊天历史
+# 本地缓冲文件：还没写到Firestore的消息先存在这里，程序崩溃后重启可以恢复
+BUFFER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "chat_history_buffer.sqlite3")
 
 try:
     # 初始化Firestore客户端
@@ -50,18 +60,23 @@ try:
 
     # 初始化Firestore聊天消息历史管理器
     print("正在初始化Firestore聊天消息历史...")
-    chat_history = FirestoreChatMessageHistory(
+    firestore_history = FirestoreChatMessageHistory(
         session_id=SESSION_ID,      # 会话标识符
         collection=COLLECTION_NAME, # 集合名称
         client=client,              # Firestore客户端实例
     )
+    # 包装一层写回缓冲：读写都走本地，后台线程每秒（或每20条）把新消息批量写到Firestore
+    chat_history = WriteBehindChatMessageHistory(firestore_history, BUFFER_PATH, SESSION_ID)
     print("聊天历史初始化完成。")
+    if chat_history.recovered_messages:
+        print(f"从本地缓冲恢复了 {chat_history.recovered_messages} 条未同步的消息")
     print("当前聊天历史:", chat_history.messages)
 
     # 初始化聊天模型
     print("正在初始化聊天模型...")
-    model = ChatOpenAI(model="gpt-3.5-turbo")
+    model = ChatOpenAI(model="gpt-3.5-turbo", stream_usage=True)  # 流式输出时返回 token 用量
     print("聊天模型初始化完成！")
+    turn_stats = []  # 每一轮的首 token 延迟和生成速度
 
     # 开始交互式聊天循环
     print("开始与AI聊天。输入'exit'退出。")
@@ -75,31 +90,30 @@ try:
             break
 
         try:
-            # 将用户消息添加到Firestore历史记录中
-            # 这会自动将消息保存到云端数据库
-            print("正在保存用户消息到Firestore...")
+            # 将用户消息添加到聊天历史中
+            # 只写本地缓冲，立即返回；云端写入由后台线程完成
             chat_history.add_user_message(human_input)
-            print("用户消息保存成功！")
 
             # 使用完整的聊天历史调用AI模型
-            # 模型可以访问之前保存的所有对话内容
-            print("正在调用AI模型...")
-            ai_response = model.invoke(chat_history.messages)
-            print("AI模型调用成功！")
+            # messages 从本地副本读取，不需要再访问Firestore
+            # 流式调用：回复边生成边打印，结束后得到完整的 AIMessage
+            ai_response, stats = stream_reply(model, chat_history.messages)
+            turn_stats.append(stats)
+            print(format_stats(stats))
             
-            # 将AI回复添加到Firestore历史记录中
-            # 同样会自动保存到云端
-            print("正在保存AI回复到Firestore...")
-            chat_history.add_ai_message(ai_response.content)
-            print("AI回复保存成功！")
-
-            # 显示AI回复
-            print(f"AI: {ai_response.content}")
+            # 将AI回复添加到聊天历史中，同样由后台线程批量保存到云端
+            chat_history.add_message(ai_response)
             
         except Exception as e:
             print(f"对话过程中出现错误: {e}")
             print("尝试继续对话...")
 
+    # 退出前把剩余的消息写到Firestore
+    print("正在同步剩余消息到Firestore...")
+    chat_history.close()
+    print(f"同步完成：共 {chat_history.flushes} 次批量写入，{chat_history.flushed_messages} 条消息")
+    print(summarize_turns(turn_stats))
+
 except Exception as e:
     print(f"初始化过程中出现错误: {e}")
     print("\n可能的解决方案:")
@@ -0,0 +1,103 @@
+# 聊天历史存储基准测试：进程内列表 vs SQLite（sqlite_chat_history.py）
+#
+# 模拟 4_chat_model_conversation_with_user.py 的用法，但有很多个会话同时存在：
+# 每个会话一个消息列表（字典 session_id -> list），对比 SQLiteChatMessageHistory 的
+# - 追加：每个会话依次写入 turns 轮对话（每轮一问一答）
+# - 尾部读取：随机抽取会话，读取最近 tail 条消息
+# - 全量读取：随机抽取会话，读取全部消息
+# - 压缩：每个会话只保留最近 tail 条，并 VACUUM
+# 全程不调用模型，不产生任何费用。
+#
+# 使用方法：
+#   python 1_chat_models/benchmark_chat_history.py --sessions 10000 --turns 5
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from sqlite_chat_history import SQLiteChatStore
+
+
+def make_turn(session, turn):
+    return [
+        HumanMessage(content=f"[{session}] question {turn}: what happened in chapter {turn}?"),
+        AIMessage(content=f"[{session}] answer {turn}: " + "a fairly typical assistant reply. " * 8),
+    ]
+
+
+def report(name, count, elapsed, unit):
+    print(f"{name:<28} {elapsed:8.2f}s  {count / elapsed:12.0f} {unit}/sec  {elapsed / count * 1e6:10.1f} us/op")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark chat history storage")
+    parser.add_argument("--sessions", type=int, default=10_000)
+    parser.add_argument("--turns", type=int, default=5, help="turns (question + answer) per session")
+    parser.add_argument("--tail", type=int, default=4, help="messages read by tail reads")
+    parser.add_argument("--reads", type=int, default=10_000, help="random session reads")
+    args = parser.parse_args()
+
+    session_ids = [f"user_{i}" for i in range(args.sessions)]
+    appends = args.sessions * args.turns
+    random.seed(0)
+    read_ids = [random.choice(session_ids) for _ in range(args.reads)]
+    print(f"{args.sessions} sessions x {args.turns} turns = {appends * 2} messages\n")
+
+    # --- 进程内列表：4_chat_model_conversation_with_user.py 的做法 ---
+    print("--- In-memory lists ---")
+    histories = {session_id: [] for session_id in session_ids}
+    start = time.perf_counter()
+    for turn in range(args.turns):
+        for session_id in session_ids:
+            histories[session_id].extend(make_turn(session_id, turn))
+    report("append turn", appends, time.perf_counter() - start, "turns")
+
+    start = time.perf_counter()
+    for session_id in read_ids:
+        histories[session_id][-args.tail:]
+    report(f"tail read (last {args.tail})", args.reads, time.perf_counter() - start, "reads")
+
+    start = time.perf_counter()
+    for session_id in read_ids:
+        list(histories[session_id])
+    report("full read", args.reads, time.perf_counter() - start, "reads")
+
+    # --- SQLite：每轮一个事务，数据在进程退出后仍然保留 ---
+    print("\n--- SQLite (WAL) ---")
+    path = os.path.join(tempfile.mkdtemp(), "chat_history.sqlite3")
+    store = SQLiteChatStore(path)
+    start = time.perf_counter()
+    for turn in range(args.turns):
+        for session_id in session_ids:
+            store.history(session_id).add_messages(make_turn(session_id, turn))
+    report("append turn", appends, time.perf_counter() - start, "turns")
+
+    start = time.perf_counter()
+    for session_id in read_ids:
+        store.history(session_id).tail(args.tail)
+    report(f"tail read (last {args.tail})", args.reads, time.perf_counter() - start, "reads")
+
+    start = time.perf_counter()
+    for session_id in read_ids:
+        store.history(session_id).messages
+    report("full read", args.reads, time.perf_counter() - start, "reads")
+
+    size_before = os.path.getsize(path) + os.path.getsize(path + "-wal")
+    start = time.perf_counter()
+    for session_id in session_ids:
+        store.history(session_id).compact(keep_last=args.tail)
+    store.vacuum()
+    report(f"compact (keep {args.tail}) + vacuum", args.sessions, time.perf_counter() - start, "sessions")
+    size_after = os.path.getsize(path) + os.path.getsize(path + "-wal")
+    print(f"\nDatabase size: {size_before / 1e6:.1f} MB -> {size_after / 1e6:.1f} MB after compaction")
+    store.close()
+    if size_after >= size_before:
+        raise SystemExit("compact + vacuum did not shrink the database file")
+
+
+if __name__ == "__main__":
+    main()
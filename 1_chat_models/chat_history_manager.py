@@ -0,0 +1,121 @@
+# 聊天历史管理：按 token 预算保留最近几轮对话，更早的对话折叠成滚动摘要
+#
+# 4_chat_model_conversation_with_user.py 原来把每一条 HumanMessage / AIMessage 都追加到 chat_history，
+# 每一轮都把整个列表发给 model.invoke(chat_history)：
+# 对话越长，提示越长，延迟和费用都会无限增长，最终超出模型的上下文窗口。
+#
+# TokenBudgetedHistory 的做法：
+# - 系统消息永远保留
+# - 最近 keep_last_turns 轮对话（一问一答为一轮）原样保留
+# - 更早的对话折叠进一段滚动摘要：每当有一轮对话滑出窗口，只把"旧摘要 + 这一轮"交给模型
+#   生成新摘要（增量计算），不会每次都重新总结整个历史
+# - 如果最近几轮本身就超出了 max_tokens，会继续把最早的一轮折叠进摘要，直到满足预算
+# - 每条消息的 token 数在加入时用 tiktoken 计算一次并缓存，之后每一轮都不再重新计数（见 token_counter.py）
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from token_counter import TOKENS_PER_REPLY, message_tokens
+
+SUMMARY_PROMPT = """Progressively summarize the conversation, adding onto the previous summary and returning a new summary.
+Keep names, facts, decisions and open questions. Be concise.
+
+Current summary:
+{summary}
+
+New lines of conversation:
+{new_lines}
+
+New summary:"""
+
+
+class TokenBudgetedHistory:
+    """系统消息 + 滚动摘要 + 最近 N 轮原文，总 token 数不超过 max_tokens"""
+
+    def __init__(
+        self,
+        model,
+        system_message,
+        max_tokens=2000,
+        keep_last_turns=4,
+        encoding_model="gpt-3.5-turbo",
+        summarizer=None,
+    ):
+        """
+        参数:
+            model: 对话使用的聊天模型，默认也用它来生成摘要
+            system_message: 系统消息
+            max_tokens: 发送给模型的历史消息的 token 上限
+            keep_last_turns: 原样保留的最近轮数
+            encoding_model: 选择 tiktoken 编码器用的模型名
+            summarizer: 可选的摘要模型（例如更便宜的模型），默认使用 model
+        """
+        self.summarizer = summarizer or model
+        self.system_message = system_message
+        self.max_tokens = max_tokens
+        self.keep_last_turns = keep_last_turns
+        self.encoding_model = encoding_model
+
+        self.summary = ""
+        self._summary_tokens = 0
+        # 每个元素是 (消息, token 数)，token 数只在加入时计算一次
+        self._messages = []
+        self._system_tokens = self._count(system_message)
+        self.summarized_turns = 0
+
+    def _count(self, message):
+        return message_tokens(message, self.encoding_model)
+
+    def _summary_message(self):
+        return SystemMessage(content=f"Summary of the earlier conversation:\n{self.summary}")
+
+    def total_tokens(self):
+        """当前 messages() 的 token 总数（只做加法，不重新编码）"""
+        return (
+            self._system_tokens
+            + self._summary_tokens
+            + sum(tokens for _, tokens in self._messages)
+            + TOKENS_PER_REPLY
+        )
+
+    def _turn_count(self):
+        return sum(1 for message, _ in self._messages if isinstance(message, HumanMessage))
+
+    def _fold_oldest_turn(self):
+        """把最早的一轮（一条用户消息及其后的回复）折叠进摘要"""
+        turn = [self._messages.pop(0)]
+        while self._messages and not isinstance(self._messages[0][0], HumanMessage):
+            turn.append(self._messages.pop(0))
+        new_lines = "\n".join(
+            f"{'Human' if isinstance(message, HumanMessage) else 'AI'}: {message.content}"
+            for message, _ in turn
+        )
+        prompt = SUMMARY_PROMPT.format(summary=self.summary or "(empty)", new_lines=new_lines)
+        self.summary = self.summarizer.invoke([HumanMessage(content=prompt)]).content.strip()
+        self._summary_tokens = self._count(self._summary_message())
+        self.summarized_turns += 1
+
+    def _enforce_budget(self):
+        # 超出窗口的轮次折叠进摘要
+        while self._turn_count() > self.keep_last_turns:
+            self._fold_oldest_turn()
+        # 仍然超出预算时继续折叠，但至少保留最近一轮
+        while self.total_tokens() > self.max_tokens and self._turn_count() > 1:
+            self._fold_oldest_turn()
+
+    def add_user_message(self, content):
+        message = HumanMessage(content=content)
+        self._messages.append((message, self._count(message)))
+
+    def add_ai_message(self, content):
+        message = AIMessage(content=content)
+        self._messages.append((message, self._count(message)))
+        # 一轮对话结束时再整理历史，这样用户提问和模型调用之间不会插入摘要调用
+        self._enforce_budget()
+
+    def messages(self):
+        """发送给模型的消息列表"""
+        messages = [self.system_message]
+        if self.summary:
+            messages.append(self._summary_message())
+        messages.extend(message for message, _ in self._messages)
+        return messages
@@ -0,0 +1,272 @@
+# 多提供商模型路由：按实测延迟选择模型，慢了就对冲，出错就降级
+#
+# 3_chat_models-alternative_models.py 依次调用 OpenAI、Anthropic、Google 三个模型，
+# 总延迟是三次调用之和；任何一个提供商出错，整个脚本就停下来。
+#
+# ModelRouter 是一个 Runnable，可以像普通模型一样 invoke / ainvoke，也能放进链里：
+# - mode="route"（默认）：
+#   1. 按每个模型最近 window 次调用的延迟中位数（p50）从快到慢排序，先发给最快的模型
+#      （还没有测量数据的模型排在最前面，每个模型都会先被试一次）
+#      出错的模型进入冷却期（cooldown 秒，连续出错时翻倍，最多 max_cooldown 秒），冷却期内排在最后，
+#      只在其他模型都失败时才会用到；冷却期过后再试一次，成功一次就恢复正常排序。
+#      这样缺少 API 密钥之类一直出错的提供商不会每次都排在最前面、让每个请求都先等它失败
+#   2. 对冲：hedge_delay 秒后还没有返回，就把同一个请求再发给下一个模型，谁先成功用谁
+#   3. 降级：某个模型出错，立即把请求发给下一个模型；全部失败才抛出 AllModelsFailedError
+# - mode="first"：同时发给所有模型，返回最先成功的结果
+# - mode="all"：同时发给所有模型，返回 {模型名: 结果或异常}
+#
+# 同步调用用线程池并发，异步调用用 asyncio 任务并发；
+# 异步模式下输掉的请求会被取消，同步模式下只能让它在后台跑完（结果丢弃，但延迟照样计入统计）。
+# 返回的消息的 response_metadata["routed_to"] 记录实际回答的模型。
+
+import asyncio
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from langchain_core.runnables import Runnable
+
+
+class AllModelsFailedError(RuntimeError):
+    """所有模型都调用失败"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("All models failed: " + "; ".join(f"{name}: {e}" for name, e in errors))
+
+
+class ModelRouter(Runnable):
+    """在多个聊天模型之间路由、对冲和降级"""
+
+    def __init__(self, models, mode="route", hedge_delay=None, window=50, cooldown=30.0, max_cooldown=600.0):
+        """
+        参数:
+            models: {名字: 聊天模型}，字典顺序就是没有测量数据时的优先顺序
+            mode: "route"、"first" 或 "all"
+            hedge_delay: 对冲等待时间（秒），None 表示不对冲（仍然会在出错时降级）
+            window: 每个模型保留最近多少次成功调用的延迟
+            cooldown: 模型出错后排到最后的时间（秒），连续出错时翻倍
+            max_cooldown: 冷却时间的上限（秒）
+        """
+        if mode not in ("route", "first", "all"):
+            raise ValueError(f"Unknown mode: {mode}")
+        self.models = dict(models)
+        self.mode = mode
+        self.hedge_delay = hedge_delay
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._latencies = {name: deque(maxlen=window) for name in self.models}
+        self._calls = {name: 0 for name in self.models}
+        self._errors = {name: 0 for name in self.models}
+        # 连续出错次数，以及冷却期结束的时间（time.monotonic）
+        self._consecutive_errors = {name: 0 for name in self.models}
+        self._cooldown_until = {name: 0.0 for name in self.models}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(4, 2 * len(self.models)))
+
+    # ---------- 延迟统计 ----------
+
+    def p50(self, name):
+        with self._lock:
+            samples = list(self._latencies[name])
+        return statistics.median(samples) if samples else None
+
+    def cooling_down(self, name):
+        """模型最近出错、还在冷却期内"""
+        with self._lock:
+            return self._cooldown_until[name] > time.monotonic()
+
+    def ranked(self):
+        """按 p50 从快到慢排列的模型名；没有测量数据的排在最前面，冷却期内的排在最后"""
+
+        def key(name):
+            p50 = self.p50(name)
+            return (self.cooling_down(name), p50 is not None, p50 or 0.0)
+
+        return sorted(self.models, key=key)
+
+    def stats(self):
+        return {
+            name: {
+                "calls": self._calls[name],
+                "errors": self._errors[name],
+                "p50_ms": None if self.p50(name) is None else round(self.p50(name) * 1000, 1),
+                "cooling_down": self.cooling_down(name),
+            }
+            for name in self.models
+        }
+
+    def _record(self, name, start, error=None):
+        with self._lock:
+            self._calls[name] += 1
+            if error is None:
+                self._latencies[name].append(time.perf_counter() - start)
+                self._consecutive_errors[name] = 0
+                self._cooldown_until[name] = 0.0
+            else:
+                self._errors[name] += 1
+                self._consecutive_errors[name] += 1
+                penalty = min(self.cooldown * 2 ** (self._consecutive_errors[name] - 1), self.max_cooldown)
+                self._cooldown_until[name] = time.monotonic() + penalty
+
+    @staticmethod
+    def _tag(result, name):
+        if hasattr(result, "response_metadata"):
+            result.response_metadata["routed_to"] = name
+        return result
+
+    # ---------- 同步调用 ----------
+
+    def _call(self, name, input, config):
+        start = time.perf_counter()
+        try:
+            result = self.models[name].invoke(input, config)
+        except Exception as e:
+            self._record(name, start, e)
+            raise
+        self._record(name, start)
+        return self._tag(result, name)
+
+    def invoke(self, input, config=None, **kwargs):
+        if self.mode == "all":
+            futures = {name: self._executor.submit(self._call, name, input, config) for name in self.models}
+            return {name: future.exception() or future.result() for name, future in futures.items()}
+        if self.mode == "first":
+            order = list(self.models)
+            hedge_delay = 0.0
+        else:
+            order = self.ranked()
+            hedge_delay = self.hedge_delay
+
+        pending = {}
+        errors = []
+        remaining = iter(order)
+
+        def launch():
+            name = next(remaining, None)
+            if name is not None:
+                pending[self._executor.submit(self._call, name, input, config)] = name
+
+        launch()
+        while pending:
+            # 还有备选模型且开启了对冲时，最多等 hedge_delay 秒
+            can_hedge = hedge_delay is not None and len(pending) + len(errors) < len(order)
+            done, _ = wait(pending, timeout=hedge_delay if can_hedge else None, return_when=FIRST_COMPLETED)
+            if not done:
+                launch()  # 对冲：发给下一个模型
+                continue
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    return future.result()
+                except Exception as e:
+                    errors.append((name, e))
+                    launch()  # 降级：立即换下一个模型
+        raise AllModelsFailedError(errors)
+
+    # ---------- 异步调用 ----------
+
+    async def _acall(self, name, input, config):
+        start = time.perf_counter()
+        try:
+            result = await self.models[name].ainvoke(input, config)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._record(name, start, e)
+            raise
+        self._record(name, start)
+        return self._tag(result, name)
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        if self.mode == "all":
+            results = await asyncio.gather(
+                *(self._acall(name, input, config) for name in self.models), return_exceptions=True
+            )
+            return dict(zip(self.models, results))
+        if self.mode == "first":
+            order = list(self.models)
+            hedge_delay = 0.0
+        else:
+            order = self.ranked()
+            hedge_delay = self.hedge_delay
+
+        pending = {}
+        errors = []
+        remaining = iter(order)
+
+        def launch():
+            name = next(remaining, None)
+            if name is not None:
+                pending[asyncio.ensure_future(self._acall(name, input, config))] = name
+
+        launch()
+        try:
+            while pending:
+                can_hedge = hedge_delay is not None and len(pending) + len(errors) < len(order)
+                done, _ = await asyncio.wait(
+                    pending, timeout=hedge_delay if can_hedge else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    launch()
+                    continue
+                for task in done:
+                    name = pending.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    errors.append((name, task.exception()))
+                    launch()
+            raise AllModelsFailedError(errors)
+        finally:
+            # 取消输掉的请求
+            for task in pending:
+                task.cancel()
+
+
+# 用本地桩模型演示，不需要任何 API 密钥
+# 运行: python 1_chat_models/model_router.py
+if __name__ == "__main__":
+    import random
+
+    from stub_chat_model import StubChatModel
+
+    random.seed(0)
+    models = {
+        "openai": StubChatModel(model_name="openai", latency=0.30, jitter=0.05),
+        "anthropic": StubChatModel(model_name="anthropic", latency=0.15, jitter=0.05, failure_rate=0.2),
+        "google": StubChatModel(model_name="google", latency=0.60, jitter=0.20),
+    }
+    question = "What is the square root of 49?"
+
+    start = time.perf_counter()
+    for model in models.values():
+        try:
+            model.invoke(question)
+        except Exception:
+            pass
+    print(f"Sequential, one call per provider: {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    answers = ModelRouter(models, mode="all").invoke(question)
+    print(f"Fan-out (all): {time.perf_counter() - start:.2f}s -> {sorted(answers)}")
+
+    router = ModelRouter(models, hedge_delay=0.25)
+    latencies = []
+    for _ in range(30):
+        start = time.perf_counter()
+        result = router.invoke(question)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    print(f"Routed + hedged, 30 calls: p50 {latencies[15] * 1000:.0f}ms, max {latencies[-1] * 1000:.0f}ms")
+    print(f"Last answer from: {result.response_metadata['routed_to']}")
+    print(f"Ranking: {router.ranked()}")
+    print(f"Stats: {router.stats()}")
+
+    async def fan_out_first():
+        start = time.perf_counter()
+        result = await ModelRouter(models, mode="first").ainvoke(question)
+        print(f"Async fan-out (first): {time.perf_counter() - start:.2f}s from {result.response_metadata['routed_to']}")
+
+    asyncio.run(fan_out_first())
@@ -0,0 +1,154 @@
+# 本地 SQLite 聊天历史
+#
+# 仓库里原来只有两种保存对话的方式：
+# - 4_chat_model_conversation_with_user.py：进程内的列表，程序退出就没了
+# - 5_chat_model_save_message_history_firebase.py：Firestore，每个会话是一个文档，
+#   每次读取都要取回整个会话，每次写入都要重写整个消息数组
+#
+# SQLiteChatMessageHistory 把所有会话存在一个本地 SQLite 文件（WAL 模式）里：
+# - 每条消息一行，主键是 (session_id, seq)，按会话读取走主键索引，不扫描其他会话
+# - 追加：下一个 seq 缓存在对象里，每次追加就是一条 INSERT，与会话已有多少消息无关
+# - tail(k)：只读取最近 k 条，不需要取回整个会话
+# - compact(keep_last, summary)：删除旧消息（可以用一条摘要消息代替），
+#   SQLiteChatStore.vacuum() 再把释放的空间还给文件系统
+#
+# 用法：
+#   store = SQLiteChatStore("chat_history.sqlite3")
+#   history = store.history("user_123")
+#   history.add_user_message("hi")
+#   history.tail(8)
+
+import json
+import sqlite3
+import threading
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import SystemMessage, message_to_dict, messages_from_dict
+
+
+class SQLiteChatStore:
+    """一个 SQLite 文件，保存任意多个会话；同一个 store 的所有会话共享一个连接"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        # 每个会话只创建一个 history 对象，保证缓存的 seq 不会互相冲突
+        self._histories = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # WAL 模式下 NORMAL 足够保证数据库不损坏，断电时最多丢失最近的几次提交
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS messages (
+                session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                message TEXT NOT NULL,
+                PRIMARY KEY (session_id, seq)
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.commit()
+
+    def history(self, session_id):
+        history = self._histories.get(session_id)
+        if history is None:
+            history = self._histories[session_id] = SQLiteChatMessageHistory(session_id, self)
+        return history
+
+    def sessions(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT session_id FROM messages").fetchall()
+        return [session_id for (session_id,) in rows]
+
+    def vacuum(self):
+        """回收 compact / clear 释放的空间并合并 WAL"""
+        with self._lock:
+            # WAL 模式下 VACUUM 重写的页面先写进 WAL，之后的 checkpoint 才把它们写回主文件并截短主文件，
+            # 所以顺序必须是先 VACUUM 再 checkpoint，反过来主文件不会变小
+            self._conn.execute("VACUUM")
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SQLiteChatMessageHistory(BaseChatMessageHistory):
+    """单个会话的聊天历史"""
+
+    def __init__(self, session_id, store):
+        self.session_id = session_id
+        self.store = store
+        # 会话中最后一条消息的 seq + 1，之后的追加不再查询数据库
+        with store._lock:
+            (next_seq,) = store._conn.execute(
+                "SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        self._next_seq = next_seq
+
+    def _select(self, sql, params):
+        with self.store._lock:
+            rows = self.store._conn.execute(sql, params).fetchall()
+        return messages_from_dict([json.loads(message) for (message,) in rows])
+
+    @property
+    def messages(self):
+        return self._select(
+            "SELECT message FROM messages WHERE session_id = ? ORDER BY seq", (self.session_id,)
+        )
+
+    def tail(self, k):
+        """最近 k 条消息（按时间顺序）"""
+        rows = self._select(
+            "SELECT message FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+            (self.session_id, k),
+        )
+        return rows[::-1]
+
+    def __len__(self):
+        with self.store._lock:
+            (count,) = self.store._conn.execute(
+                "SELECT COUNT(*) FROM messages WHERE session_id = ?", (self.session_id,)
+            ).fetchone()
+        return count
+
+    def add_messages(self, messages):
+        # 多条消息在同一个事务里写入
+        with self.store._lock, self.store._conn:
+            self.store._conn.executemany(
+                "INSERT INTO messages (session_id, seq, message) VALUES (?, ?, ?)",
+                [
+                    (self.session_id, self._next_seq + i, json.dumps(message_to_dict(message)))
+                    for i, message in enumerate(messages)
+                ],
+            )
+            self._next_seq += len(messages)
+
+    def add_message(self, message):
+        self.add_messages([message])
+
+    def compact(self, keep_last, summary=None):
+        """
+        只保留最近 keep_last 条消息
+        如果提供 summary（例如 chat_history_manager.py 生成的滚动摘要），
+        会在保留的消息前面插入一条系统消息代替被删除的部分
+        返回删除的消息数
+        """
+        with self.store._lock, self.store._conn:
+            cutoff = self._next_seq - keep_last
+            deleted = self.store._conn.execute(
+                "DELETE FROM messages WHERE session_id = ? AND seq < ?", (self.session_id, cutoff)
+            ).rowcount
+            if summary and deleted:
+                message = SystemMessage(content=f"Summary of the earlier conversation:\n{summary}")
+                # seq 为 cutoff - 1 的消息刚被删除，这个位置正好放摘要
+                self.store._conn.execute(
+                    "INSERT INTO messages (session_id, seq, message) VALUES (?, ?, ?)",
+                    (self.session_id, cutoff - 1, json.dumps(message_to_dict(message))),
+                )
+        return deleted
+
+    def clear(self):
+        with self.store._lock, self.store._conn:
+            self.store._conn.execute("DELETE FROM messages WHERE session_id = ?", (self.session_id,))
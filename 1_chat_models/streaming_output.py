@@ -0,0 +1,92 @@
+# 流式输出：边生成边打印，并记录首 token 延迟和生成速度
+#
+# 4_chat_model_conversation_with_user.py 和 5_chat_model_save_message_history_firebase.py
+# 原来用 model.invoke(...)，要等整段回复生成完才打印，用户在这之前什么都看不到。
+# 改用 model.stream(...) 之后，模型每生成一小段（AIMessageChunk）就立即打印出来；
+# 所有片段相加得到完整的 AIMessageChunk，再转换成普通的 AIMessage 存入聊天历史。
+#
+# 每一轮记录的指标：
+# - ttft_seconds：从发出请求到收到第一个非空片段的时间（time to first token），
+#   这是交互式用户最能直接感受到的延迟
+# - output_tokens：回复的 token 数，优先使用模型返回的 usage_metadata，
+#   没有时用 tiktoken 计算
+# - tokens_per_sec：首 token 之后的生成速度
+# 模型的流一个片段都没有产生时，返回内容为空的 AIMessage（output_tokens 为 0）。
+
+import sys
+import time
+
+from langchain_core.messages import AIMessage, message_chunk_to_message
+
+from token_counter import count_tokens
+
+
+def _finish(full, start, first_token_at, model_name):
+    end = time.perf_counter()
+    # 流中没有任何片段时 full 为 None
+    message = AIMessage(content="") if full is None else message_chunk_to_message(full)
+    usage = getattr(message, "usage_metadata", None) or {}
+    # count_tokens 用 encode_ordinary：回复里出现 <|endoftext|> 之类的文本时按普通文本计数，不会报错
+    output_tokens = usage.get("output_tokens") or (count_tokens(message.content, model_name) if message.content else 0)
+    generation_seconds = end - (first_token_at or end)
+    stats = {
+        "ttft_seconds": round((first_token_at or end) - start, 4),
+        "total_seconds": round(end - start, 4),
+        "output_tokens": output_tokens,
+        "tokens_per_sec": round(output_tokens / generation_seconds, 1) if generation_seconds > 0 else None,
+    }
+    return message, stats
+
+
+def stream_reply(model, messages, prefix="AI: ", out=sys.stdout):
+    """
+    流式调用模型并实时打印
+    返回 (完整的 AIMessage, 本轮统计信息字典)
+    """
+    start = time.perf_counter()
+    first_token_at = None
+    full = None
+    out.write(prefix)
+    for chunk in model.stream(messages):
+        if first_token_at is None and chunk.content:
+            first_token_at = time.perf_counter()
+        out.write(chunk.content)
+        out.flush()
+        full = chunk if full is None else full + chunk
+    out.write("\n")
+    return _finish(full, start, first_token_at, getattr(model, "model_name", "gpt-3.5-turbo"))
+
+
+async def astream_reply(model, messages, prefix="AI: ", out=sys.stdout):
+    """stream_reply 的异步版本，基于 model.astream"""
+    start = time.perf_counter()
+    first_token_at = None
+    full = None
+    out.write(prefix)
+    async for chunk in model.astream(messages):
+        if first_token_at is None and chunk.content:
+            first_token_at = time.perf_counter()
+        out.write(chunk.content)
+        out.flush()
+        full = chunk if full is None else full + chunk
+    out.write("\n")
+    return _finish(full, start, first_token_at, getattr(model, "model_name", "gpt-3.5-turbo"))
+
+
+def format_stats(stats):
+    return (
+        f"[TTFT {stats['ttft_seconds'] * 1000:.0f}ms, "
+        f"{stats['output_tokens']} tokens, {stats['tokens_per_sec'] or 0:.1f} tokens/sec]"
+    )
+
+
+def summarize_turns(turn_stats):
+    """整个会话的汇总：TTFT 中位数和平均生成速度"""
+    if not turn_stats:
+        return "No turns recorded."
+    ttfts = sorted(s["ttft_seconds"] for s in turn_stats)
+    speeds = [s["tokens_per_sec"] for s in turn_stats if s["tokens_per_sec"]]
+    return (
+        f"{len(turn_stats)} turns, median TTFT {ttfts[len(ttfts) // 2] * 1000:.0f}ms, "
+        f"mean {sum(speeds) / len(speeds) if speeds else 0:.1f} tokens/sec"
+    )
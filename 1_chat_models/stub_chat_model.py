@@ -0,0 +1,47 @@
+# 本地桩模型：不访问任何 API 的聊天模型，用来测试路由、对冲和降级逻辑
+#
+# 可以设置固定回复、平均延迟、延迟抖动和失败概率，
+# 同步调用用 time.sleep、异步调用用 asyncio.sleep 模拟网络往返。
+
+import asyncio
+import random
+import time
+
+from langchain_core.language_models import SimpleChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+
+class StubModelError(RuntimeError):
+    """桩模型模拟的服务端错误"""
+
+
+class StubChatModel(SimpleChatModel):
+    """带可配置延迟和失败率的假聊天模型"""
+
+    reply: str = "7"
+    latency: float = 0.1
+    jitter: float = 0.0
+    failure_rate: float = 0.0
+    model_name: str = "stub"
+
+    @property
+    def _llm_type(self):
+        return "stub-chat-model"
+
+    def _delay(self):
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+    def _check_failure(self):
+        if random.random() < self.failure_rate:
+            raise StubModelError(f"{self.model_name} failed")
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self._delay())
+        self._check_failure()
+        return self.reply
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self._delay())
+        self._check_failure()
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.reply))])
@@ -0,0 +1,210 @@
+# Token 计数：进程级缓存的编码器、线程池批量编码、聊天消息列表的 token 数
+#
+# token_calculation.py 演示了最基本的用法：tiktoken.encoding_for_model 创建编码器，再编码一个字符串。
+# 直接照搬到语料库规模会有两个问题：
+# - encoding_for_model 每次调用都要查找并构建编码器，放在循环里会重复付出这部分开销
+# - 逐条 encode 是单线程的，几万个块要一个一个排队
+#
+# 这个模块的做法：
+# - get_encoder 按模型名缓存编码器，整个进程只创建一次（chat_history_manager.py、streaming_output.py、
+#   4_RAGs/context_packing.py 共用）
+# - count_tokens_batch 用 encode_ordinary_batch 一次编码一批文本：
+#   tiktoken 的编码在 Rust 里执行并释放 GIL，所以线程池里的多个线程可以真正并行
+# - count_message_tokens 按 OpenAI 聊天格式计算 LangChain 消息列表的 token 数：
+#   每条消息额外 3 个 token，角色名和内容都要编码，带 name 时再加 1，回复开头再加 3
+#   参考: https://github.com/openai/openai-cookbook/blob/main/examples/How_to_count_tokens_with_tiktoken.ipynb
+#
+# 命令行：统计 4_RAGs/documents 分割出的每个块的 token 分布，用来确定 chunk_size 和提示预算
+#   python 1_chat_models/token_counter.py
+#   python 1_chat_models/token_counter.py --chunk-size 2000 --chunk-overlap 200 --threads 8
+
+import argparse
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+import tiktoken
+from langchain_core.messages import AIMessage, ChatMessage, HumanMessage, SystemMessage, ToolMessage
+
+DEFAULT_MODEL = "gpt-3.5-turbo"
+
+# OpenAI 聊天格式中每条消息的额外开销，带 name 字段时的额外开销，以及回复开头的固定开销
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_NAME = 1
+TOKENS_PER_REPLY = 3
+
+DEFAULT_THREADS = min(8, os.cpu_count() or 1)
+
+_ROLES = {
+    SystemMessage: "system",
+    HumanMessage: "user",
+    AIMessage: "assistant",
+    ToolMessage: "tool",
+}
+
+
+@lru_cache(maxsize=None)
+def get_encoder(model=DEFAULT_MODEL):
+    """按模型名缓存 tiktoken 编码器；未知模型退回 cl100k_base"""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text, model=DEFAULT_MODEL):
+    return len(get_encoder(model).encode_ordinary(text))
+
+
+def count_tokens_batch(texts, model=DEFAULT_MODEL, num_threads=DEFAULT_THREADS):
+    """
+    批量计算 token 数，返回与 texts 顺序一致的列表
+    文本中的 <|endoftext|> 等特殊标记按普通文本计数，不会报错
+    """
+    texts = list(texts)
+    if not texts:
+        return []
+    return [len(tokens) for tokens in get_encoder(model).encode_ordinary_batch(texts, num_threads=num_threads)]
+
+
+def _message_role(message):
+    if isinstance(message, ChatMessage):
+        return message.role
+    for message_class, role in _ROLES.items():
+        if isinstance(message, message_class):
+            return role
+    return message.type
+
+
+def _message_text(message):
+    """消息内容可能是字符串，也可能是多模态的片段列表；只计算其中的文本"""
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return "".join(part if isinstance(part, str) else part.get("text", "") for part in content)
+
+
+def count_message_tokens(messages, model=DEFAULT_MODEL, num_threads=DEFAULT_THREADS):
+    """
+    计算聊天消息列表的 token 数
+
+    返回:
+        (每条消息的 token 数列表, 发送给模型的总 token 数（含回复开头的开销）)
+    """
+    messages = list(messages)
+    # 角色、内容和 name 放在一起批量编码，每条消息对应连续的 2 或 3 个位置
+    texts = []
+    for message in messages:
+        texts.append(_message_role(message))
+        texts.append(_message_text(message))
+        if message.name:
+            texts.append(message.name)
+    counts = iter(count_tokens_batch(texts, model, num_threads))
+
+    per_message = []
+    for message in messages:
+        tokens = TOKENS_PER_MESSAGE + next(counts) + next(counts)
+        if message.name:
+            tokens += TOKENS_PER_NAME + next(counts)
+        per_message.append(tokens)
+    return per_message, sum(per_message) + TOKENS_PER_REPLY
+
+
+def message_tokens(message, model=DEFAULT_MODEL):
+    """单条消息的 token 数（不含回复开头的开销）"""
+    encoder = get_encoder(model)
+    tokens = TOKENS_PER_MESSAGE + len(encoder.encode_ordinary(_message_role(message)))
+    tokens += len(encoder.encode_ordinary(_message_text(message)))
+    if message.name:
+        tokens += TOKENS_PER_NAME + len(encoder.encode_ordinary(message.name))
+    return tokens
+
+
+def distribution(counts):
+    """token 数的分布统计"""
+    values = np.asarray(counts)
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {
+        "count": int(values.size),
+        "total": int(values.sum()),
+        "min": int(values.min()),
+        "mean": round(float(values.mean()), 1),
+        "p50": int(p50),
+        "p90": int(p90),
+        "p99": int(p99),
+        "max": int(values.max()),
+    }
+
+
+def _print_histogram(counts, bins=10, width=40):
+    hist, edges = np.histogram(counts, bins=bins)
+    for n, low, high in zip(hist, edges, edges[1:]):
+        bar = "#" * int(round(width * n / max(hist.max(), 1)))
+        print(f"  {low:7.0f} - {high:7.0f} {n:7d} {bar}")
+
+
+def profile_corpus(documents_dir, model, chunk_size, chunk_overlap, num_threads, max_tokens):
+    """分割 documents_dir 下的所有文件（与 2a_rag_basics_metadata.py 的流式加载相同），打印每个块的 token 分布"""
+    # streaming_loader.py 在 4_RAGs 目录下
+    sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "4_RAGs"))
+    from streaming_loader import stream_directory
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor() as executor:
+        chunks = list(stream_directory(documents_dir, executor, chunk_size=chunk_size, chunk_overlap=chunk_overlap))
+    split_seconds = time.perf_counter() - start
+    if not chunks:
+        print(f"No chunks produced from {documents_dir}")
+        return
+
+    start = time.perf_counter()
+    counts = count_tokens_batch([chunk.page_content for chunk in chunks], model, num_threads)
+    count_seconds = time.perf_counter() - start
+
+    by_source = defaultdict(list)
+    for chunk, tokens in zip(chunks, counts):
+        by_source[chunk.metadata["source"]].append(tokens)
+
+    total_chars = sum(len(chunk.page_content) for chunk in chunks)
+    overall = distribution(counts)
+    print(f"Encoder: {get_encoder(model).name} ({model}), chunk_size={chunk_size}, chunk_overlap={chunk_overlap}")
+    print(f"Split {len(chunks)} chunks in {split_seconds:.2f}s; counted {overall['total']} tokens in "
+          f"{count_seconds:.3f}s (threads={num_threads}, {overall['total'] / max(count_seconds, 1e-9):,.0f} tokens/sec)")
+    print(f"Characters per token: {total_chars / max(overall['total'], 1):.2f}")
+
+    print(f"\n{'source':<40} {'chunks':>7} {'tokens':>9} {'mean':>7} {'p50':>6} {'p90':>6} {'p99':>6} {'max':>6}")
+    for source, values in sorted(by_source.items()):
+        stats = distribution(values)
+        print(f"{source[:40]:<40} {stats['count']:7d} {stats['total']:9d} {stats['mean']:7.1f} "
+              f"{stats['p50']:6d} {stats['p90']:6d} {stats['p99']:6d} {stats['max']:6d}")
+    print(f"{'(all)':<40} {overall['count']:7d} {overall['total']:9d} {overall['mean']:7.1f} "
+          f"{overall['p50']:6d} {overall['p90']:6d} {overall['p99']:6d} {overall['max']:6d}")
+
+    print("\nTokens per chunk:")
+    _print_histogram(counts)
+
+    if max_tokens:
+        over = [(chunk.metadata["source"], tokens) for chunk, tokens in zip(chunks, counts) if tokens > max_tokens]
+        print(f"\nChunks over {max_tokens} tokens: {len(over)}")
+        for source, tokens in over[:10]:
+            print(f"  {source}: {tokens} tokens")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile the token distribution of the RAG document chunks")
+    parser.add_argument(
+        "--documents",
+        default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "4_RAGs", "documents"),
+    )
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="model name used to pick the tiktoken encoding")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="same as 2a_rag_basics_metadata.py")
+    parser.add_argument("--chunk-overlap", type=int, default=0)
+    parser.add_argument("--threads", type=int, default=DEFAULT_THREADS, help="threads used for batch encoding")
+    parser.add_argument("--max-tokens", type=int, default=None, help="list chunks longer than this many tokens")
+    args = parser.parse_args()
+
+    profile_corpus(args.documents, args.model, args.chunk_size, args.chunk_overlap, args.threads, args.max_tokens)
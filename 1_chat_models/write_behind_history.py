@@ -0,0 +1,242 @@
+# 写回缓冲（write-behind）的聊天历史
+#
+# 5_chat_model_save_message_history_firebase.py 里每一轮对话都要：
+#   add_user_message  -> 一次阻塞的 Firestore 写入
+#   model.invoke(...) -> 模型调用
+#   add_ai_message    -> 又一次阻塞的 Firestore 写入
+# 而 FirestoreChatMessageHistory 每次写入都会把整个会话的消息数组重新 set 一遍，
+# 对话越长，每次写入的数据越多，模型调用前后都要等网络往返。
+#
+# WriteBehindChatMessageHistory 包装任意一个"远端"历史（Firestore，或测试用的内存实现）：
+# - 读：直接返回本地内存中的消息列表，不访问远端
+# - 写：先追加到本地列表，并写入本地 SQLite 缓冲文件（落盘即返回），
+#   后台线程每隔 flush_interval 秒、或积攒够 batch_size 条，再把这一批一次性写到远端
+# - 恢复：程序崩溃或被强制退出时，没有写到远端的消息还留在 SQLite 里，
+#   下次用同一个 session_id 启动时会重新加入本地列表并补写到远端
+#
+# 每条缓冲的消息都带有它在整个会话中的序号 seq。重启时远端已有 R 条消息，
+# seq < R 的缓冲记录说明已经写到远端、只是还没来得及删除，直接丢弃，不会重复写入。
+
+import json
+import sqlite3
+import threading
+import time
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import message_to_dict, messages_from_dict
+
+
+class WriteBehindChatMessageHistory(BaseChatMessageHistory):
+    """本地读写、后台批量写回远端的聊天历史"""
+
+    def __init__(self, remote, buffer_path, session_id, batch_size=20, flush_interval=1.0):
+        """
+        参数:
+            remote: 远端历史（例如 FirestoreChatMessageHistory），需要实现 messages 和 add_messages
+            buffer_path: 本地 SQLite 缓冲文件路径
+            session_id: 会话 ID，同一个缓冲文件可以被多个会话共用
+            batch_size: 积攒多少条消息后立即写回
+            flush_interval: 最长多少秒写回一次
+        """
+        self.remote = remote
+        self.session_id = session_id
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        # 统计信息
+        self.flushes = 0
+        self.flushed_messages = 0
+        self.recovered_messages = 0
+        self.last_error = None
+
+        self._lock = threading.Lock()
+        # 写回远端时持有，保证同一时刻只有一个批次在写，且批次按顺序写入
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+
+        self._conn = sqlite3.connect(buffer_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS pending_messages (
+                session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                message TEXT NOT NULL,
+                PRIMARY KEY (session_id, seq)
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.commit()
+
+        # 远端只在启动时读取一次
+        self._messages = list(remote.messages)
+        self._recover()
+
+        self._thread = threading.Thread(target=self._run, name=f"write-behind-{session_id}", daemon=True)
+        self._thread.start()
+
+    def _recover(self):
+        """把上次没写到远端的消息重新加入本地列表"""
+        remote_count = len(self._messages)
+        self._conn.execute(
+            "DELETE FROM pending_messages WHERE session_id = ? AND seq < ?",
+            (self.session_id, remote_count),
+        )
+        self._conn.commit()
+        rows = self._conn.execute(
+            "SELECT message FROM pending_messages WHERE session_id = ? ORDER BY seq",
+            (self.session_id,),
+        ).fetchall()
+        recovered = messages_from_dict([json.loads(message) for (message,) in rows])
+        self._messages.extend(recovered)
+        self.recovered_messages = len(recovered)
+        if recovered:
+            self._wake.set()
+
+    @property
+    def messages(self):
+        """从本地副本读取，不访问远端"""
+        with self._lock:
+            return list(self._messages)
+
+    @property
+    def pending_count(self):
+        """还没有写到远端的消息数"""
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM pending_messages WHERE session_id = ?", (self.session_id,)
+            ).fetchone()
+        return count
+
+    def add_messages(self, messages):
+        with self._lock:
+            start = len(self._messages)
+            self._conn.executemany(
+                "INSERT INTO pending_messages (session_id, seq, message) VALUES (?, ?, ?)",
+                [
+                    (self.session_id, start + i, json.dumps(message_to_dict(message)))
+                    for i, message in enumerate(messages)
+                ],
+            )
+            self._conn.commit()
+            self._messages.extend(messages)
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM pending_messages WHERE session_id = ?", (self.session_id,)
+            ).fetchone()
+        if count >= self.batch_size:
+            self._wake.set()
+
+    def add_message(self, message):
+        self.add_messages([message])
+
+    def flush(self):
+        """把当前缓冲的消息一次性写到远端；失败时消息留在缓冲里，下次重试"""
+        with self._flush_lock:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT seq, message FROM pending_messages WHERE session_id = ? ORDER BY seq",
+                    (self.session_id,),
+                ).fetchall()
+            if not rows:
+                return 0
+            batch = messages_from_dict([json.loads(message) for _, message in rows])
+            try:
+                _write_batch(self.remote, batch)
+            except Exception as e:
+                self.last_error = e
+                return 0
+            with self._lock:
+                self._conn.execute(
+                    "DELETE FROM pending_messages WHERE session_id = ? AND seq <= ?",
+                    (self.session_id, rows[-1][0]),
+                )
+                self._conn.commit()
+            self.last_error = None
+            self.flushes += 1
+            self.flushed_messages += len(batch)
+            return len(batch)
+
+    def _run(self):
+        while not self._closed.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def clear(self):
+        with self._flush_lock:
+            with self._lock:
+                self._conn.execute("DELETE FROM pending_messages WHERE session_id = ?", (self.session_id,))
+                self._conn.commit()
+                self._messages = []
+            self.remote.clear()
+
+    def close(self, timeout=10.0):
+        """停止后台线程，并在退出前把剩余消息写到远端"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._wake.set()
+        self._thread.join(timeout)
+        self.flush()
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _write_batch(remote, messages):
+    """
+    把一批消息写到远端
+    FirestoreChatMessageHistory 没有重写 add_messages，默认实现会逐条 add_message，
+    每条都把整个消息数组 set 一次；这里先追加到它的本地列表，再只 set 一次
+    """
+    if hasattr(remote, "_upsert_messages"):
+        remote.messages.extend(messages)
+        try:
+            remote._upsert_messages()
+        except Exception:
+            # 写入失败时撤销，下次重试不会重复追加
+            del remote.messages[-len(messages):]
+            raise
+    else:
+        remote.add_messages(messages)
+
+
+# 不连接 Firestore 的演示：用一个带网络延迟的内存历史模拟远端
+# 运行: python 1_chat_models/write_behind_history.py
+if __name__ == "__main__":
+    import os
+    import tempfile
+
+    from langchain_core.chat_history import InMemoryChatMessageHistory
+
+    class SlowRemoteHistory(InMemoryChatMessageHistory):
+        """每次写入模拟 50ms 的网络往返"""
+
+        writes: int = 0
+
+        def add_messages(self, messages):
+            time.sleep(0.05)
+            self.writes += 1
+            super().add_messages(messages)
+
+    buffer_path = os.path.join(tempfile.mkdtemp(), "chat_history_buffer.sqlite3")
+    remote = SlowRemoteHistory()
+
+    # 第一次运行：写入 40 条消息后"崩溃"（不调用 close，写回间隔和批量阈值都设得很大，后台线程来不及写回）
+    history = WriteBehindChatMessageHistory(remote, buffer_path, "demo", batch_size=1000, flush_interval=60)
+    start = time.perf_counter()
+    for i in range(20):
+        history.add_user_message(f"question {i}")
+        history.add_ai_message(f"answer {i}")
+    print(f"40 appends took {(time.perf_counter() - start) * 1000:.1f}ms (direct remote writes: ~{40 * 50}ms)")
+    print(f"After crash: remote has {len(remote.messages)} messages, {history.pending_count} buffered locally")
+
+    # 第二次运行：同一个缓冲文件，未写回的消息被恢复并写到远端
+    with WriteBehindChatMessageHistory(remote, buffer_path, "demo") as recovered:
+        print(f"Recovered {recovered.recovered_messages} messages, local copy has {len(recovered.messages)}")
+    print(f"After close: remote has {len(remote.messages)} messages in {remote.writes} write(s)")
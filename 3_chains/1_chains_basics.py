@@ -1,12 +1,22 @@
 # 导入必要的模块
+import os
+import sys
+
 from dotenv import load_dotenv  # 环境变量管理
 from langchain.prompts import ChatPromptTemplate  # 聊天提示模板
 from langchain.schema.output_parser import StrOutputParser  # 字符串输出解析器
 from langchain_openai import ChatOpenAI  # OpenAI聊天模型
 
+# llm_cache.py 在仓库根目录；追加在搜索路径末尾，不会遮盖本目录的模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_cache import install_llm_cache  # noqa: E402
+
 # 从.env文件加载环境变量（包含API密钥等配置）
 load_dotenv()
 
+# 全局 LLM 响应缓存：重复运行不再调用 API，LLM_CACHE=off 关闭（见仓库根目录的 llm_cache.py）
+install_llm_cache()
+
 # 创建ChatOpenAI模型实例
 # 使用gpt-3.5-turbo模型，这是OpenAI最新的多模态模型
 model = ChatOpenAI(model="gpt-3.5-turbo")
@@ -1,14 +1,26 @@
 # 这个代码展示了LangChain链的内部工作原理，通过手动构建可运行组件来理解LCEL（LangChain Expression Language）的底层实现机制。
 
 # 导入必要的模块
+import os
+import sys
+
 from dotenv import load_dotenv  # 环境变量管理
 from langchain.prompts import ChatPromptTemplate  # 聊天提示模板
 from langchain.schema.runnable import RunnableLambda, RunnableSequence  # 可运行组件和序列
 from langchain_openai import ChatOpenAI  # OpenAI聊天模型
 
+from prompt_registry import prompts  # 预编译的提示模板注册表
+
+# llm_cache.py 在仓库根目录；追加在搜索路径末尾，不会遮盖本目录的模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_cache import install_llm_cache  # noqa: E402
+
 # 从.env文件加载环境变量（包含API密钥等配置）
 load_dotenv()
 
+# 全局 LLM 响应缓存：重复运行不再调用 API，LLM_CACHE=off 关闭（见仓库根目录的 llm_cache.py）
+install_llm_cache()
+
 # 创建ChatOpenAI模型实例
 model = ChatOpenAI(model="gpt-3.5-turbo")
 
@@ -27,7 +39,10 @@ prompt_template = ChatPromptTemplate.from_messages(
 # 步骤1: 格式化提示
 # RunnableLambda将普通函数包装为可运行组件
 # format_prompt方法将字典参数转换为格式化的提示对象
-format_prompt = RunnableLambda(lambda x: prompt_template.format_prompt(**x))
+# 这里使用预编译的版本：模板在注册时解析一次，不含变量的消息预先创建好，
+# 每次调用只做字符串拼接，输出与 prompt_template.format_prompt(**x) 完全相同
+compiled_prompt = prompts.register("animal_facts", prompt_template)
+format_prompt = RunnableLambda(lambda x: compiled_prompt.format_prompt(**x))
 
 # 步骤2: 调用模型
 # 将格式化的提示转换为消息列表，然后调用模型
@@ -1,21 +1,33 @@
 # 代码整体流程说明
 # 1. 加载环境变量，初始化 OpenAI 聊天模型。
 # 2. 定义了三个提示模板：电影摘要、剧情分析、角色分析。
-# 3. 分别用函数封装剧情和角色分析的提示模板。
+# 3. 剧情和角色分析的提示模板在启动时编译一次（见 prompt_registry.py），分析函数只负责格式化。
 # 4. 定义 combine_verdicts 函数用于合并剧情和角色分析的结果。
 # 5. 用 LCEL 构建了一个多分支并行链：先生成摘要，然后并行分析剧情和角色，最后合并输出。
 # 6. 运行链，输入电影名，输出完整的影评分析。
 
+import os
+import sys
+
 from dotenv import load_dotenv
 from langchain.prompts import ChatPromptTemplate
 from langchain.schema.runnable import RunnableLambda, RunnableParallel
 from langchain.schema.output_parser import StrOutputParser
 from langchain_openai import ChatOpenAI
 
+from prompt_registry import prompts
+
+# llm_cache.py 在仓库根目录；追加在搜索路径末尾，不会遮盖本目录的模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_cache import install_llm_cache  # noqa: E402
+
 # 加载 .env 文件中的环境变量（如 OpenAI API 密钥等）
 # 注意：.env 文件要放在项目根目录，并且要包含 OPENAI_API_KEY，否则后续模型调用会失败
 load_dotenv()
 
+# 全局 LLM 响应缓存：重复运行不再调用 API，LLM_CACHE=off 关闭（见仓库根目录的 llm_cache.py）
+install_llm_cache()
+
 # 创建一个 OpenAI 聊天模型实例，指定使用 gpt-3.5-turbo
 # 注意：模型名称要和你的 API 权限相符，否则会报错
 model = ChatOpenAI(model="gpt-3.5-turbo")
@@ -29,28 +41,32 @@ summary_template = ChatPromptTemplate.from_messages(
     ]
 )
 
+# 剧情分析和角色分析的提示模板
+# 原来在 analyze_plot / analyze_characters 里每次调用都新建一次 ChatPromptTemplate；
+# 现在启动时注册并编译一次，之后每次调用只做字符串拼接（对比见 benchmark_prompt_formatting.py）
+prompts.register(
+    "plot_analysis",
+    [
+        ("system", "You are a movie critic."),  # 系统角色设定
+        ("human", "Analyze the plot: {plot}. What are its strengths and weaknesses?"),  # 用户输入，分析剧情优缺点
+    ],
+)
+prompts.register(
+    "character_analysis",
+    [
+        ("system", "You are a movie critic."),  # 系统角色设定
+        ("human", "Analyze the characters: {characters}. What are their strengths and weaknesses?"),  # 用户输入，分析角色优缺点
+    ],
+)
+
 # 定义剧情分析步骤
 def analyze_plot(plot):
-    # 这里每次调用都会新建一个剧情分析的提示模板
-    plot_template = ChatPromptTemplate.from_messages(
-        [
-            ("system", "You are a movie critic."),  # 系统角色设定
-            ("human", "Analyze the plot: {plot}. What are its strengths and weaknesses?"),  # 用户输入，分析剧情优缺点
-        ]
-    )
-    # format_prompt 返回的是格式化后的 PromptValue 对象
-    return plot_template.format_prompt(plot=plot)  # 返回格式化后的提示
+    # format_prompt 返回的是格式化后的 PromptValue 对象，与 ChatPromptTemplate.format_prompt 相同
+    return prompts["plot_analysis"].format_prompt(plot=plot)  # 返回格式化后的提示
 
 # 定义角色分析步骤
 def analyze_characters(characters):
-    # 这里每次调用都会新建一个角色分析的提示模板
-    character_template = ChatPromptTemplate.from_messages(
-        [
-            ("system", "You are a movie critic."),  # 系统角色设定
-            ("human", "Analyze the characters: {characters}. What are their strengths and weaknesses?"),  # 用户输入，分析角色优缺点
-        ]
-    )
-    return character_template.format_prompt(characters=characters)  # 返回格式化后的提示
+    return prompts["character_analysis"].format_prompt(characters=characters)  # 返回格式化后的提示
 
 # 合并剧情和角色分析，输出最终评价
 def combine_verdicts(plot_analysis, character_analysis):
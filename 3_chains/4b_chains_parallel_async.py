@@ -0,0 +1,146 @@
+# 与 4_chains_parallel.py 的对比分析
+#
+# | 方面 | 4_chains_parallel.py | 4b_chains_parallel_async.py |
+# |------|----------------------|-----------------------------|
+# | **执行方式** | chain.invoke，同步 | 所有模型调用都用 model.ainvoke / astream，在同一个事件循环上并发 |
+# | **分支并发** | RunnableParallel 把两个分支放进线程池 | asyncio.gather 同时等待两个分支，不占用线程 |
+# | **分支开始时间** | 完整摘要生成完之后 | 默认同左；--stream-summary 时摘要流式生成到一定长度就提前开始 |
+# | **耗时报告** | 无 | 打印每一步的开始/结束时间，找出关键路径 |
+#
+# 关键区别总结：
+# - 4 的总延迟 = 摘要 + 最慢的分支；这里默认模式的总延迟相同，但可以清楚地看到每一步花了多久
+# - --stream-summary 用部分摘要提前启动分支：总延迟变成 max(完整摘要, 部分摘要 + 最慢的分支)，
+#   代价是分支看到的摘要不完整，分析质量可能略有下降
+#
+# 使用方法：
+#   python 3_chains/4b_chains_parallel_async.py --movie Inception
+#   python 3_chains/4b_chains_parallel_async.py --movie Inception --stream-summary --partial-chars 300
+#
+# 这个脚本用来测量延迟，所以不安装 LLM 响应缓存（见 llm_cache.py），每次都真正调用模型。
+
+import argparse
+import asyncio
+import time
+
+from dotenv import load_dotenv
+from langchain_openai import ChatOpenAI
+
+from prompt_registry import prompts
+
+# 加载 .env 文件中的环境变量（如 OpenAI API 密钥等）
+load_dotenv()
+
+model = ChatOpenAI(model="gpt-3.5-turbo")
+
+# 三个提示模板与 4_chains_parallel.py 相同，启动时编译一次（见 prompt_registry.py）
+prompts.register(
+    "movie_summary",
+    [
+        ("system", "You are a movie critic."),
+        ("human", "Provide a brief summary of the movie {movie_name}."),
+    ],
+)
+prompts.register(
+    "plot_analysis",
+    [
+        ("system", "You are a movie critic."),
+        ("human", "Analyze the plot: {plot}. What are its strengths and weaknesses?"),
+    ],
+)
+prompts.register(
+    "character_analysis",
+    [
+        ("system", "You are a movie critic."),
+        ("human", "Analyze the characters: {characters}. What are their strengths and weaknesses?"),
+    ],
+)
+
+
+def combine_verdicts(plot_analysis, character_analysis):
+    return f"Plot Analysis:\n{plot_analysis}\n\nCharacter Analysis:\n{character_analysis}"
+
+
+class Timeline:
+    """记录每一步相对于开始时刻的起止时间"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.steps = {}
+
+    def now(self):
+        return time.perf_counter() - self.start
+
+    def begin(self, name):
+        self.steps[name] = [self.now(), None]
+
+    def end(self, name):
+        self.steps[name][1] = self.now()
+
+    def report(self):
+        total = max(end for _, end in self.steps.values())
+        print(f"\n{'step':<20} {'start':>8} {'end':>8} {'duration':>9}")
+        for name, (start, end) in sorted(self.steps.items(), key=lambda item: item[1][0]):
+            marker = "  <- critical path" if end == total else ""
+            print(f"{name:<20} {start * 1000:7.0f}ms {end * 1000:7.0f}ms {(end - start) * 1000:8.0f}ms{marker}")
+        # 部分摘要是完整摘要的一段，不重复计算
+        sequential = sum(end - start for name, (start, end) in self.steps.items() if "(partial)" not in name)
+        print(f"Total: {total * 1000:.0f}ms (all steps back to back: {sequential * 1000:.0f}ms)")
+
+
+async def run_branch(timeline, name, prompt_name, **variables):
+    """一个分析分支：格式化提示，用 ainvoke 在事件循环上调用模型"""
+    timeline.begin(name)
+    result = await model.ainvoke(prompts[prompt_name].format_messages(**variables))
+    timeline.end(name)
+    return result.content
+
+
+async def run_branches(timeline, summary):
+    # 两个分支同时在事件循环上等待模型返回
+    return await asyncio.gather(
+        run_branch(timeline, "plot", "plot_analysis", plot=summary),
+        run_branch(timeline, "characters", "character_analysis", characters=summary),
+    )
+
+
+async def review(movie_name, stream_summary=False, partial_chars=400):
+    timeline = Timeline()
+    summary_messages = prompts["movie_summary"].format_messages(movie_name=movie_name)
+
+    if not stream_summary:
+        # 默认模式：等完整摘要生成后再启动两个分支
+        timeline.begin("summary")
+        summary = (await model.ainvoke(summary_messages)).content
+        timeline.end("summary")
+        plot_analysis, character_analysis = await run_branches(timeline, summary)
+    else:
+        # 流式模式：摘要生成到 partial_chars 个字符时就用已有的部分启动分支，摘要剩下的部分继续生成
+        timeline.begin("summary")
+        chunks = []
+        branches = None
+        async for chunk in model.astream(summary_messages):
+            chunks.append(chunk.content)
+            if branches is None and sum(len(c) for c in chunks) >= partial_chars:
+                partial = "".join(chunks)
+                timeline.steps["summary (partial)"] = [timeline.steps["summary"][0], timeline.now()]
+                branches = asyncio.create_task(run_branches(timeline, partial))
+        timeline.end("summary")
+        summary = "".join(chunks)
+        if branches is None:
+            # 摘要比 partial_chars 还短，只能等它结束
+            branches = asyncio.create_task(run_branches(timeline, summary))
+        plot_analysis, character_analysis = await branches
+
+    print(f"Summary:\n{summary}\n")
+    print(combine_verdicts(plot_analysis, character_analysis))
+    timeline.report()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Async movie review chain with per-branch timings")
+    parser.add_argument("--movie", default="Inception")
+    parser.add_argument("--stream-summary", action="store_true", help="start the branches on a partial summary")
+    parser.add_argument("--partial-chars", type=int, default=400, help="summary length that starts the branches")
+    args = parser.parse_args()
+
+    asyncio.run(review(args.movie, args.stream_summary, args.partial_chars))
@@ -1,13 +1,25 @@
+import os
+import sys
+
 from dotenv import load_dotenv
 from langchain.prompts import ChatPromptTemplate
 from langchain.schema.output_parser import StrOutputParser
 from langchain.schema.runnable import RunnableBranch, RunnableLambda
 from langchain_openai import ChatOpenAI
 
+from feedback_classifier import FeedbackClassifier  # 本地分类器快速通道（见 feedback_classifier.py）
+
+# llm_cache.py 在仓库根目录；追加在搜索路径末尾，不会遮盖本目录的模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_cache import install_llm_cache  # noqa: E402
+
 # 加载 .env 文件中的环境变量（如 OpenAI API 密钥等）
 # 注意：.env 文件要放在项目根目录，并且要包含 OPENAI_API_KEY，否则后续模型调用会失败
 load_dotenv()
 
+# 全局 LLM 响应缓存：重复运行不再调用 API，LLM_CACHE=off 关闭（见仓库根目录的 llm_cache.py）
+install_llm_cache()
+
 # 创建一个 OpenAI 聊天模型实例，指定使用 gpt-3.5-turbo
 # 注意：模型名称要和你的 API 权限相符，否则会报错
 model = ChatOpenAI(model="gpt-3.5-turbo")
@@ -46,22 +58,24 @@ classification_template = ChatPromptTemplate.from_messages(
     [
         ("system", "You are a helpful assistant."),
         # ("human", "Classify the sentiment of this feedback as positive, negative, neutral, or escalate: {feedback}."),  # 分类反馈情感
-        ("human", "Classify the sentiment of this feedback as exactly one of: positive, negative, neutral, escalate. Only output the label."),  # 分类反馈情感
+        ("human", "Classify the sentiment of this feedback as exactly one of: positive, negative, neutral, escalate. Only output the label.\n\nFeedback: {feedback}"),  # 分类反馈情感
     ]
 )
 
 # 定义处理反馈的条件分支
+# 输入是分类阶段输出的 {"feedback": ..., "label": ...}：按规范化后的标签精确匹配分支，
+# 回复模板拿到的是原始反馈（原来拿到的是分类结果字符串）
 branches = RunnableBranch(
     (
-        lambda x: "positive" in x,
+        lambda x: x["label"] == "positive",
         RunnableLambda(lambda x: print("[DEBUG] 走了 positive 分支") or x) | positive_feedback_template | model | StrOutputParser()
     ),
     (
-        lambda x: "negative" in x,
+        lambda x: x["label"] == "negative",
         RunnableLambda(lambda x: print("[DEBUG] 走了 negative 分支") or x) | negative_feedback_template | model | StrOutputParser()
     ),
     (
-        lambda x: "neutral" in x,
+        lambda x: x["label"] == "neutral",
         RunnableLambda(lambda x: print("[DEBUG] 走了 neutral 分支") or x) | neutral_feedback_template | model | StrOutputParser()
     ),
     RunnableLambda(lambda x: print("[DEBUG] 走了 escalate 分支") or x) | escalate_feedback_template | model | StrOutputParser()
@@ -70,9 +84,16 @@ branches = RunnableBranch(
 # 创建情感分类链
 classification_chain = classification_template | model | StrOutputParser()
 
+# 分类阶段：先查缓存、再用本地朴素贝叶斯分类器，置信度不够时才调用上面的分类链
+# LLM 给出的标签会写入 feedback_labels.jsonl，作为本地分类器的训练数据，积累得越多，调用 LLM 的次数越少
+classifier = FeedbackClassifier(
+    classification_chain,
+    label_log_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "feedback_labels.jsonl"),
+)
+
 # 组合分类和响应生成为一个完整的链
 # 先分类，再根据分类结果走不同分支
-chain = classification_chain | branches
+chain = classifier | branches
 
 # 用一个示例评论运行链
 # 示例：
@@ -90,3 +111,4 @@ result = chain.invoke({"feedback": review})
 
 # 输出最终结果
 print(result)
+print(f"[DEBUG] 分类来源统计: {classifier.stats()}")
@@ -0,0 +1,229 @@
+# 与 5_chains_conditional.py 的对比分析
+#
+# | 方面 | 5_chains_conditional.py | 5b_chains_conditional_batch.py |
+# |------|-------------------------|--------------------------------|
+# | **输入** | 写死的一条 review | JSONL / CSV 文件中的大量反馈，边读边处理 |
+# | **分类** | 每条反馈单独分类 | 每批反馈一起分类：缓存和本地分类器先处理，剩下的用一次 abatch 交给 LLM |
+# | **回复生成** | RunnableBranch 逐条选择分支 | 按标签分组，每个回复模板一次 abatch，各分组同时进行，共用一个并发上限 |
+# | **并发** | 无 | 同时进行的模型请求总数不超过 --concurrency |
+# | **背压** | 无 | 读取和处理之间是有界队列，处理跟不上时读取会暂停，内存占用不随文件大小增长 |
+# | **输出** | 打印到终端 | 每批处理完就写入 JSONL，并打印吞吐量和各分支数量 |
+#
+# 关键区别总结：
+# - 吞吐量取决于并发上限和本地分类器的命中率，而不是反馈数 × 两次串行 LLM 往返
+# - --fake 使用本地假模型，不需要 API 密钥，可以端到端地测试整个流程
+#
+# 使用方法：
+#   python 3_chains/5b_chains_conditional_batch.py --input 3_chains/feedback/sample_feedback.jsonl
+#   python 3_chains/5b_chains_conditional_batch.py --fake --batch-size 16 --concurrency 8
+# 输入格式：
+#   JSONL：每行 {"id": "...", "feedback": "..."}（id 可省略，默认使用行号）
+#   CSV：表头包含 feedback 列，可选 id 列
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+from dotenv import load_dotenv
+from langchain_core.language_models import SimpleChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+from langchain_openai import ChatOpenAI
+
+from feedback_classifier import LABELS, FeedbackClassifier
+from prompt_registry import prompts
+
+# llm_cache.py 在仓库根目录；追加在搜索路径末尾，不会遮盖本目录的模块
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from llm_cache import install_llm_cache  # noqa: E402  LLM 响应缓存，在 run() 中按需安装
+
+# 加载 .env 文件中的环境变量（如 OpenAI API 密钥等）
+load_dotenv()
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+# 提示模板与 5_chains_conditional.py 相同，启动时编译一次（见 prompt_registry.py）
+prompts.register(
+    "classification",
+    [
+        ("system", "You are a helpful assistant."),
+        ("human", "Classify the sentiment of this feedback as exactly one of: positive, negative, neutral, escalate. Only output the label.\n\nFeedback: {feedback}"),
+    ],
+)
+RESPONSE_TEMPLATES = {
+    "positive": "Generate a thank you note for this positive feedback: {feedback}.",
+    "negative": "Generate a response addressing this negative feedback: {feedback}.",
+    "neutral": "Generate a request for more details for this neutral feedback: {feedback}.",
+    "escalate": "Generate a message to escalate this feedback to a human agent: {feedback}.",
+}
+for label, template in RESPONSE_TEMPLATES.items():
+    prompts.register(f"{label}_response", [("system", "You are a helpful assistant."), ("human", template)])
+
+
+class FakeFeedbackModel(SimpleChatModel):
+    """
+    端到端测试用的假模型：分类请求按关键词返回标签，其他请求返回固定格式的回复
+    latency 模拟每次调用的网络往返
+    """
+
+    latency: float = 0.05
+
+    @property
+    def _llm_type(self):
+        return "fake-feedback-model"
+
+    def _reply(self, messages):
+        text = messages[-1].content
+        if text.startswith("Classify"):
+            feedback = text.split("Feedback:", 1)[1].lower()
+            if any(word in feedback for word in ("refund", "manager", "charged", "locked", "human")):
+                return "escalate"
+            if any(word in feedback for word in ("excellent", "love", "great", "fantastic", "comfortable")):
+                return "positive"
+            if any(word in feedback for word in ("terrible", "broke", "damaged", "crash", "poor", "waste")):
+                return "negative"
+            return "neutral"
+        return f"[fake reply] {text[:80]}"
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        return self._reply(messages)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._reply(messages)))])
+
+
+def read_feedback(path):
+    """逐条读取 JSONL 或 CSV 格式的反馈，产出 {"id", "feedback"}"""
+    if path.endswith(".csv"):
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            for i, row in enumerate(csv.DictReader(f), 1):
+                yield {"id": str(row.get("id") or i), "feedback": row["feedback"]}
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            for i, line in enumerate(f, 1):
+                if line.strip():
+                    record = json.loads(line)
+                    yield {"id": str(record.get("id", i)), "feedback": record["feedback"]}
+
+
+async def produce(path, queue, batch_size):
+    """按批读取反馈放入有界队列；队列满时 put 会等待，这就是背压"""
+    batch = []
+    for item in read_feedback(path):
+        batch.append(item)
+        if len(batch) >= batch_size:
+            await queue.put(batch)
+            batch = []
+    if batch:
+        await queue.put(batch)
+    await queue.put(None)  # 结束标记
+
+
+async def process_batch(batch, classifier, response_chains, concurrency):
+    """分类一批反馈，再按标签分组批量生成回复"""
+    labels = await classifier.aclassify_batch([item["feedback"] for item in batch], max_concurrency=concurrency)
+    groups = {}
+    for item, (label, source) in zip(batch, labels):
+        if label is None:
+            # 分类失败：只记录这一条的错误，不生成回复
+            item["label"], item["label_source"], item["error"] = None, "error", f"classification failed: {source}"
+            continue
+        item["label"], item["label_source"] = label, source
+        groups.setdefault(label, []).append(item)
+
+    # 每个分组（回复模板）一次 abatch，各分组同时进行；
+    # 每次模型调用都要先拿到同一个信号量，无论分成几组，同时进行的请求都不超过 concurrency
+    semaphore = asyncio.Semaphore(concurrency)
+
+    def bounded(chain):
+        async def call(input, config):
+            async with semaphore:
+                return await chain.ainvoke(input, config)
+
+        return RunnableLambda(call)
+
+    labels = list(groups)
+    results = await asyncio.gather(
+        *(
+            bounded(response_chains[label]).abatch(
+                [{"feedback": item["feedback"]} for item in groups[label]],
+                config={"max_concurrency": concurrency},
+                return_exceptions=True,
+            )
+            for label in labels
+        )
+    )
+    for label, responses in zip(labels, results):
+        for item, response in zip(groups[label], responses):
+            # return_exceptions=True：某一条失败只记录在这一条上，不影响同组的其他反馈
+            if isinstance(response, Exception):
+                item["error"] = str(response)
+            else:
+                item["response"] = response
+    return batch
+
+
+async def run(args):
+    if args.fake:
+        # 假模型：不安装响应缓存、不写标签日志，每次运行都从零开始，结果可重复
+        model = FakeFeedbackModel(latency=args.fake_latency)
+        label_log_path = None
+    else:
+        # 重复运行同一个文件时直接复用上次的回复；测量真实吞吐量时设置 LLM_CACHE=off
+        install_llm_cache()
+        model = ChatOpenAI(model="gpt-3.5-turbo")
+        label_log_path = os.path.join(current_dir, "feedback_labels.jsonl")
+    classifier = FeedbackClassifier(prompts["classification"] | model | StrOutputParser(), label_log_path)
+    response_chains = {label: prompts[f"{label}_response"] | model | StrOutputParser() for label in LABELS}
+
+    queue = asyncio.Queue(maxsize=args.queue_size)
+    producer = asyncio.create_task(produce(args.input, queue, args.batch_size))
+
+    start = time.perf_counter()
+    processed = 0
+    failed = 0
+    branch_counts = Counter()
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as out:
+        while (batch := await queue.get()) is not None:
+            for item in await process_batch(batch, classifier, response_chains, args.concurrency):
+                out.write(json.dumps(item, ensure_ascii=False) + "\n")
+                if item["label"] is not None:
+                    branch_counts[item["label"]] += 1
+                failed += "error" in item
+            out.flush()  # 每批处理完立即落盘
+            processed += len(batch)
+            elapsed = time.perf_counter() - start
+            print(f"[{processed}] {processed / elapsed:.1f} items/sec, queued batches: {queue.qsize()}")
+    await producer
+
+    elapsed = time.perf_counter() - start
+    print(f"\nProcessed {processed} items in {elapsed:.2f}s ({processed / elapsed:.1f} items/sec), {failed} failed")
+    print(f"Per branch: {dict(branch_counts)}")
+    print(f"Label sources: {classifier.stats()}")
+    print(f"Output: {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Process a feed of customer feedback in batches")
+    parser.add_argument("--input", default=os.path.join(current_dir, "feedback", "sample_feedback.jsonl"))
+    parser.add_argument("--output", help="JSONL output file (default: <input>.results.jsonl)")
+    parser.add_argument("--batch-size", type=int, default=32, help="feedback items classified together")
+    parser.add_argument("--concurrency", type=int, default=8, help="max concurrent model calls")
+    parser.add_argument("--queue-size", type=int, default=4, help="batches read ahead before reading pauses")
+    parser.add_argument("--fake", action="store_true", help="use a local fake chat model instead of OpenAI")
+    parser.add_argument("--fake-latency", type=float, default=0.05, help="simulated latency of the fake model")
+    args = parser.parse_args()
+    if args.output is None:
+        args.output = os.path.splitext(args.input)[0] + ".results.jsonl"
+
+    asyncio.run(run(args))
@@ -0,0 +1,73 @@
+# 提示格式化微基准测试：每次新建模板 vs 复用模板 vs 预编译模板（prompt_registry.py）
+#
+# 只测量提示格式化本身，不调用模型，不产生任何费用：
+# 1. 4_chains_parallel.py 原来的写法：每次调用都 ChatPromptTemplate.from_messages(...) 再 format_prompt
+# 2. 2_chains_inner_workings.py 的写法：模板只创建一次，每次 format_prompt(**x)
+# 3. CompiledPrompt.format_prompt：模板解析一次，格式化只做字符串拼接
+#
+# 使用方法：
+#   python 3_chains/benchmark_prompt_formatting.py --calls 50000
+
+import argparse
+import time
+
+from langchain_core.prompts import ChatPromptTemplate
+
+from prompt_registry import CompiledPrompt
+
+MESSAGES = [
+    ("system", "You are a movie critic."),
+    ("human", "Analyze the plot: {plot}. What are its strengths and weaknesses?"),
+]
+PLOT = "A thief who steals corporate secrets through dream-sharing technology is given the inverse task."
+
+
+def rebuild_every_call(plot):
+    return ChatPromptTemplate.from_messages(MESSAGES).format_prompt(plot=plot)
+
+
+template = ChatPromptTemplate.from_messages(MESSAGES)
+
+
+def reuse_template(plot):
+    return template.format_prompt(plot=plot)
+
+
+compiled = CompiledPrompt(MESSAGES)
+
+
+def compiled_template(plot):
+    return compiled.format_prompt(plot=plot)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark prompt formatting")
+    parser.add_argument("--calls", type=int, default=50_000)
+    args = parser.parse_args()
+
+    # 三种写法的输出必须完全相同
+    expected = rebuild_every_call(PLOT).to_messages()
+    assert reuse_template(PLOT).to_messages() == expected
+    assert compiled_template(PLOT).to_messages() == expected
+
+    baseline = None
+    for name, format_fn in [
+        ("from_messages every call", rebuild_every_call),
+        ("reuse ChatPromptTemplate", reuse_template),
+        ("CompiledPrompt", compiled_template),
+    ]:
+        # 每次用不同的输入，避免任何层面的结果复用
+        inputs = [f"{PLOT} #{i}" for i in range(args.calls)]
+        start = time.perf_counter()
+        for plot in inputs:
+            format_fn(plot)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        print(
+            f"{name:<26} {elapsed / args.calls * 1e6:8.1f} us/call  "
+            f"{args.calls / elapsed:10.0f} calls/sec  {baseline / elapsed:5.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
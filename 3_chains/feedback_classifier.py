@@ -0,0 +1,190 @@
+# 反馈分类的本地快速通道：先用本地分类器，置信度不够才调用 LLM
+#
+# 5_chains_conditional.py 原来为了得到一个标签（positive / negative / neutral / escalate）
+# 每条反馈都要完整调用一次 LLM，再在 RunnableBranch 里用 "positive" in x 这样的子串判断分支。
+#
+# FeedbackClassifier 按顺序尝试三种方式：
+# 1. 缓存：按反馈文本的 sha256 查找之前得到的标签，相同的反馈直接返回
+# 2. 本地模型：多项式朴素贝叶斯（单词 + 相邻两词），用之前 LLM 给出的标签训练；
+#    训练样本足够（min_examples）且最高类别的后验概率不低于 threshold 时直接采用
+# 3. LLM：以上都不行时调用分类链，得到的标签立即加入本地模型的训练数据
+#
+# 所有标签都追加写入 JSONL 日志（label_log_path），下次启动时重新加载为缓存和训练数据。
+# 只有来源为 llm 的标签用于训练，避免本地模型用自己的预测训练自己。
+
+import hashlib
+import json
+import math
+import os
+import re
+from collections import Counter
+
+from langchain_core.runnables import Runnable
+
+LABELS = ("positive", "negative", "neutral", "escalate")
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+def normalize_label(text):
+    """把 LLM 的输出转换成四个标签之一；无法识别时按 escalate 处理"""
+    text = text.strip().lower()
+    for label in LABELS:
+        if label in text:
+            return label
+    return "escalate"
+
+
+def feedback_hash(feedback):
+    """忽略大小写和多余空白后的 sha256"""
+    return hashlib.sha256(" ".join(feedback.lower().split()).encode("utf-8")).hexdigest()
+
+
+def features(feedback):
+    """单词和相邻两词（"not good" 这样的否定短语靠它来区分）"""
+    words = _WORD_RE.findall(feedback.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class NaiveBayesClassifier:
+    """可以逐条增量训练的多项式朴素贝叶斯"""
+
+    def __init__(self, labels=LABELS, alpha=1.0):
+        self.labels = labels
+        self.alpha = alpha
+        self.doc_counts = Counter()
+        self.feature_counts = {label: Counter() for label in labels}
+        self.feature_totals = Counter()
+        self.vocabulary = set()
+
+    @property
+    def examples(self):
+        return sum(self.doc_counts.values())
+
+    def learn(self, feedback, label):
+        feats = features(feedback)
+        self.doc_counts[label] += 1
+        self.feature_counts[label].update(feats)
+        self.feature_totals[label] += len(feats)
+        self.vocabulary.update(feats)
+
+    def predict(self, feedback):
+        """返回 (标签, 后验概率)"""
+        feats = [f for f in features(feedback) if f in self.vocabulary]
+        total_docs = self.examples
+        vocab_size = len(self.vocabulary)
+        scores = {}
+        for label in self.labels:
+            score = math.log((self.doc_counts[label] + self.alpha) / (total_docs + self.alpha * len(self.labels)))
+            denominator = self.feature_totals[label] + self.alpha * vocab_size
+            counts = self.feature_counts[label]
+            for f in feats:
+                score += math.log((counts[f] + self.alpha) / denominator)
+            scores[label] = score
+        # 对数分数做 softmax 得到后验概率
+        best = max(scores, key=scores.get)
+        normalizer = sum(math.exp(s - scores[best]) for s in scores.values())
+        return best, 1.0 / normalizer
+
+
+class FeedbackClassifier(Runnable):
+    """
+    输入 {"feedback": ...}，输出 {"feedback": ..., "label": ..., "label_source": ...}
+    label_source 是 cache / local / llm 之一
+    """
+
+    def __init__(self, llm_chain, label_log_path=None, threshold=0.9, min_examples=20):
+        """
+        参数:
+            llm_chain: 输入 {"feedback": ...}、输出标签文本的分类链
+            label_log_path: 标签日志（JSONL），None 表示不持久化
+            threshold: 本地模型的后验概率不低于这个值才直接采用
+            min_examples: 本地模型至少要有这么多条 LLM 标注的样本才启用
+        """
+        self.llm_chain = llm_chain
+        self.label_log_path = label_log_path
+        self.threshold = threshold
+        self.min_examples = min_examples
+        self.model = NaiveBayesClassifier()
+        self.cache = {}
+        self.counts = Counter()
+
+        if label_log_path and os.path.exists(label_log_path):
+            with open(label_log_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._remember(json.loads(line), write=False)
+
+    def _remember(self, record, write=True):
+        self.cache[record["hash"]] = record["label"]
+        if record["source"] == "llm":
+            self.model.learn(record["feedback"], record["label"])
+        if write and self.label_log_path:
+            with open(self.label_log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def predict_local(self, feedback):
+        """只用缓存和本地模型；没有把握时返回 None"""
+        key = feedback_hash(feedback)
+        if key in self.cache:
+            return self.cache[key], "cache"
+        if self.model.examples >= self.min_examples:
+            label, confidence = self.model.predict(feedback)
+            if confidence >= self.threshold:
+                self._remember({"hash": key, "feedback": feedback, "label": label, "source": "local"})
+                return label, "local"
+        return None
+
+    def record_llm_label(self, feedback, llm_output):
+        """记录 LLM 的分类结果（同时用于训练本地模型），返回规范化后的标签"""
+        label = normalize_label(llm_output)
+        self._remember({"hash": feedback_hash(feedback), "feedback": feedback, "label": label, "source": "llm"})
+        return label
+
+    def classify(self, feedback):
+        result = self.predict_local(feedback)
+        if result is None:
+            result = self.record_llm_label(feedback, self.llm_chain.invoke({"feedback": feedback})), "llm"
+        self.counts[result[1]] += 1
+        return result
+
+    async def aclassify_batch(self, feedbacks, max_concurrency=8):
+        """
+        批量分类：先逐条尝试缓存和本地模型，剩下的去重后用一次 llm_chain.abatch 分类
+        返回与 feedbacks 顺序一致的 [(标签, 来源)]
+        LLM 分类失败的反馈返回 (None, 异常)，只影响这一条，不会中断整批
+        """
+        results = [self.predict_local(feedback) for feedback in feedbacks]
+        pending = {}
+        for i, result in enumerate(results):
+            if result is None:
+                pending.setdefault(feedback_hash(feedbacks[i]), []).append(i)
+        if pending:
+            first = [indexes[0] for indexes in pending.values()]
+            outputs = await self.llm_chain.abatch(
+                [{"feedback": feedbacks[i]} for i in first],
+                config={"max_concurrency": max_concurrency},
+                return_exceptions=True,
+            )
+            for indexes, output in zip(pending.values(), outputs):
+                if isinstance(output, Exception):
+                    for i in indexes:
+                        results[i] = (None, output)
+                    continue
+                label = self.record_llm_label(feedbacks[indexes[0]], output)
+                results[indexes[0]] = (label, "llm")
+                # 同一批中重复的反馈只调用一次 LLM
+                for i in indexes[1:]:
+                    results[i] = (label, "cache")
+        for label, source in results:
+            self.counts[source if label is not None else "error"] += 1
+        return results
+
+    def invoke(self, input, config=None, **kwargs):
+        label, source = self.classify(input["feedback"])
+        return {**input, "label": label, "label_source": source}
+
+    def stats(self):
+        stats = {source: self.counts[source] for source in ("cache", "local", "llm", "error")}
+        stats["training_examples"] = self.model.examples
+        return stats
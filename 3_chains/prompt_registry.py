@@ -0,0 +1,137 @@
+# 预编译的提示模板注册表
+#
+# 4_chains_parallel.py 的 analyze_plot / analyze_characters 每次调用都重新执行
+# ChatPromptTemplate.from_messages(...)：解析角色、创建模板对象、校验变量；
+# 2_chains_inner_workings.py 的 format_prompt(**x) 虽然模板只创建一次，
+# 每次格式化仍要重新校验输入、解析 f-string，再逐个创建消息对象。
+# 请求量大时，这部分纯 Python 开销会累积起来。
+#
+# CompiledPrompt 在注册时一次性完成所有解析工作：
+# - 每条消息的 f-string 被拆成 "字面文本 + 变量名" 片段，格式化时只需拼接字符串
+# - 不含变量的消息（例如 "You are a movie critic."）直接预先创建好消息对象，每次复用
+# - 输出与 ChatPromptTemplate.format_prompt 相同的 ChatPromptValue，可以直接替换
+#
+# 用法：
+#   from prompt_registry import prompts
+#   prompts.register("plot_analysis", [("system", "..."), ("human", "Analyze the plot: {plot}.")])
+#   prompts["plot_analysis"].format_prompt(plot=plot)
+
+from string import Formatter
+
+from langchain_core.messages import AIMessage, BaseMessage, ChatMessage, HumanMessage, SystemMessage
+from langchain_core.prompt_values import ChatPromptValue
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.prompts.chat import (
+    AIMessagePromptTemplate,
+    ChatMessagePromptTemplate,
+    HumanMessagePromptTemplate,
+    SystemMessagePromptTemplate,
+)
+from langchain_core.runnables import Runnable
+
+_MESSAGE_CLASSES = {
+    SystemMessagePromptTemplate: SystemMessage,
+    HumanMessagePromptTemplate: HumanMessage,
+    AIMessagePromptTemplate: AIMessage,
+}
+
+
+def compile_template(template):
+    """把 f-string 模板拆成 [(字面文本, 变量名或 None)]，只支持 {name} 形式的变量"""
+    parts = []
+    for literal, field, spec, conversion in Formatter().parse(template):
+        if field is not None and (spec or conversion or not field.isidentifier()):
+            raise ValueError(f"Unsupported placeholder in prompt template: {{{field}}}")
+        parts.append((literal, field))
+    return parts
+
+
+class CompiledPrompt(Runnable):
+    """解析一次、反复格式化的聊天提示模板"""
+
+    def __init__(self, template):
+        """template: ChatPromptTemplate，或 ChatPromptTemplate.from_messages 接受的消息列表"""
+        if not isinstance(template, ChatPromptTemplate):
+            template = ChatPromptTemplate.from_messages(template)
+        self.template = template
+        self.input_variables = sorted(template.input_variables)
+        # 每个元素要么是预先创建好的消息对象，要么是 (消息类, 角色, 模板片段)
+        self._skeleton = []
+        for message in template.messages:
+            if isinstance(message, BaseMessage):
+                self._skeleton.append(message)
+                continue
+            if type(message) in _MESSAGE_CLASSES:
+                message_class, role = _MESSAGE_CLASSES[type(message)], None
+            elif isinstance(message, ChatMessagePromptTemplate):
+                message_class, role = ChatMessage, message.role
+            else:
+                raise ValueError(f"Unsupported message template: {type(message).__name__}")
+            if message.prompt.template_format != "f-string":
+                raise ValueError("Only f-string prompt templates can be compiled")
+            parts = compile_template(message.prompt.template)
+            if all(field is None for _, field in parts):
+                text = "".join(literal for literal, _ in parts)
+                self._skeleton.append(message_class(content=text) if role is None else ChatMessage(role=role, content=text))
+            else:
+                self._skeleton.append((message_class, role, parts))
+
+    def format_messages(self, **kwargs):
+        messages = []
+        for item in self._skeleton:
+            if isinstance(item, BaseMessage):
+                messages.append(item)
+                continue
+            message_class, role, parts = item
+            try:
+                text = "".join(
+                    literal if field is None else literal + str(kwargs[field]) for literal, field in parts
+                )
+            except KeyError as e:
+                raise KeyError(f"Input to prompt is missing variable {e}. Expected: {self.input_variables}") from None
+            messages.append(message_class(content=text) if role is None else ChatMessage(role=role, content=text))
+        return messages
+
+    def format_prompt(self, **kwargs):
+        """与 ChatPromptTemplate.format_prompt 相同，返回 ChatPromptValue"""
+        return ChatPromptValue(messages=self.format_messages(**kwargs))
+
+    def invoke(self, input, config=None, **kwargs):
+        # 和 ChatPromptTemplate 一样可以放在链的开头：chain = compiled | model
+        return self.format_prompt(**input)
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        # 格式化只是字符串拼接，直接在事件循环上完成，不需要放进线程池
+        return self.format_prompt(**input)
+
+
+class PromptRegistry:
+    """按名字保存编译好的提示模板"""
+
+    def __init__(self):
+        self._prompts = {}
+
+    def register(self, name, template):
+        """
+        编译并注册模板
+        同名、同内容的模板已经注册过时直接返回已有的编译结果；同名但内容不同时抛出 ValueError，
+        避免静默地继续使用旧模板
+        """
+        compiled = CompiledPrompt(template)
+        existing = self._prompts.get(name)
+        if existing is None:
+            self._prompts[name] = compiled
+            return compiled
+        if existing.template != compiled.template:
+            raise ValueError(f"Prompt {name!r} is already registered with a different template")
+        return existing
+
+    def __getitem__(self, name):
+        return self._prompts[name]
+
+    def __contains__(self, name):
+        return name in self._prompts
+
+
+# 进程内共享的默认注册表
+prompts = PromptRegistry()
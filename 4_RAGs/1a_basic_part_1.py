@@ -2,10 +2,14 @@
 # 检索增强生成是一种结合了检索和生成的技术，它使用检索到的相关文档来增强生成模型的回答
 
 import os
+import uuid
 from langchain.text_splitter import CharacterTextSplitter
 from langchain_community.document_loaders import TextLoader
 from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
+
+from batch_embedding import add_documents_in_batches
+from bm25_index import BM25Index
+from embedding_backends import get_embeddings, record_index_backend
 
 # 定义包含文本文件的目录和持久化目录
 # 使用 os.path.dirname(os.path.abspath(__file__)) 获取当前脚本所在目录
@@ -14,6 +18,8 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 file_path = os.path.join(current_dir, "documents", "lord_of_the_rings.txt")
 # 构建向量数据库的持久化存储目录
 persistent_directory = os.path.join(current_dir, "db", "chroma_db")
+# 与向量数据库并列的 BM25 倒排索引（供 1b 的混合检索使用）
+bm25_index_path = os.path.join(current_dir, "db", "bm25_index.json")
 
 # 检查 Chroma 向量存储是否已经存在
 # 如果不存在，则初始化向量存储
@@ -36,6 +42,8 @@ if not os.path.exists(persistent_directory):
     # CharacterTextSplitter 按字符数分割文档
     # chunk_size=1000：每个块最多1000个字符
     # chunk_overlap=50：相邻块之间重叠50个字符，保持上下文连贯性
+    # 如果想按 token 预算分割、并且只在句子/段落边界处切开，可以换成 sentence_token_splitter.py：
+    #   text_splitter = SentenceTokenSplitter(chunk_size=256, chunk_overlap=32)
     text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=50) 
     docs = text_splitter.split_documents(documents)
 
@@ -46,25 +54,44 @@ if not os.path.exists(persistent_directory):
 
     # 创建嵌入向量
     print("\n--- Creating embeddings ---")
-    # OpenAIEmbeddings 用于将文本转换为向量表示
-    # model="text-embedding-3-small"：使用 OpenAI 的 text-embedding-3-small 模型
-    embeddings = OpenAIEmbeddings(
-        model="text-embedding-3-small"
-    )  # 如果需要，可以更新为其他有效的嵌入模型
+    # 默认使用 OpenAI 的 text-embedding-3-small 模型将文本转换为向量表示
+    # 设置 EMBEDDING_BACKEND=hashing 可以改用本地哈希嵌入，不访问网络（见 embedding_backends.py）
+    # CachedEmbeddings 把向量缓存到本地 SQLite（见 embedding_cache.py）
+    # 重建时内容没有变化的块直接从缓存读取，不再调用嵌入 API
+    embeddings = get_embeddings(cache_path=os.path.join(current_dir, "db", "embedding_cache.sqlite3"))
     print("\n--- Finished creating embeddings ---")
 
     # 创建向量存储并自动持久化
     print("\n--- Creating vector store ---")
-    # Chroma.from_documents 将文档、嵌入向量和持久化目录作为参数
-    # 自动将文档转换为向量并存储到指定的持久化目录
-    db = Chroma.from_documents(
-        docs, embeddings, persist_directory=persistent_directory)
+    # 原来的写法是 Chroma.from_documents(docs, embeddings, persist_directory=...)，
+    # 所有块在一次同步调用中按顺序嵌入，无法控制批大小和并发数
+    # 这里先创建空的向量存储，再用 add_documents_in_batches 分批并发嵌入、批量写入：
+    # batch_size=128：每次嵌入 API 调用包含 128 个块
+    # max_workers=4：最多 4 个批次同时请求，遇到限流（429）时自动退避重试
+    db = Chroma(persist_directory=persistent_directory, embedding_function=embeddings)
+    ids = [str(uuid.uuid4()) for _ in docs]
+    result = add_documents_in_batches(db, docs, ids, batch_size=128, max_workers=4)
+    print(f"Embedded {result['chunks']} chunks at {result['chunks_per_second']:.1f} chunks/sec")
+    # 记录构建索引使用的嵌入后端，1b 加载时用不同的后端会被拒绝
+    record_index_backend(persistent_directory, embeddings)
     print("\n--- Finished creating vector store ---")
 
+    # 用相同的块 ID 构建 BM25 倒排索引并保存
+    bm25 = BM25Index()
+    bm25.add(ids, docs)
+    bm25.save(bm25_index_path)
+    print(f"BM25 index: {len(bm25)} chunks, {len(bm25.postings)} terms")
+
 else:
     # 如果向量存储已经存在，则不需要重新初始化
     print("Vector store already exists. No need to initialize.")
 
+    # 旧的向量数据库可能还没有 BM25 索引，从向量库中已有的块补建（不需要调用嵌入 API）
+    if not os.path.exists(bm25_index_path):
+        print("BM25 index does not exist. Building it from the vector store...")
+        db = Chroma(persist_directory=persistent_directory)
+        BM25Index.from_vector_store(db).save(bm25_index_path)
+
 # 要问的问题
 # Who is the Ring-bearer?
 # Where does Gandalf meet Frodo?
\ No newline at end of file
@@ -19,7 +19,9 @@
 
 import os
 from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
+
+from bm25_index import hybrid_or_vector_retriever
+from embedding_backends import check_index_backend, get_embeddings
 
 # Define the persistent directory
 # 与 part_1 相同，使用相同的路径来加载已创建的向量数据库
@@ -28,7 +30,11 @@ persistent_directory = os.path.join(current_dir, "db", "chroma_db")
 
 # Define the embedding model
 # 注意：必须使用与 part_1 中相同的嵌入模型，否则向量不兼容
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+# 嵌入后端由 EMBEDDING_BACKEND 选择（见 embedding_backends.py），
+# check_index_backend 确认它与 part_1 构建索引时记录的后端一致，不一致时直接报错
+# CachedEmbeddings 会缓存问题的向量，同一个问题第二次运行时不再调用嵌入 API
+embeddings = get_embeddings(cache_path=os.path.join(current_dir, "db", "embedding_cache.sqlite3"))
+check_index_backend(persistent_directory, embeddings)
 
 # Load the existing vector store with the embedding function
 # 这里不需要重新创建数据库，而是加载 part_1 中已经构建好的数据库
@@ -41,10 +47,21 @@ query = "Where does Gandalf meet Frodo?"
 
 # Retrieve relevant documents based on the query
 # 创建检索器，用于从向量数据库中查找最相关的文档
-retriever = db.as_retriever(
+vector_retriever = db.as_retriever(
     search_type="similarity_score_threshold",  # 使用相似度分数阈值搜索
     search_kwargs={"k": 3, "score_threshold": 0.5},  # 检索参数
 )
+# 与入库阶段构建的 BM25 倒排索引组合成混合检索器（见 bm25_index.py）
+# 词法检索和向量检索的结果用倒数排名融合（RRF）合并，专有名词查询更准确
+# mode="hybrid"：每个查询都同时做词法检索和向量检索，两路各取 fetch_k 个候选再融合；
+# 改成 mode="auto" 时，只含少量关键词的查询（如 "Gandalf"）会跳过嵌入 API，只做词法检索
+# score_threshold 只过滤向量检索的结果，BM25 分数与相关性分数不在同一个尺度上（见 bm25_index.py）
+retriever = hybrid_or_vector_retriever(
+    vector_retriever,
+    os.path.join(current_dir, "db", "bm25_index.json"),
+    k=3,
+    mode="hybrid",
+)
 # 执行检索，获取相关文档
 relevant_docs = retriever.invoke(query)
 
@@ -17,13 +17,21 @@
 # 2. 元数据管理：为每个文档添加来源信息，便于后续追踪和过滤
 # 3. 更好的目录结构：分离文档目录和数据库目录，便于管理
 # 4. 自动文件发现：自动发现目录中的文本文件，无需手动指定
+# 5. 增量索引：按文件和块的内容哈希只更新变化的部分（见 incremental_ingest.py）
+# 6. 流式加载：文件按段在进程池中分割，块边产生边嵌入，内存占用不随语料库增长（见 streaming_loader.py）
+# 7. BM25 倒排索引：与向量库同步增量维护，供混合检索使用（见 bm25_index.py）
 
 import os
+from concurrent.futures import ProcessPoolExecutor
 
-from langchain.text_splitter import CharacterTextSplitter
-from langchain_community.document_loaders import TextLoader
 from langchain_community.vectorstores import Chroma
-from langchain_openai import OpenAIEmbeddings
+
+from batch_embedding import add_documents_in_batches
+from bm25_index import BM25Index
+from embedding_backends import check_index_backend, get_embeddings, record_index_backend
+from incremental_ingest import sync_directory
+from semantic_cache import SemanticAnswerCache
+from streaming_loader import stream_file_chunks
 
 # 定义包含文本文件的目录和持久化目录
 # 与之前的代码相比，这里支持处理多个文件，并添加了元数据管理
@@ -31,15 +39,26 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 books_dir = os.path.join(current_dir, "documents")  # 文档目录，包含多个文本文件
 db_dir = os.path.join(current_dir, "db")  # 数据库目录
 persistent_directory = os.path.join(db_dir, "chroma_db_with_metadata")  # 带元数据的向量数据库路径
+bm25_index_path = os.path.join(db_dir, "bm25_index_with_metadata.json")  # 与向量库并列的 BM25 倒排索引
+semantic_cache_path = os.path.join(db_dir, "semantic_cache.sqlite3")  # 3 使用的语义答案缓存
+
+# 文档分割参数
+# 注意：这里 chunk_overlap=0，与之前代码不同
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 0
 
-# 打印目录信息，便于调试和确认路径
-print(f"Books directory: {books_dir}")
-print(f"Persistent directory: {persistent_directory}")
+# 嵌入批大小和并发数
+# 新增/修改的块会按 EMBED_BATCH_SIZE 切批，最多 EMBED_MAX_WORKERS 个批次同时请求嵌入 API，
+# 遇到限流时自动退避，然后批量写入 Chroma（见 batch_embedding.py）
+EMBED_BATCH_SIZE = 128
+EMBED_MAX_WORKERS = 4
 
-# 检查 Chroma 向量存储是否已经存在
-# 如果不存在，则初始化向量存储
-if not os.path.exists(persistent_directory):
-    print("Persistent directory does not exist. Initializing vector store...")
+# 执行代码放在 __main__ 保护之下：分割工作在进程池中进行，
+# 子进程导入本模块时不能重复执行同步流程
+if __name__ == "__main__":
+    # 打印目录信息，便于调试和确认路径
+    print(f"Books directory: {books_dir}")
+    print(f"Persistent directory: {persistent_directory}")
 
     # 确保文档目录存在
     # 如果目录不存在，抛出 FileNotFoundError 异常
@@ -48,47 +67,81 @@ if not os.path.exists(persistent_directory):
             f"The directory {books_dir} does not exist. Please check the path."
         )
 
-    # 列出目录中的所有文本文件
-    # 使用列表推导式筛选出所有 .txt 结尾的文件
-    book_files = [f for f in os.listdir(books_dir) if f.endswith(".txt")]
-
-    # 从每个文件中读取文本内容，并存储带有元数据的文档
-    documents = []
-    for book_file in book_files:
-        file_path = os.path.join(books_dir, book_file)
-        loader = TextLoader(file_path)  # 为每个文件创建加载器
-        book_docs = loader.load()  # 加载文档
-        for doc in book_docs:
-            # 为每个文档添加元数据，标明其来源文件
-            # 这是与之前代码的主要区别：添加了元数据管理
-            doc.metadata = {"source": book_file}
-            documents.append(doc)
-
-    # 将文档分割成块
-    # 注意：这里 chunk_overlap=0，与之前代码不同
-    text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
-    docs = text_splitter.split_documents(documents)
-
-    # 显示分割后文档的信息
-    print("\n--- Document Chunks Information ---")
-    print(f"Number of document chunks: {len(docs)}")
-
     # 创建嵌入向量
-    print("\n--- Creating embeddings ---")
-    # 使用与之前相同的嵌入模型
-    embeddings = OpenAIEmbeddings(
-        model="text-embedding-3-small"
-    )  # 如果需要，可以更新为其他有效的嵌入模型
-    print("\n--- Finished creating embeddings ---")
-
-    # 创建向量存储并持久化
-    print("\n--- Creating and persisting vector store ---")
-    # 将文档、嵌入向量和持久化目录作为参数创建向量数据库
-    # 元数据会自动保存到数据库中
-    db = Chroma.from_documents(
-        docs, embeddings, persist_directory=persistent_directory)
-    print("\n--- Finished creating and persisting vector store ---")
-
-else:
-    # 如果向量存储已经存在，则不需要重新初始化
-    print("Vector store already exists. No need to initialize.")
+    # 使用与之前相同的嵌入模型，或者设置 EMBEDDING_BACKEND=hashing 改用本地哈希嵌入（见 embedding_backends.py）
+    # CachedEmbeddings 把向量缓存到本地 SQLite（见 embedding_cache.py）
+    # 即使删掉数据库完全重建，内容没有变化的块也不会再调用嵌入 API
+    embeddings = get_embeddings(cache_path=os.path.join(db_dir, "embedding_cache.sqlite3"))
+    # 增量同步会把新块写进已有的索引：已有索引是用另一个嵌入后端构建的就拒绝同步，
+    # 否则新旧向量混在一起，检索结果毫无意义
+    check_index_backend(persistent_directory, embeddings)
+
+    # 打开（或新建）持久化的向量存储
+    # 与之前"目录存在就跳过"不同，这里每次运行都做一次增量同步：
+    # - 没有变化的文件直接跳过，不会产生任何嵌入 API 调用
+    # - 新增/修改的文件只向量化内容发生变化的块
+    # - 已删除的文件，其对应的块会从数据库中移除
+    # 如果想完全重建，删除 persistent_directory 目录即可
+    new_index = not os.path.exists(persistent_directory)
+    if new_index:
+        print("Persistent directory does not exist. Initializing vector store...")
+    db = Chroma(persist_directory=persistent_directory, embedding_function=embeddings)
+
+    # 加载 BM25 倒排索引；索引文件不存在时（第一次运行或旧数据库），从向量库中已有的块补建
+    if os.path.exists(bm25_index_path):
+        bm25 = BM25Index.load(bm25_index_path)
+    else:
+        bm25 = BM25Index.from_vector_store(db)
+
+    # 写入和删除时同时更新向量库和 BM25 索引，保证两者包含的块完全一致
+    def add_documents(db, docs, ids):
+        result = add_documents_in_batches(
+            db, docs, ids, batch_size=EMBED_BATCH_SIZE, max_workers=EMBED_MAX_WORKERS,
+        )
+        bm25.add(ids, docs)
+        print(f"Embedded {result['chunks']} chunks at {result['chunks_per_second']:.1f} chunks/sec")
+
+    # 3_rag_one_off_question.py 的语义答案缓存：块被替换或删除时，引用它们的回答随之失效
+    answer_cache = SemanticAnswerCache(semantic_cache_path) if os.path.exists(semantic_cache_path) else None
+    if answer_cache is not None and new_index:
+        # 新建的索引可能使用了不同的嵌入后端，旧的问题向量不再可比
+        answer_cache.clear()
+
+    def delete_documents(db, ids):
+        db.delete(ids=ids)
+        bm25.remove(ids)
+        if answer_cache is not None:
+            answer_cache.invalidate_chunk_ids(ids)
+
+    # 所有文件共用一个进程池
+    # 原来的做法是 TextLoader(...).load() 把每本书读进一个 documents 列表再整体分割，
+    # 现在每个文件按段流式读取、在进程池中分割，每个块都带有 {"source": 文件名} 元数据，
+    # 产生一批就交给嵌入阶段一批，内存中只保留少量在途的段和块
+    with ProcessPoolExecutor() as executor:
+
+        def load_and_split(file_path, book_file):
+            return stream_file_chunks(
+                file_path, book_file, executor,
+                chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP,
+            )
+
+        print("\n--- Syncing documents into vector store ---")
+        stats = sync_directory(
+            db, books_dir, persistent_directory, load_and_split,
+            add_documents=add_documents, delete_documents=delete_documents,
+        )
+
+    # 持久化 BM25 索引，并记录构建索引使用的嵌入后端（2b、3、4 加载时检查）
+    bm25.save(bm25_index_path)
+    record_index_backend(persistent_directory, embeddings)
+
+    # 显示同步统计信息
+    print("\n--- Incremental Ingest Information ---")
+    print(f"Files unchanged: {stats['files_unchanged']}")
+    print(f"Files added or changed: {stats['files_changed']}")
+    print(f"Files removed: {stats['files_removed']}")
+    print(f"Chunks embedded and added: {stats['chunks_added']}")
+    print(f"Chunks deleted: {stats['chunks_deleted']}")
+    print(f"Chunks kept without re-embedding: {stats['chunks_kept']}")
+    print(f"BM25 index: {len(bm25)} chunks, {len(bm25.postings)} terms")
+    print("\n--- Finished syncing vector store ---")
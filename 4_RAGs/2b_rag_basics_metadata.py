@@ -4,7 +4,7 @@
 # |------|-----------------------------------|------------------------------------------|
 # | **主要目的** | 构建带元数据的向量数据库 | 从向量数据库中检索并生成回答 |
 # | **文件处理** | 加载、分割、向量化多个文档 | 不处理文件，只加载已存在的数据库 |
-# | **元数据使用** | 创建元数据 | 读取和显示元数据 |
+# | **元数据使用** | 创建元数据 | 读取和显示元数据，并按来源过滤检索 |
 # | **输出结果** | 向量数据库文件 | 检索结果 + 生成的回答 |
 # | **模型使用** | OpenAIEmbeddings (向量化) | OpenAIEmbeddings + ChatOpenAI (检索+生成) |
 # | **检索参数** | 无 | k=3, score_threshold=0.2 |
@@ -21,10 +21,12 @@
 import os
 
 from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
 from langchain_openai import ChatOpenAI
 from langchain.schema import HumanMessage, SystemMessage
 
+from bm25_index import hybrid_or_vector_retriever
+from embedding_backends import check_index_backend, get_embeddings
+
 # 定义持久化目录
 # 与 2a 使用相同的路径，确保能加载到正确的向量数据库
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -33,7 +35,10 @@ persistent_directory = os.path.join(db_dir, "chroma_db_with_metadata")
 
 # 定义嵌入模型
 # 必须使用与 2a 中相同的嵌入模型，确保向量兼容性
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+# 嵌入后端由 EMBEDDING_BACKEND 选择，check_index_backend 确认它与 2a 构建索引时记录的后端一致
+# CachedEmbeddings 会缓存问题的向量，同一个问题第二次运行时不再调用嵌入 API
+embeddings = get_embeddings(cache_path=os.path.join(db_dir, "embedding_cache.sqlite3"))
+check_index_backend(persistent_directory, embeddings)
 
 # 加载已存在的向量存储，并指定嵌入函数
 # 这里加载的是 2a 中构建的带元数据的向量数据库
@@ -46,10 +51,27 @@ query = "Where is Dracula's castle located?"
 
 # 基于查询检索相关文档
 # 创建检索器，配置搜索参数
-retriever = db.as_retriever(
+vector_retriever = db.as_retriever(
     search_type="similarity_score_threshold",  # 使用相似度分数阈值搜索
     search_kwargs={"k": 3, "score_threshold": 0.2},  # 检索参数：最多3个文档，相似度阈值0.2
 )
+# 与入库阶段构建的 BM25 倒排索引组合成混合检索器（见 bm25_index.py）
+# 词法检索和向量检索的结果用倒数排名融合（RRF）合并，专有名词查询更准确
+# mode="hybrid"：每个查询都同时做词法检索和向量检索，两路各取 fetch_k 个候选再融合；
+# 改成 mode="auto" 时，只含少量关键词的查询（如 "Gandalf"）会跳过嵌入 API，只做词法检索
+# score_threshold 只过滤向量检索的结果，BM25 分数与相关性分数不在同一个尺度上（见 bm25_index.py）
+# route_sources=True：检索之前先按问题中有区分度的词（如 "dracula"）判断涉及哪几本书（见 source_router.py），
+# 向量检索和 BM25 检索都只在这些书的块中进行；判断不出来时照常检索所有书
+# 也可以手动限定来源：retriever.invoke(query, filter={"source": "Dracula.txt"})
+retriever = hybrid_or_vector_retriever(
+    vector_retriever,
+    os.path.join(db_dir, "bm25_index_with_metadata.json"),
+    k=3,
+    mode="hybrid",
+    route_sources=True,
+)
+if getattr(retriever, "router", None) is not None:
+    print(f"Routed sources: {retriever.router.route(query) or 'all'}")
 # 执行检索，获取相关文档
 relevant_docs = retriever.invoke(query)
 
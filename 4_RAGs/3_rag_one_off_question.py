@@ -24,8 +24,13 @@ import os
 
 from dotenv import load_dotenv
 from langchain_chroma import Chroma
-from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langchain_openai import ChatOpenAI
+
+from bm25_index import hybrid_or_vector_retriever
+from context_packing import pack_context
+from embedding_backends import check_index_backend, get_embeddings
+from rag_prompt import build_messages
+from semantic_cache import SemanticAnswerCache
 
 # 加载 .env 文件中的环境变量
 # 确保能正确读取 OpenAI API 密钥等配置
@@ -39,59 +44,121 @@ persistent_directory = os.path.join(
 
 # 定义嵌入模型
 # 必须使用与构建阶段相同的嵌入模型，确保向量兼容性
-embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+# 嵌入后端由 EMBEDDING_BACKEND 选择，check_index_backend 确认它与 2a 构建索引时记录的后端一致
+# CachedEmbeddings 会缓存问题的向量，同一个问题第二次运行时不再调用嵌入 API
+embeddings = get_embeddings(cache_path=os.path.join(current_dir, "db", "embedding_cache.sqlite3"))
+check_index_backend(persistent_directory, embeddings)
 
 # 加载已存在的向量存储，并指定嵌入函数
 # 这里加载的是之前构建的带元数据的向量数据库
 db = Chroma(persist_directory=persistent_directory,
             embedding_function=embeddings)
 
+# 检索到的文档在提示中最多占用的 token 数
+CONTEXT_TOKEN_BUDGET = 2000
+
 # 定义用户的问题
 # 这是一个具体的查询示例，用于测试完整的 RAG 系统
 query = "What does dracula fear the most?"
 
 # 基于查询检索相关文档
 # 创建检索器，使用纯相似度搜索（无阈值过滤）
-retriever = db.as_retriever(
+vector_retriever = db.as_retriever(
     search_type="similarity",  # 使用纯相似度搜索，返回最相似的文档
     search_kwargs={"k": 3},    # 检索参数：返回最相似的3个文档
 )
-# 执行检索，获取相关文档
-relevant_docs = retriever.invoke(query)
-
-# 显示相关结果（不显示元数据）
-print("\n--- Relevant Documents ---")
-for i, doc in enumerate(relevant_docs, 1):
-    print(f"Document {i}:\n{doc.page_content}\n")  # 只显示文档内容，不显示来源
-
-# 将查询和相关文档内容组合成输入
-# 这是 RAG 系统的核心：将检索到的文档与用户查询结合
-combined_input = (
-    "Here are some documents that might help answer the question: "
-    + query
-    + "\n\nRelevant Documents:\n"
-    + "\n\n".join([doc.page_content for doc in relevant_docs])  # 将所有相关文档内容拼接
-    + "\n\nPlease provide a rough answer based only on the provided documents. If the answer is not found in the documents, respond with 'I'm not sure'."
+# 与入库阶段构建的 BM25 倒排索引组合成混合检索器（见 bm25_index.py）
+# 词法检索和向量检索的结果用倒数排名融合（RRF）合并，专有名词查询更准确
+# mode="hybrid"：每个查询都同时做词法检索和向量检索，两路各取 fetch_k 个候选再融合；
+# 改成 mode="auto" 时，只含少量关键词的查询（如 "Gandalf"）会跳过嵌入 API，只做词法检索
+# route_sources=True：检索之前先按问题中有区分度的词（如 "dracula"）判断涉及哪几本书（见 source_router.py），
+# 向量检索和 BM25 检索都只在这些书的块中进行；判断不出来时照常检索所有书
+# 也可以手动限定来源：retriever.invoke(query, filter={"source": "Dracula.txt"})
+retriever = hybrid_or_vector_retriever(
+    vector_retriever,
+    os.path.join(current_dir, "db", "bm25_index_with_metadata.json"),
+    k=3,
+    mode="hybrid",
+    route_sources=True,
 )
+if getattr(retriever, "router", None) is not None:
+    print(f"Routed sources: {retriever.router.route(query) or 'all'}")
+# 语义答案缓存（见 semantic_cache.py）
+# 与之前回答过的问题余弦相似度超过 threshold 时，直接返回缓存的回答，跳过检索和 LLM 调用
+# ttl_seconds：缓存条目的有效期；max_entries：超过上限按 LRU 淘汰
+# 2a 重新入库时，引用了被替换或删除的块的回答会自动失效
+answer_cache = SemanticAnswerCache(
+    os.path.join(current_dir, "db", "semantic_cache.sqlite3"),
+    threshold=0.95,
+    ttl_seconds=7 * 24 * 3600,
+    max_entries=1000,
+)
+
+# 嵌入问题（CachedEmbeddings 会缓存这个向量，检索时不会再调用一次嵌入 API）
+query_embedding = embeddings.embed_query(query)
+
+
+def chunks_still_exist(doc_ids):
+    """确认缓存回答引用的块仍然在向量库中"""
+    if not doc_ids:
+        # 没有引用任何块的回答无法确认是否仍然有效（db.get 也不接受空的 ID 列表），当作失效处理
+        return False
+    return len(db.get(ids=doc_ids)["ids"]) == len(doc_ids)
+
+
+cached = answer_cache.lookup(query_embedding, is_valid=chunks_still_exist)
+
+if cached is not None:
+    # 命中缓存：不检索、不调用 LLM
+    print("\n--- Cached Response ---")
+    print(f"Matched question: {cached['query']} (similarity {cached['similarity']:.3f})")
+    print("Content only:")
+    print(cached["answer"])
+else:
+    # 执行检索，获取相关文档
+    relevant_docs = retriever.invoke(query)
+
+    # 显示相关结果（不显示元数据）
+    print("\n--- Relevant Documents ---")
+    for i, doc in enumerate(relevant_docs, 1):
+        print(f"Document {i}:\n{doc.page_content}\n")  # 只显示文档内容，不显示来源
+
+    # 按 token 预算组装上下文（见 context_packing.py）
+    # 去掉重复/重叠的块，按排名依次放入，超出预算的低排名块会被截断或丢弃，
+    # 避免提示超出模型上下文窗口，也减少每次查询的 token 花费
+    packed_docs, packing_report = pack_context(
+        relevant_docs, budget_tokens=CONTEXT_TOKEN_BUDGET, model="gpt-3.5-turbo"
+    )
+    print("\n--- Context Packing ---")
+    print(
+        f"Tokens used: {packing_report['tokens_used']}/{packing_report['budget_tokens']}, "
+        f"chunks packed: {packing_report['docs_packed']}/{packing_report['docs_in']} "
+        f"(deduped {packing_report['deduped']}, trimmed {packing_report['trimmed']}, "
+        f"dropped {packing_report['dropped']})"
+    )
+
+    # 将查询和相关文档内容组合成发送给模型的消息（见 rag_prompt.py）
+    # 这是 RAG 系统的核心：将检索到的文档与用户查询结合
+    # 使用系统消息和人类消息的标准格式
+    messages = build_messages(query, packed_docs)
+
+    # 创建 ChatOpenAI 模型用于生成回答
+    # 使用 GPT-3.5-turbo 模型
+    model = ChatOpenAI(model="gpt-3.5-turbo")
+
+    # 调用模型生成回答
+    # 这是 RAG 系统的生成阶段
+    result = model.invoke(messages)
+
+    # 显示生成的结果
+    print("\n--- Generated Response ---")
+    # print("Full result:")
+    # print(result)
+    print("Content only:")
+    print(result.content)  # 只显示生成的回答内容
 
-# 创建 ChatOpenAI 模型用于生成回答
-# 使用 GPT-3.5-turbo 模型
-model = ChatOpenAI(model="gpt-3.5-turbo")
-
-# 定义发送给模型的消息
-# 使用系统消息和人类消息的标准格式
-messages = [
-    SystemMessage(content="You are a helpful assistant."),  # 系统角色设定
-    HumanMessage(content=combined_input),  # 用户消息，包含查询和相关文档
-]
-
-# 调用模型生成回答
-# 这是 RAG 系统的生成阶段
-result = model.invoke(messages)
-
-# 显示生成的结果
-print("\n--- Generated Response ---")
-# print("Full result:")
-# print(result)
-print("Content only:")
-print(result.content)  # 只显示生成的回答内容
+    # 保存到语义缓存，下次遇到相似的问题可以直接返回
+    # 没有检索到任何块时不缓存：这样的回答无法随块失效，入库新文档之后也应该重新检索
+    doc_ids = [doc.id for doc in packed_docs if doc.id]
+    if doc_ids:
+        answer_cache.store(query, query_embedding, doc_ids, result.content)
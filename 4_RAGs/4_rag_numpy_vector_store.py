@@ -0,0 +1,99 @@
+# 与 2b_rag_basics_metadata.py 的对比分析
+#
+# | 方面 | 2b_rag_basics_metadata.py | 4_rag_numpy_vector_store.py |
+# |------|---------------------------|-----------------------------|
+# | **向量存储** | Chroma（SQLite + HNSW） | NumpyVectorStore（内存映射 .npy 矩阵） |
+# | **启动开销** | 启动 Chroma 客户端、打开 SQLite、加载 HNSW | np.load(mmap_mode="r") + 读取元数据文件 |
+# | **检索算法** | HNSW 近似最近邻 | 矩阵-向量乘法精确 top-k，可选 IVF 分区 |
+# | **检索接口** | db.as_retriever(...) | 完全相同的 db.as_retriever(...) |
+# | **数据来源** | 2a 构建 | 从 2a 构建的 Chroma 库导出，不重新调用嵌入 API |
+#
+# 关键区别总结：
+# - 对于几千个块的小语料库，一次 (N × d) 矩阵乘向量只需要几百微秒，精确检索比近似检索更简单也更准确
+# - 语料库变大后，可以调用 build_ivf() 构建 IVF 分区，查询时只扫描最近的 nprobe 个分区
+# - 两种向量存储返回的分数换算方式相同，原有的 score_threshold 可以直接沿用
+
+import os
+import time
+
+from langchain_chroma import Chroma
+
+from embedding_backends import check_index_backend, get_embeddings, record_index_backend
+from numpy_vector_store import NumpyVectorStore
+
+# 定义持久化目录
+current_dir = os.path.dirname(os.path.abspath(__file__))
+db_dir = os.path.join(current_dir, "db")
+persistent_directory = os.path.join(db_dir, "chroma_db_with_metadata")
+numpy_directory = os.path.join(db_dir, "numpy_store_with_metadata")
+
+# 定义嵌入模型
+# 必须使用与 2a 中相同的嵌入模型，确保向量兼容性
+# Chroma 库和导出的 NumPy 存储都记录了构建时的嵌入后端，与 EMBEDDING_BACKEND 不一致时拒绝加载
+embeddings = get_embeddings(cache_path=os.path.join(db_dir, "embedding_cache.sqlite3"))
+check_index_backend(persistent_directory, embeddings)
+check_index_backend(numpy_directory, embeddings)
+
+# 第一次运行时，从 2a 构建的 Chroma 库导出向量、文本和元数据
+if not os.path.exists(numpy_directory):
+    print("NumPy vector store does not exist. Exporting from Chroma...")
+    chroma_db = Chroma(persist_directory=persistent_directory, embedding_function=embeddings)
+    numpy_db = NumpyVectorStore.from_chroma(chroma_db, numpy_directory, embeddings)
+    # 分区数约为 sqrt(块数)；语料库很小时，nprobe 会覆盖所有分区，等同于精确检索
+    numpy_db.build_ivf()
+    record_index_backend(numpy_directory, embeddings)
+    print(f"Exported {len(numpy_db.ids)} chunks to {numpy_directory}")
+
+# 定义用户的问题
+query = "Where is Dracula's castle located?"
+
+# 先把问题嵌入一次（写入缓存），下面的计时只比较向量存储本身的开销
+embeddings.embed_query(query)
+
+# ===== Chroma =====
+start = time.perf_counter()
+chroma_db = Chroma(persist_directory=persistent_directory, embedding_function=embeddings)
+chroma_open = time.perf_counter() - start
+
+chroma_retriever = chroma_db.as_retriever(
+    search_type="similarity_score_threshold",
+    search_kwargs={"k": 3, "score_threshold": 0.2},
+)
+start = time.perf_counter()
+chroma_docs = chroma_retriever.invoke(query)
+chroma_query = time.perf_counter() - start
+
+# ===== NumpyVectorStore =====
+start = time.perf_counter()
+numpy_db = NumpyVectorStore(numpy_directory, embeddings, nprobe=8)
+numpy_open = time.perf_counter() - start
+
+# 与 Chroma 完全相同的检索器参数
+numpy_retriever = numpy_db.as_retriever(
+    search_type="similarity_score_threshold",
+    search_kwargs={"k": 3, "score_threshold": 0.2},
+)
+start = time.perf_counter()
+numpy_docs = numpy_retriever.invoke(query)
+numpy_query = time.perf_counter() - start
+
+# 显示两种向量存储的耗时对比
+print("\n--- Timing (seconds) ---")
+print(f"Chroma: open {chroma_open:.4f}, query {chroma_query:.4f}")
+print(f"NumPy:  open {numpy_open:.4f}, query {numpy_query:.4f}")
+
+# 显示 NumPy 向量存储的检索结果及其元数据
+print("\n--- Relevant Documents (NumpyVectorStore) ---")
+for i, doc in enumerate(numpy_docs, 1):
+    print(f"Document {i}:\n{doc.page_content}\n")
+    print(f"Source: {doc.metadata['source']}\n")
+
+# 两种存储返回的块应该基本一致（HNSW 是近似检索，偶尔会有差异）
+overlap = {doc.page_content for doc in chroma_docs} & {doc.page_content for doc in numpy_docs}
+print(f"Overlap with Chroma results: {len(overlap)}/{max(len(chroma_docs), len(numpy_docs))}")
+
+# 纯相似度检索（3_rag_one_off_question.py 使用的方式）同样可用
+similarity_retriever = numpy_db.as_retriever(search_type="similarity", search_kwargs={"k": 3})
+print("\n--- Similarity search (k=3) ---")
+for doc in similarity_retriever.invoke("What does dracula fear the most?"):
+    print(f"- {doc.metadata['source']}: {doc.page_content[:80]!r}")
@@ -0,0 +1,213 @@
+# 与 3_rag_one_off_question.py 的对比分析
+#
+# | 方面 | 3_rag_one_off_question.py | 5_rag_query_service.py |
+# |------|---------------------------|------------------------|
+# | **运行方式** | 一次性脚本，回答一个写死的 query 后退出 | 常驻的 asyncio HTTP 服务 |
+# | **冷启动** | 每次都要导入 langchain、打开 Chroma、创建客户端 | 启动时只做一次，之后所有请求复用 |
+# | **并发** | 无 | 多个请求在同一个事件循环上并发处理 |
+# | **重复请求** | 每次都完整执行 | 相同问题正在处理时，后来的请求直接共享同一个结果（请求合并） |
+# | **输出方式** | 等完整回答生成后一次性打印 | 支持流式返回，生成一个 token 就发送一个 |
+#
+# 关键区别总结：
+# - 每个请求的延迟只剩"检索 + 生成"，没有进程启动和客户端初始化的冷启动开销
+# - 请求合并：同一时刻有 N 个相同的问题，只会检索一次、调用一次 LLM
+#
+# 使用方法：
+#   python 4_RAGs/5_rag_query_service.py --port 8080
+#   curl -s localhost:8080/query -d '{"query": "What does dracula fear the most?"}'
+#   curl -sN localhost:8080/query -d '{"query": "What does dracula fear the most?", "stream": true}'
+
+import argparse
+import asyncio
+import os
+import time
+
+from aiohttp import web
+from dotenv import load_dotenv
+from langchain_chroma import Chroma
+from langchain_openai import ChatOpenAI
+
+from bm25_index import hybrid_or_vector_retriever
+from context_packing import pack_context
+from embedding_backends import check_index_backend, get_embeddings
+from rag_prompt import build_messages
+
+# 加载 .env 文件中的环境变量
+load_dotenv()
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+db_dir = os.path.join(current_dir, "db")
+persistent_directory = os.path.join(db_dir, "chroma_db_with_metadata")
+
+
+def normalize_query(query):
+    """请求合并用的键：忽略大小写和多余空白"""
+    return " ".join(query.lower().split())
+
+
+class InFlightAnswer:
+    """
+    一个正在生成中的回答
+    生成任务把 token 逐个追加到 chunks 中；任意多个请求都可以订阅它，
+    先从头回放已经生成的部分，再等待后续 token，这样流式和非流式请求都能共享同一次生成
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.sources = []
+        self.context_tokens = 0
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self._changed = asyncio.Condition()
+
+    async def publish(self, chunk=None, done=False, error=None):
+        async with self._changed:
+            if chunk:
+                self.chunks.append(chunk)
+            if done:
+                self.done = True
+            if error is not None:
+                self.error = error
+                self.done = True
+            self._changed.notify_all()
+
+    async def subscribe(self):
+        """按顺序产出所有 token，生成结束后返回"""
+        self.subscribers += 1
+        position = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: position < len(self.chunks) or self.done)
+                pending = self.chunks[position:]
+                finished = self.done
+                error = self.error
+            for chunk in pending:
+                yield chunk
+            position += len(pending)
+            if finished and position >= len(self.chunks):
+                if error is not None:
+                    raise error
+                return
+
+
+class RAGService:
+    """持有常驻的向量库、检索器和模型客户端"""
+
+    def __init__(self, k=3, context_budget=2000):
+        # 这些对象只在启动时创建一次，之后所有请求共享
+        # 嵌入后端必须与 2a 构建索引时记录的一致（见 embedding_backends.py），否则启动时直接报错
+        self.embeddings = get_embeddings(cache_path=os.path.join(db_dir, "embedding_cache.sqlite3"))
+        check_index_backend(persistent_directory, self.embeddings)
+        self.db = Chroma(persist_directory=persistent_directory, embedding_function=self.embeddings)
+        self.retriever = hybrid_or_vector_retriever(
+            self.db.as_retriever(search_type="similarity", search_kwargs={"k": k}),
+            os.path.join(db_dir, "bm25_index_with_metadata.json"),
+            k=k,
+        )
+        self.model = ChatOpenAI(model="gpt-3.5-turbo")
+        self.context_budget = context_budget
+        self._in_flight = {}
+        # 事件循环只持有任务的弱引用，没有其他引用的任务可能在完成之前被垃圾回收；
+        # 生成任务在这里保存强引用，完成后自行移除
+        self._tasks = set()
+
+    def get_or_start(self, query):
+        """返回 (正在生成的回答, 是否合并到了已有请求)"""
+        key = normalize_query(query)
+        answer = self._in_flight.get(key)
+        if answer is not None:
+            return answer, True
+        answer = InFlightAnswer()
+        self._in_flight[key] = answer
+        task = asyncio.create_task(self._generate(query, answer))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return answer, False
+
+    async def _generate(self, query, answer):
+        try:
+            # 检索：ainvoke 在事件循环上调度，同步的底层调用会被放到线程池中执行
+            docs = await self.retriever.ainvoke(query)
+            # 按 token 预算组装上下文（见 context_packing.py）
+            docs, report = pack_context(docs, budget_tokens=self.context_budget, model=self.model.model_name)
+            answer.sources = [doc.metadata.get("source", "Unknown") for doc in docs]
+            answer.context_tokens = report["tokens_used"]
+            # 生成：用 astream 逐个 token 地接收模型输出
+            async for chunk in self.model.astream(build_messages(query, docs)):
+                await answer.publish(chunk.content)
+            await answer.publish(done=True)
+        except Exception as e:
+            await answer.publish(error=e)
+
+
+async def handle_query(request):
+    service = request.app["service"]
+    try:
+        payload = await request.json()
+    except ValueError:  # 包括 json.JSONDecodeError
+        return web.json_response({"error": "request body must be valid JSON"}, status=400)
+    if not isinstance(payload, dict):
+        return web.json_response({"error": "request body must be a JSON object"}, status=400)
+    query = payload.get("query") or ""
+    if not isinstance(query, str):
+        return web.json_response({"error": "query must be a string"}, status=400)
+    query = query.strip()
+    if not query:
+        return web.json_response({"error": "query is required"}, status=400)
+
+    start = time.perf_counter()
+    answer, coalesced = service.get_or_start(query)
+
+    if not payload.get("stream"):
+        try:
+            text = "".join([chunk async for chunk in answer.subscribe()])
+        except Exception as e:
+            return web.json_response({"error": str(e)}, status=502)
+        return web.json_response(
+            {
+                "query": query,
+                "answer": text,
+                "sources": answer.sources,
+                "context_tokens": answer.context_tokens,
+                "coalesced": coalesced,
+                "latency_seconds": round(time.perf_counter() - start, 4),
+            }
+        )
+
+    # 流式返回：分块传输，每收到一个 token 就写给客户端
+    response = web.StreamResponse(headers={"Content-Type": "text/plain; charset=utf-8"})
+    response.enable_chunked_encoding()
+    await response.prepare(request)
+    try:
+        async for chunk in answer.subscribe():
+            await response.write(chunk.encode("utf-8"))
+    except Exception as e:
+        await response.write(f"\n[error] {e}".encode("utf-8"))
+    await response.write_eof()
+    return response
+
+
+async def handle_health(request):
+    return web.json_response({"status": "ok", "in_flight": len(request.app["service"]._in_flight)})
+
+
+def create_app(service=None):
+    app = web.Application()
+    app["service"] = service or RAGService()
+    app.router.add_post("/query", handle_query)
+    app.router.add_get("/health", handle_health)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="RAG query service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+
+    print("Warming up vector store and model clients...")
+    app = create_app()
+    print(f"RAG query service listening on http://{args.host}:{args.port}")
+    web.run_app(app, host=args.host, port=args.port, print=None)
@@ -0,0 +1,159 @@
+# 与 3_rag_one_off_question.py 的对比分析
+#
+# | 方面 | 3_rag_one_off_question.py | 6_rag_batch_questions.py |
+# |------|---------------------------|--------------------------|
+# | **问题来源** | 写死的一个 query | JSONL / CSV 文件中的成百上千个问题 |
+# | **问题嵌入** | 每个问题一次嵌入调用 | 所有问题一次批量嵌入 |
+# | **检索** | 每个问题一次 retriever.invoke | 用批量嵌入得到的向量逐个检索（similarity_search_by_vector），不再重复嵌入 |
+# | **生成** | 一次 model.invoke | model.abatch_as_completed，并发数受 max_concurrency 限制 |
+# | **输出** | 打印到终端 | 每完成一个就追加写入 JSONL，并显示进度 |
+# | **中断恢复** | 无 | 输出文件即检查点，重新运行时跳过已经回答过的问题 |
+#
+# 关键区别总结：
+# - 吞吐量取决于并发上限，而不是问题数 × 串行往返次数
+# - 中途失败或被中断后，直接重新运行同一条命令即可从断点继续
+#
+# 使用方法：
+#   python 4_RAGs/6_rag_batch_questions.py --input 4_RAGs/questions/sample_questions.jsonl --concurrency 8
+# 输入格式：
+#   JSONL：每行 {"id": "...", "question": "..."}（id 可省略，默认使用行号）
+#   CSV：表头包含 question 列，可选 id 列
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import time
+
+from dotenv import load_dotenv
+from langchain_chroma import Chroma
+from langchain_openai import ChatOpenAI
+
+from bm25_index import BM25Index, reciprocal_rank_fusion
+from context_packing import pack_context
+from embedding_backends import check_index_backend, get_embeddings
+from rag_prompt import build_messages
+
+# 加载 .env 文件中的环境变量
+load_dotenv()
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+db_dir = os.path.join(current_dir, "db")
+persistent_directory = os.path.join(db_dir, "chroma_db_with_metadata")
+bm25_index_path = os.path.join(db_dir, "bm25_index_with_metadata.json")
+
+
+def read_questions(path):
+    """读取 JSONL 或 CSV 格式的问题文件，返回 [(id, question)]"""
+    questions = []
+    if path.endswith(".csv"):
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            for i, row in enumerate(csv.DictReader(f), 1):
+                questions.append((str(row.get("id") or i), row["question"]))
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            for i, line in enumerate(f, 1):
+                if line.strip():
+                    record = json.loads(line)
+                    questions.append((str(record.get("id", i)), record["question"]))
+    return questions
+
+
+def read_checkpoint(path):
+    """输出文件中已经成功回答的问题 ID（出错的记录不算，下次会重试）"""
+    done = set()
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    if "error" not in record:
+                        done.add(record["id"])
+    return done
+
+
+def batch_retrieve(db, embeddings, questions, k, bm25=None):
+    """
+    批量检索：一次嵌入所有问题，再用现成的向量逐个检索（不再为每个问题单独调用嵌入 API）
+    如果有 BM25 索引，再与词法检索结果做 RRF 融合
+    """
+    query_vectors = embeddings.embed_documents(questions)
+    all_docs = []
+    for question, query_vector in zip(questions, query_vectors):
+        docs = db.similarity_search_by_vector(query_vector, k=k)
+        if bm25 is not None:
+            lexical = [doc for doc, _ in bm25.search(question, k=k)]
+            docs = reciprocal_rank_fusion([lexical, docs], k=k)
+        all_docs.append(docs)
+    return all_docs
+
+
+async def answer_all(args):
+    questions = read_questions(args.input)
+    done = read_checkpoint(args.output)
+    todo = [(qid, question) for qid, question in questions if qid not in done]
+    print(f"Questions: {len(questions)}, already answered: {len(done)}, to answer: {len(todo)}")
+    if not todo:
+        return
+
+    embeddings = get_embeddings(cache_path=os.path.join(db_dir, "embedding_cache.sqlite3"))
+    check_index_backend(persistent_directory, embeddings)
+    db = Chroma(persist_directory=persistent_directory, embedding_function=embeddings)
+    bm25 = BM25Index.load(bm25_index_path) if os.path.exists(bm25_index_path) else None
+    model = ChatOpenAI(model="gpt-3.5-turbo")
+
+    # 检索阶段：整批一次完成
+    start = time.perf_counter()
+    all_docs = batch_retrieve(db, embeddings, [question for _, question in todo], args.k, bm25)
+    print(f"Retrieved context for {len(todo)} questions in {time.perf_counter() - start:.2f}s")
+
+    packed = [pack_context(docs, budget_tokens=args.context_budget)[0] for docs in all_docs]
+    inputs = [build_messages(question, docs) for (_, question), docs in zip(todo, packed)]
+
+    # 生成阶段：最多 concurrency 个请求同时进行，谁先完成谁先写入输出文件
+    start = time.perf_counter()
+    completed = 0
+    failed = 0
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "a", encoding="utf-8") as out:
+        async for index, result in model.abatch_as_completed(
+            inputs, config={"max_concurrency": args.concurrency}, return_exceptions=True
+        ):
+            qid, question = todo[index]
+            record = {
+                "id": qid,
+                "question": question,
+                "sources": [doc.metadata.get("source", "Unknown") for doc in packed[index]],
+            }
+            if isinstance(result, Exception):
+                record["error"] = str(result)
+                failed += 1
+            else:
+                record["answer"] = result.content
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()  # 每条都立即落盘，中断后可以从这里恢复
+
+            completed += 1
+            elapsed = time.perf_counter() - start
+            print(
+                f"[{completed}/{len(todo)}] {qid} "
+                f"{'FAILED' if isinstance(result, Exception) else 'ok'} "
+                f"({completed / elapsed:.2f} questions/sec)"
+            )
+
+    print(f"\nFinished: {completed - failed} answered, {failed} failed. Output: {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer a file of questions with the RAG pipeline")
+    parser.add_argument("--input", default=os.path.join(current_dir, "questions", "sample_questions.jsonl"))
+    parser.add_argument("--output", help="JSONL output / checkpoint file (default: <input>.answers.jsonl)")
+    parser.add_argument("--concurrency", type=int, default=8, help="max concurrent LLM calls")
+    parser.add_argument("--k", type=int, default=3, help="documents retrieved per question")
+    parser.add_argument("--context-budget", type=int, default=2000, help="context token budget per question")
+    args = parser.parse_args()
+    if args.output is None:
+        args.output = os.path.splitext(args.input)[0] + ".answers.jsonl"
+
+    asyncio.run(answer_all(args))
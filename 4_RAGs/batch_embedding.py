@@ -0,0 +1,183 @@
+# 批量并发嵌入：控制批大小和并发数，并在遇到限流时自动退避
+#
+# 1a / 2a 原来都是 Chroma.from_documents(docs, embeddings, ...) 一次性同步调用：
+# - 所有块在一个线程里按顺序一批一批地发给嵌入 API，网络往返完全串行
+# - 批大小、并发数都无法控制
+# - 遇到 429 限流只能依赖客户端内置的少量重试
+#
+# 这里按 batch_size 切批，用有界线程池同时处理 max_workers 个批次：
+# - embed_in_batches：只计算向量
+# - add_documents_in_batches：每个批次调用 Chroma 公开的 add_texts（嵌入并写入），不依赖 Chroma 的内部属性
+# 任何一个批次遇到限流，所有线程都会一起暂停（共享的限流闸门），然后指数退避重试
+#
+# 嵌入 API 调用是 I/O 密集型操作，线程池足够，不需要多进程。
+
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class RateLimitGate:
+    """
+    所有工作线程共享的限流闸门
+    某个批次收到 429 后关闭闸门一段时间，其他线程在发请求前都会等待，
+    避免在服务端已经限流的情况下继续"撞墙"
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._not_before = 0.0
+
+    def wait(self):
+        while True:
+            with self._lock:
+                delay = self._not_before - time.monotonic()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def block_for(self, seconds):
+        with self._lock:
+            self._not_before = max(self._not_before, time.monotonic() + seconds)
+
+
+def _status_code(exc):
+    """尽量从异常中取出 HTTP 状态码（openai / httpx 的异常都带有 status_code 或 response）"""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        response = getattr(exc, "response", None)
+        status = getattr(response, "status_code", None)
+    return status
+
+
+def _retry_after(exc):
+    """读取服务端返回的 Retry-After 头（单位：秒），没有则返回 None"""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(exc):
+    """限流（429）、服务端错误（5xx）和连接类错误可以重试，其余错误直接抛出"""
+    status = _status_code(exc)
+    if status is not None:
+        return status == 429 or status >= 500
+    name = type(exc).__name__
+    return name in ("RateLimitError", "APIConnectionError", "APITimeoutError") or isinstance(
+        exc, (ConnectionError, TimeoutError)
+    )
+
+
+def _with_retry(call, arg, gate, max_retries, base_delay, max_delay):
+    """调用 call(arg)，遇到可重试的错误时退避重试"""
+    attempt = 0
+    while True:
+        gate.wait()
+        try:
+            return call(arg)
+        except Exception as exc:
+            if attempt >= max_retries or not is_retryable(exc):
+                raise
+            # 指数退避 + 随机抖动；如果服务端给了 Retry-After，以它为准
+            delay = _retry_after(exc)
+            if delay is None:
+                delay = min(max_delay, base_delay * (2 ** attempt)) * (0.5 + random.random() / 2)
+            if _status_code(exc) == 429 or type(exc).__name__ == "RateLimitError":
+                gate.block_for(delay)
+            else:
+                time.sleep(delay)
+            attempt += 1
+
+
+def embed_in_batches(
+    embeddings,
+    texts,
+    batch_size=128,
+    max_workers=4,
+    max_retries=6,
+    base_delay=1.0,
+    max_delay=30.0,
+):
+    """
+    分批并发地计算嵌入向量，返回顺序与 texts 一致的向量列表
+
+    参数:
+        embeddings: 任意 LangChain Embeddings 实例（例如 OpenAIEmbeddings）
+        texts: 待嵌入的文本列表
+        batch_size: 每次 API 调用包含的文本数
+        max_workers: 同时在途的批次数上限
+        max_retries: 单个批次的最大重试次数
+        base_delay / max_delay: 指数退避的初始延迟和上限（秒）
+    """
+    texts = list(texts)
+    if not texts:
+        return []
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    gate = RateLimitGate()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(_with_retry, embeddings.embed_documents, batch, gate, max_retries, base_delay, max_delay)
+            for batch in batches
+        ]
+        vectors = []
+        for future in futures:
+            vectors.extend(future.result())
+    return vectors
+
+
+def add_documents_in_batches(
+    db,
+    docs,
+    ids=None,
+    batch_size=128,
+    max_workers=4,
+    max_retries=6,
+    base_delay=1.0,
+    max_delay=30.0,
+):
+    """
+    分批并发地嵌入并写入 Chroma
+
+    与 db.add_documents 的效果相同（相同的 ID 会被覆盖），但按 batch_size 切批，
+    最多 max_workers 个批次同时进行；每个批次通过公开的 db.add_texts 写入（嵌入使用 db 自己的嵌入模型），
+    遇到限流等可重试的错误时整批重试，相同 ID 的写入是幂等的
+
+    返回:
+        统计信息字典（块数、耗时、吞吐量）
+    """
+    docs = list(docs)
+    if ids is None:
+        ids = [str(uuid.uuid4()) for _ in docs]
+    if not docs:
+        return {"chunks": 0, "seconds": 0.0, "chunks_per_second": 0.0}
+
+    texts = [doc.page_content for doc in docs]
+    metadatas = [doc.metadata or {} for doc in docs]
+
+    def add_batch(start):
+        end = start + batch_size
+        return db.add_texts(texts[start:end], metadatas=metadatas[start:end], ids=ids[start:end])
+
+    start_time = time.perf_counter()
+    gate = RateLimitGate()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(_with_retry, add_batch, start, gate, max_retries, base_delay, max_delay)
+            for start in range(0, len(docs), batch_size)
+        ]
+        for future in futures:
+            future.result()
+    seconds = time.perf_counter() - start_time
+
+    return {
+        "chunks": len(docs),
+        "seconds": seconds,
+        "chunks_per_second": len(docs) / seconds if seconds > 0 else float("inf"),
+    }
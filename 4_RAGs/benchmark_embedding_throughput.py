@@ -0,0 +1,73 @@
+# 嵌入吞吐量基准测试：顺序嵌入 vs 批量并发嵌入
+#
+# 启动一个本地假嵌入服务器（见 fake_embedding_server.py），
+# 用 documents/ 目录下所有书分割出来的块，比较不同批大小和并发数下的吞吐量（块/秒）。
+# 全程不访问真实的 OpenAI API，不产生任何费用。
+#
+# 使用方法：
+#   python 4_RAGs/benchmark_embedding_throughput.py
+
+import os
+import time
+
+from langchain.text_splitter import CharacterTextSplitter
+from langchain_community.document_loaders import TextLoader
+from langchain_openai import OpenAIEmbeddings
+
+from batch_embedding import embed_in_batches
+from fake_embedding_server import start_server
+
+# 模拟每个嵌入请求 100ms 的往返延迟，以及每秒 50 个请求的限流
+LATENCY = 0.1
+RATE_LIMIT = 50
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+books_dir = os.path.join(current_dir, "documents")
+
+# 加载并分割所有书，得到和 2a 相同的块
+text_splitter = CharacterTextSplitter(chunk_size=1000, chunk_overlap=0)
+texts = []
+for book_file in sorted(f for f in os.listdir(books_dir) if f.endswith(".txt")):
+    documents = TextLoader(os.path.join(books_dir, book_file)).load()
+    texts.extend(doc.page_content for doc in text_splitter.split_documents(documents))
+print(f"Number of chunks: {len(texts)}")
+
+server, base_url = start_server(latency=LATENCY, rate_limit=RATE_LIMIT)
+print(f"Fake embedding server: {base_url} (latency={LATENCY}s, rate_limit={RATE_LIMIT}/s)")
+
+
+def make_embeddings(batch_size):
+    # check_embedding_ctx_length=False：直接发送原始文本，不在本地做 tiktoken 分词
+    # max_retries=0：关闭客户端内置重试，让 batch_embedding 的退避逻辑来处理 429
+    return OpenAIEmbeddings(
+        model="text-embedding-3-small",
+        base_url=base_url,
+        api_key="fake",
+        check_embedding_ctx_length=False,
+        chunk_size=batch_size,
+        max_retries=0,
+    )
+
+
+print("\n--- Sequential baseline (embeddings.embed_documents) ---")
+start = time.perf_counter()
+make_embeddings(128).embed_documents(texts)
+elapsed = time.perf_counter() - start
+print(f"batch_size=128 workers=1: {elapsed:.2f}s, {len(texts) / elapsed:.1f} chunks/sec")
+
+print("\n--- Batched concurrent (embed_in_batches) ---")
+for batch_size in (32, 128):
+    for max_workers in (1, 4, 8, 16):
+        embeddings = make_embeddings(batch_size)
+        start = time.perf_counter()
+        vectors = embed_in_batches(
+            embeddings, texts, batch_size=batch_size, max_workers=max_workers, base_delay=0.2
+        )
+        elapsed = time.perf_counter() - start
+        assert len(vectors) == len(texts)
+        print(
+            f"batch_size={batch_size} workers={max_workers}: "
+            f"{elapsed:.2f}s, {len(texts) / elapsed:.1f} chunks/sec"
+        )
+
+server.shutdown()
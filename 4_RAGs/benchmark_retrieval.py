@@ -0,0 +1,306 @@
+# 检索质量与延迟基准测试：比较不同的分割参数和检索配置
+#
+# 1b 的 score_threshold=0.5、2b 的 0.2、k=3、chunk_size=1000 / chunk_overlap=0 或 50 都是凭感觉定的。
+# 这个脚本用一份带标准答案的问题集（questions/retrieval_eval.jsonl，每个问题标注了应该来自哪本书、
+# 相关段落里一定会出现的关键词）对每种配置测量：
+# - recall@1 / @3 / @5：前 k 个结果中至少有一个相关块的问题比例
+#   （相关块 = 来源正确并且包含 evidence 关键词；source@5 只要求来源正确）
+# - MRR：第一个相关块排名的倒数的平均值
+# - 检索延迟的 p50 / p95（包括嵌入问题的时间）
+# - 索引构建时间（分割 + 嵌入 + 写入 Chroma + BM25 索引）、索引在磁盘上的大小
+# - 峰值内存（RSS）：每个配置在一个新启动的子进程中运行，互不影响
+#
+# 嵌入默认使用 local_embeddings.py 的 HashingEmbeddings：不访问网络、结果完全可复现，可以在 CI 中运行。
+# 注意：它的相似度分布和 OpenAI 嵌入不同，score_threshold 的最佳取值不能直接照搬到真实模型，
+# 但不同配置之间的相对比较仍然有参考价值。--embedding-backend 可以换成 embedding_backends.py 中的其他后端。
+# 1b / 2b 的 score_threshold 配置在哈希嵌入下几乎检索不到任何块（Chroma 的相关性分数为负），
+# 所以不在默认的配置集合中，需要时用 --configs 显式选择。
+#
+# 按 token 分割的配置需要 tiktoken 的 cl100k_base 编码文件，tiktoken 第一次使用时会下载它。
+# 离线环境（例如 CI）请把 TIKTOKEN_CACHE_DIR 指向一个已经缓存了编码文件的目录；
+# 加载不到编码时这个配置会被跳过并给出原因，其余配置照常运行。
+# 任何一个配置运行失败都只记录错误、不影响其他配置，有配置失败时退出码为 1（跳过不算失败）。
+#
+# 使用方法：
+#   python 4_RAGs/benchmark_retrieval.py
+#   python 4_RAGs/benchmark_retrieval.py --configs 2a_chars_1000,hybrid_routed --output results.json
+#   python 4_RAGs/benchmark_retrieval.py --embedding-backend openai --configs hybrid
+#   python 4_RAGs/benchmark_retrieval.py --configs 2b_threshold_0.2,1b_threshold_0.5
+#   python 4_RAGs/benchmark_retrieval.py --list
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DOCUMENTS = os.path.join(current_dir, "documents")
+DEFAULT_QUESTIONS = os.path.join(current_dir, "questions", "retrieval_eval.jsonl")
+
+# 检索器最多返回的块数，recall@k 的 k 不超过它
+K_MAX = 5
+RECALL_AT = (1, 3, 5)
+
+# 每个配置：分割方式和参数，以及检索方式
+#   splitter: chars（CharacterTextSplitter，按字符）/ tokens（SentenceTokenSplitter，按 token）
+#   retrieval: vector（纯向量）/ hybrid（BM25 + 向量，RRF 融合）
+#   score_threshold: 设置时使用 similarity_score_threshold 检索
+#   route_sources: 是否先用 SourceRouter 选择来源
+CONFIGS = {
+    "2a_chars_1000": dict(splitter="chars", chunk_size=1000, chunk_overlap=0, retrieval="vector"),
+    "1a_chars_1000_overlap50": dict(splitter="chars", chunk_size=1000, chunk_overlap=50, retrieval="vector"),
+    "chars_500_overlap50": dict(splitter="chars", chunk_size=500, chunk_overlap=50, retrieval="vector"),
+    "tokens_256_overlap32": dict(splitter="tokens", chunk_size=256, chunk_overlap=32, retrieval="vector"),
+    "2b_threshold_0.2": dict(splitter="chars", chunk_size=1000, chunk_overlap=0, retrieval="vector", score_threshold=0.2),
+    "1b_threshold_0.5": dict(splitter="chars", chunk_size=1000, chunk_overlap=50, retrieval="vector", score_threshold=0.5),
+    "hybrid": dict(splitter="chars", chunk_size=1000, chunk_overlap=0, retrieval="hybrid"),
+    "hybrid_routed": dict(splitter="chars", chunk_size=1000, chunk_overlap=0, retrieval="hybrid", route_sources=True),
+}
+# 不指定 --configs 时运行的配置：score_threshold 的两个配置只对真实嵌入模型有意义
+DEFAULT_CONFIGS = [name for name, config in CONFIGS.items() if config.get("score_threshold") is None]
+
+
+class ConfigSkipped(Exception):
+    """配置在当前环境下无法运行（例如离线时加载不到 tiktoken 编码）"""
+
+
+def load_questions(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def make_splitter(config):
+    if config["splitter"] == "tokens":
+        from context_packing import get_encoder
+        from sentence_token_splitter import SentenceTokenSplitter
+
+        try:
+            get_encoder()
+        except Exception as e:  # tiktoken 下载编码文件失败时抛出的异常类型取决于网络库
+            raise ConfigSkipped(
+                f"tiktoken encoding unavailable ({type(e).__name__}); "
+                "set TIKTOKEN_CACHE_DIR to a directory with a cached cl100k_base encoding"
+            ) from e
+        return SentenceTokenSplitter(chunk_size=config["chunk_size"], chunk_overlap=config["chunk_overlap"])
+    from langchain.text_splitter import CharacterTextSplitter
+
+    return CharacterTextSplitter(chunk_size=config["chunk_size"], chunk_overlap=config["chunk_overlap"])
+
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def peak_rss_mb():
+    """当前进程的峰值 RSS（MB）；不支持 resource 模块的平台（Windows）返回 None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位是 KB，macOS 上是字节
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def build_index(config, documents_dir, index_dir, backend):
+    """分割、嵌入并写入 Chroma（和 BM25 索引），返回检索器"""
+    import logging
+
+    from langchain_chroma import Chroma
+    from langchain_core.documents import Document
+
+    from batch_embedding import add_documents_in_batches
+    from bm25_index import BM25Index, HybridRetriever
+    from embedding_backends import create_embeddings
+
+    # CharacterTextSplitter 遇到超长段落时会逐条打印警告
+    logging.getLogger("langchain_text_splitters.base").setLevel(logging.ERROR)
+    # score_threshold 检索在相关性分数超出 [0, 1] 时发出 UserWarning（警告里带着整个块的文本），
+    # 没有结果时每个问题都记一条日志警告；分数和召回率已经反映在报告里
+    warnings.filterwarnings("ignore", message="Relevance scores must be between")
+    logging.getLogger("langchain_core.vectorstores.base").setLevel(logging.ERROR)
+
+    splitter = make_splitter(config)
+    docs = []
+    for book_file in sorted(f for f in os.listdir(documents_dir) if f.endswith(".txt")):
+        with open(os.path.join(documents_dir, book_file), "r", encoding="utf-8") as f:
+            docs.extend(splitter.create_documents([f.read()], metadatas=[{"source": book_file}]))
+    ids = [f"chunk-{i}" for i in range(len(docs))]
+
+    embeddings = create_embeddings(backend)
+    db = Chroma(persist_directory=os.path.join(index_dir, "chroma"), embedding_function=embeddings)
+    add_documents_in_batches(db, docs, ids, batch_size=256, max_workers=1)
+
+    if config.get("score_threshold") is not None:
+        vector_retriever = db.as_retriever(
+            search_type="similarity_score_threshold",
+            search_kwargs={"k": K_MAX, "score_threshold": config["score_threshold"]},
+        )
+    else:
+        vector_retriever = db.as_retriever(search_type="similarity", search_kwargs={"k": K_MAX * 2})
+
+    if config["retrieval"] == "vector":
+        return vector_retriever, len(docs)
+
+    bm25 = BM25Index()
+    bm25.add(ids, [Document(page_content=doc.page_content, metadata=doc.metadata) for doc in docs])
+    bm25.save(os.path.join(index_dir, "bm25_index.json"))
+    router = None
+    if config.get("route_sources"):
+        from source_router import SourceRouter
+
+        router = SourceRouter.from_bm25(bm25)
+    retriever = HybridRetriever(
+        vector_retriever=vector_retriever, bm25=bm25, k=K_MAX, fetch_k=K_MAX * 2, router=router
+    )
+    return retriever, len(docs)
+
+
+def is_relevant(doc, question):
+    evidence = question.get("evidence")
+    return doc.metadata.get("source") == question["source"] and (
+        not evidence or evidence.lower() in doc.page_content.lower()
+    )
+
+
+def run_config(name, config, documents_dir, questions, backend="hashing"):
+    """
+    在独立的子进程中运行一个配置，返回各项指标
+    配置被跳过或运行失败时不抛出异常，返回 {"config": ..., "skipped" 或 "error": 原因}
+    """
+    # spawn 启动的子进程需要自己把脚本目录加入模块搜索路径
+    if current_dir not in sys.path:
+        sys.path.insert(0, current_dir)
+    try:
+        return _run_config(name, config, documents_dir, questions, backend)
+    except ConfigSkipped as e:
+        return {"config": name, **config, "skipped": str(e)}
+    except Exception as e:
+        traceback.print_exc()
+        return {"config": name, **config, "error": f"{type(e).__name__}: {e}"}
+
+
+def _run_config(name, config, documents_dir, questions, backend):
+    index_dir = tempfile.mkdtemp(prefix="rag_bench_")
+    try:
+        start = time.perf_counter()
+        retriever, chunks = build_index(config, documents_dir, index_dir, backend)
+        build_seconds = time.perf_counter() - start
+        index_bytes = directory_size(index_dir)
+
+        retriever.invoke("warm up")  # 第一次查询会加载索引，不计入延迟
+        latencies = []
+        hits = {k: 0 for k in RECALL_AT}
+        source_hits = 0
+        reciprocal_ranks = []
+        for question in questions:
+            start = time.perf_counter()
+            results = retriever.invoke(question["question"])[:K_MAX]
+            latencies.append(time.perf_counter() - start)
+            ranks = [rank for rank, doc in enumerate(results, 1) if is_relevant(doc, question)]
+            first = ranks[0] if ranks else None
+            for k in RECALL_AT:
+                hits[k] += first is not None and first <= k
+            reciprocal_ranks.append(1.0 / first if first else 0.0)
+            source_hits += any(doc.metadata.get("source") == question["source"] for doc in results)
+
+        n = len(questions)
+        return {
+            "config": name,
+            **config,
+            "chunks": chunks,
+            **{f"recall@{k}": hits[k] / n for k in RECALL_AT},
+            f"source@{K_MAX}": source_hits / n,
+            "mrr": float(np.mean(reciprocal_ranks)),
+            "p50_ms": float(np.percentile(latencies, 50) * 1000),
+            "p95_ms": float(np.percentile(latencies, 95) * 1000),
+            "build_seconds": build_seconds,
+            "index_mb": index_bytes / (1024 * 1024),
+            "peak_rss_mb": peak_rss_mb(),
+        }
+    finally:
+        shutil.rmtree(index_dir, ignore_errors=True)
+
+
+def print_report(results):
+    header = (
+        f"{'config':<26} {'chunks':>6} {'R@1':>5} {'R@3':>5} {'R@5':>5} {'src@5':>6} {'MRR':>5} "
+        f"{'p50':>7} {'p95':>7} {'build':>7} {'index':>8} {'RSS':>7}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        if "skipped" in r or "error" in r:
+            status = f"skipped: {r['skipped']}" if "skipped" in r else f"FAILED: {r['error']}"
+            print(f"{r['config']:<26} {status}")
+            continue
+        rss = f"{r['peak_rss_mb']:5.0f}MB" if r["peak_rss_mb"] is not None else "    n/a"
+        print(
+            f"{r['config']:<26} {r['chunks']:6d} {r['recall@1']:5.2f} {r['recall@3']:5.2f} {r['recall@5']:5.2f} "
+            f"{r[f'source@{K_MAX}']:6.2f} {r['mrr']:5.2f} {r['p50_ms']:5.1f}ms {r['p95_ms']:5.1f}ms "
+            f"{r['build_seconds']:6.2f}s {r['index_mb']:6.1f}MB {rss}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark retrieval quality and latency offline")
+    parser.add_argument("--documents", default=DEFAULT_DOCUMENTS)
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS)
+    parser.add_argument("--embedding-backend", default="hashing", help="openai, hashing or huggingface")
+    parser.add_argument("--configs", help="comma-separated config names (default: all except score thresholds)")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--in-process", action="store_true", help="run every config in this process (RSS is cumulative)")
+    parser.add_argument("--list", action="store_true", help="list the available configs")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, config in CONFIGS.items():
+            default = " (default)" if name in DEFAULT_CONFIGS else ""
+            print(f"{name:<26} {config}{default}")
+        sys.exit(0)
+
+    names = args.configs.split(",") if args.configs else DEFAULT_CONFIGS
+    unknown = [name for name in names if name not in CONFIGS]
+    if unknown:
+        parser.error(f"unknown configs: {', '.join(unknown)} (see --list)")
+    questions = load_questions(args.questions)
+    print(f"{len(questions)} questions, {len(names)} configs, k={K_MAX}, embedding backend: {args.embedding_backend}\n")
+
+    results = []
+    for name in names:
+        if args.in_process:
+            results.append(run_config(name, CONFIGS[name], args.documents, questions, args.embedding_backend))
+        else:
+            # 每个配置一个新的 spawn 子进程，峰值 RSS 只反映这个配置
+            # run_config 自己捕获异常；子进程崩溃（例如内存不足被杀掉）时在这里记录失败
+            try:
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                    results.append(
+                        executor.submit(
+                            run_config, name, CONFIGS[name], args.documents, questions, args.embedding_backend
+                        ).result()
+                    )
+            except Exception as e:
+                results.append({"config": name, **CONFIGS[name], "error": f"{type(e).__name__}: {e}"})
+        print(f"finished {name}", file=sys.stderr)
+
+    print_report(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if any("error" in r for r in results):
+        sys.exit(1)
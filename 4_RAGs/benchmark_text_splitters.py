@@ -0,0 +1,86 @@
+# 文本分割器基准测试：CharacterTextSplitter vs 按 token 分割的 LangChain 分割器 vs SentenceTokenSplitter
+#
+# 用 documents/Dracula.txt（可以用 --copies 复制多份，模拟几 MB 的大文件）比较：
+# - 耗时（重复 3 次取最快的一次）
+# - 块数、每块 token 数的中位数和最大值、超出 token 预算的块数
+# - 在句子或段落边界处结束的块的比例
+# CharacterTextSplitter 按字符计算大小，不做分词，所以最快，但块的 token 数不受控制；
+# 其余三个都按 token 计算，可以直接比较。
+#
+# 使用方法：
+#   python 4_RAGs/benchmark_text_splitters.py
+#   python 4_RAGs/benchmark_text_splitters.py --copies 4 --chunk-size 512
+
+import argparse
+import logging
+import os
+import time
+
+import numpy as np
+from langchain.text_splitter import CharacterTextSplitter, RecursiveCharacterTextSplitter
+
+from context_packing import get_encoder
+from sentence_token_splitter import SentenceTokenSplitter
+
+# CharacterTextSplitter 遇到超长段落时会逐条打印警告
+logging.getLogger("langchain_text_splitters.base").setLevel(logging.ERROR)
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+parser = argparse.ArgumentParser(description="Benchmark text splitters on a large book")
+parser.add_argument("--file", default=os.path.join(current_dir, "documents", "Dracula.txt"))
+parser.add_argument("--copies", type=int, default=1, help="concatenate the file this many times")
+parser.add_argument("--chunk-size", type=int, default=256, help="token budget per chunk")
+parser.add_argument("--repeat", type=int, default=3)
+args = parser.parse_args()
+
+with open(args.file, "r", encoding="utf-8") as f:
+    text = f.read()
+text = "\n\n".join([text] * args.copies)
+print(f"{os.path.basename(args.file)} x{args.copies}: {len(text) / 1e6:.2f}M characters, token budget {args.chunk_size}")
+
+encoder = get_encoder()
+splitters = {
+    "CharacterTextSplitter (1000 chars)": CharacterTextSplitter(chunk_size=1000, chunk_overlap=50),
+    "CharacterTextSplitter.from_tiktoken_encoder": CharacterTextSplitter.from_tiktoken_encoder(
+        encoding_name=encoder.name, chunk_size=args.chunk_size, chunk_overlap=0
+    ),
+    "RecursiveCharacterTextSplitter.from_tiktoken_encoder": RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+        encoding_name=encoder.name, chunk_size=args.chunk_size, chunk_overlap=0
+    ),
+    "SentenceTokenSplitter": SentenceTokenSplitter(chunk_size=args.chunk_size, chunk_overlap=0),
+}
+
+# 预热：SentenceTokenSplitter 第一次使用时为词表建立 token 字符数表（每个进程一次）
+start = time.perf_counter()
+splitters["SentenceTokenSplitter"].split_text("Warm up. " * 100)
+print(f"SentenceTokenSplitter one-off warm-up: {(time.perf_counter() - start) * 1000:.0f}ms\n")
+
+print(f"{'splitter':<54} {'time':>8} {'chunks':>7} {'p50 tok':>8} {'max tok':>8} {'over':>6} {'boundary':>9}")
+timings = {}
+for name, splitter in splitters.items():
+    best = float("inf")
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        chunks = splitter.split_text(text)
+        best = min(best, time.perf_counter() - start)
+    timings[name] = best
+
+    tokens = np.array([len(t) for t in encoder.encode_ordinary_batch(chunks)])
+    over = int((tokens > args.chunk_size).sum())
+    # 块以句末标点结束，或者后面紧跟空行（段落结束）
+    ends_on_boundary = 0
+    position = 0
+    for chunk in chunks:
+        position = text.find(chunk, position)
+        end = position + len(chunk)
+        if chunk[-1] in ".!?\"'”’)]" or end == len(text) or text.startswith("\n\n", end):
+            ends_on_boundary += 1
+    print(
+        f"{name:<54} {best * 1000:6.0f}ms {len(chunks):7d} {int(np.median(tokens)):8d} {tokens.max():8d} "
+        f"{over:6d} {ends_on_boundary / len(chunks):8.0%}"
+    )
+
+print()
+for name in ("CharacterTextSplitter.from_tiktoken_encoder", "RecursiveCharacterTextSplitter.from_tiktoken_encoder"):
+    print(f"SentenceTokenSplitter vs {name}: {timings[name] / timings['SentenceTokenSplitter']:.1f}x faster")
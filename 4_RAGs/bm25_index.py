@@ -0,0 +1,282 @@
+# BM25 词法索引 + 混合检索（倒排索引 + 向量检索，用倒数排名融合 RRF 合并）
+#
+# 1b / 2b / 3 的检索都是纯向量相似度搜索：
+# - "Gandalf"、"Dracula's castle" 这类精确名字查询，也必须先调用嵌入 API 把问题转成向量
+# - 向量检索对专有名词不敏感，有时排在前面的块里根本没有这个名字
+#
+# 这里在入库时同步构建一个 BM25 倒排索引，并持久化到磁盘（与向量数据库放在一起）：
+#   词 -> {块 ID: 词频}
+# 检索时：
+# - hybrid 模式：分别做 BM25 检索和向量检索，用 RRF（Reciprocal Rank Fusion）合并排名
+#     score(d) = Σ 1 / (rrf_k + rank_i(d))
+#   RRF 只依赖排名，不需要把 BM25 分数和余弦相似度归一化到同一个尺度
+#   两路各取 fetch_k 个候选再融合（向量检索器自己的 k 只在 vector 模式下使用），两边的候选数相同，
+#   不会因为一边候选多就在融合中占优
+#   向量检索器的 score_threshold（1b / 2b 的 similarity_score_threshold）只作用于向量这一路：
+#   它是 [0, 1] 的相关性分数，BM25 分数没有上界、随语料变化，无法用同一个阈值比较。
+#   BM25 只返回至少包含一个查询词（去掉停用词后）的块，这本身就是词法这一路的相关性门槛
+# - lexical 模式：只做 BM25 检索，不调用嵌入 API，查询耗时在亚毫秒级
+# - auto 模式：查询只包含少量关键词、且每个词都在索引中出现过时走 lexical，否则走 hybrid
+#
+# 两路检索都支持按元数据过滤（例如只在 Dracula.txt 中检索），过滤条件使用 Chroma 的写法：
+#   {"source": "Dracula.txt"} 或 {"source": {"$in": ["Dracula.txt", "Frankenstein.txt"]}}
+# 配合 source_router.py，可以在检索之前自动判断问题涉及哪几本书。
+
+import json
+import math
+import os
+import re
+from collections import Counter
+from typing import Any, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+INDEX_VERSION = 1
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# 常见英文停用词，不参与索引和打分
+STOP_WORDS = frozenset(
+    """
+    a an and are as at be but by did do does for from had has have he her him his how i in is it
+    its me my not of on or s she so than that the their them then there they this to was we were
+    what when where which who whom why will with you your most
+    """.split()
+)
+
+
+def tokenize(text):
+    """小写化并切分为字母数字词，去掉停用词（"Dracula's" -> ["dracula"]）"""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOP_WORDS]
+
+
+def filter_values(condition):
+    """把一个字段的过滤条件（值、{"$eq": 值} 或 {"$in": [...]}）转换成允许的取值集合"""
+    if isinstance(condition, dict):
+        if "$in" in condition:
+            return set(condition["$in"])
+        if "$eq" in condition:
+            return {condition["$eq"]}
+        raise ValueError(f"Unsupported metadata filter: {condition}")
+    return {condition}
+
+
+class BM25Index:
+    """可增量更新、可持久化的 BM25 倒排索引"""
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}  # 词 -> {块 ID: 词频}
+        self.doc_len = {}  # 块 ID -> 词数
+        self.docs = {}  # 块 ID -> (文本, 元数据)
+        self.total_len = 0
+        self._metadata_index = None  # (字段, 取值) -> {块 ID}，第一次按元数据过滤时构建
+
+    def __len__(self):
+        return len(self.docs)
+
+    def add(self, ids, docs):
+        """加入（或替换）一批块"""
+        for chunk_id, doc in zip(ids, docs):
+            if chunk_id in self.docs:
+                self.remove([chunk_id])
+            terms = Counter(tokenize(doc.page_content))
+            for term, tf in terms.items():
+                self.postings.setdefault(term, {})[chunk_id] = tf
+            length = sum(terms.values())
+            self.doc_len[chunk_id] = length
+            self.total_len += length
+            self.docs[chunk_id] = (doc.page_content, dict(doc.metadata or {}))
+        self._metadata_index = None
+
+    def remove(self, ids):
+        """删除一批块，不存在的 ID 会被忽略"""
+        for chunk_id in ids:
+            if chunk_id not in self.docs:
+                continue
+            text, _ = self.docs.pop(chunk_id)
+            for term in set(tokenize(text)):
+                posting = self.postings.get(term)
+                if posting is not None:
+                    posting.pop(chunk_id, None)
+                    if not posting:
+                        del self.postings[term]
+            self.total_len -= self.doc_len.pop(chunk_id)
+        self._metadata_index = None
+
+    def idf(self, term):
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.docs) - df + 0.5) / (df + 0.5))
+
+    def matching_ids(self, filter):
+        """满足元数据过滤条件的块 ID 集合（按 (字段, 取值) 预先建好的索引求交集）"""
+        if self._metadata_index is None:
+            self._metadata_index = {}
+            for chunk_id, (_, metadata) in self.docs.items():
+                for key, value in metadata.items():
+                    self._metadata_index.setdefault((key, value), set()).add(chunk_id)
+        allowed = None
+        for key, condition in filter.items():
+            ids = set()
+            for value in filter_values(condition):
+                ids |= self._metadata_index.get((key, value), set())
+            allowed = ids if allowed is None else allowed & ids
+        return allowed
+
+    def search(self, query, k=4, filter=None):
+        """返回 [(Document, BM25 分数)]，按分数从高到低排列；filter 为元数据过滤条件"""
+        if not self.docs:
+            return []
+        allowed = self.matching_ids(filter) if filter else None
+        avg_len = self.total_len / len(self.docs) or 1.0
+        scores = {}
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = self.idf(term)
+            for chunk_id, tf in posting.items():
+                if allowed is not None and chunk_id not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.doc_len[chunk_id] / avg_len)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.document(chunk_id), score) for chunk_id, score in top]
+
+    def document(self, chunk_id):
+        text, metadata = self.docs[chunk_id]
+        return Document(page_content=text, metadata=dict(metadata), id=chunk_id)
+
+    def covers(self, query):
+        """查询中的每个词是否都在索引中出现过"""
+        terms = tokenize(query)
+        return bool(terms) and all(term in self.postings for term in terms)
+
+    def save(self, path):
+        """以 JSON 持久化（先写临时文件再替换）"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        payload = {
+            "version": INDEX_VERSION,
+            "k1": self.k1,
+            "b": self.b,
+            "docs": {chunk_id: [text, metadata] for chunk_id, (text, metadata) in self.docs.items()},
+            "doc_len": self.doc_len,
+            "postings": self.postings,
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        if payload.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported BM25 index version {payload.get('version')} in {path}.")
+        index = cls(k1=payload["k1"], b=payload["b"])
+        index.docs = {chunk_id: (text, metadata) for chunk_id, (text, metadata) in payload["docs"].items()}
+        index.doc_len = payload["doc_len"]
+        index.postings = payload["postings"]
+        index.total_len = sum(index.doc_len.values())
+        return index
+
+    @classmethod
+    def from_vector_store(cls, db):
+        """从已有的 Chroma 向量库中读出所有块来构建索引（用于给旧数据库补建索引）"""
+        index = cls()
+        existing = db.get(include=["documents", "metadatas"])
+        index.add(
+            existing["ids"],
+            [
+                Document(page_content=text, metadata=metadata or {})
+                for text, metadata in zip(existing["documents"], existing["metadatas"])
+            ],
+        )
+        return index
+
+
+def reciprocal_rank_fusion(result_lists, k, rrf_k=60):
+    """用 RRF 合并多个排好序的文档列表，以文本内容作为同一块的判断依据"""
+    scores = {}
+    docs = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, 1):
+            key = doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            docs.setdefault(key, doc)
+    ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [docs[key] for key in ranked]
+
+
+class HybridRetriever(BaseRetriever):
+    """BM25 + 向量检索的混合检索器，可以直接替换 db.as_retriever(...) 的结果"""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vector_retriever: BaseRetriever
+    bm25: Any
+    k: int = 3
+    fetch_k: int = 10  # 每一路检索各取多少个候选再做融合（两路相同）
+    rrf_k: int = 60
+    mode: str = "hybrid"  # hybrid / lexical / vector / auto
+    lexical_max_terms: int = 3  # auto 模式下，关键词不超过这么多个才走纯词法检索
+    filter: Optional[dict] = None  # 固定的元数据过滤条件，例如 {"source": "Dracula.txt"}
+    router: Any = None  # 可选的 SourceRouter：每个查询先判断涉及哪些来源，再只在这些来源中检索
+
+    def _resolve_mode(self, query):
+        if self.mode != "auto":
+            return self.mode
+        if len(tokenize(query)) <= self.lexical_max_terms and self.bm25.covers(query):
+            return "lexical"
+        return "hybrid"
+
+    def _resolve_filter(self, query, filter):
+        """调用时传入的 filter 优先，其次是固定的 filter，最后由 router 按查询自动选择来源"""
+        if filter is not None:
+            return filter
+        if self.filter is not None:
+            return self.filter
+        if self.router is not None:
+            return self.router.filter_for(query)
+        return None
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun, filter: Optional[dict] = None
+    ) -> List[Document]:
+        mode = self._resolve_mode(query)
+        filter = self._resolve_filter(query, filter)
+        # 向量检索器（Chroma / NumpyVectorStore 的 as_retriever）会把 filter 合并进 search_kwargs
+        vector_kwargs = {"filter": filter} if filter else {}
+        if mode == "vector":
+            return self.vector_retriever.invoke(query, **vector_kwargs)[: self.k]
+
+        lexical = [doc for doc, _ in self.bm25.search(query, k=self.fetch_k, filter=filter)]
+        if mode == "lexical":
+            # 纯词法检索：不调用嵌入 API
+            return lexical[: self.k]
+
+        # 向量这一路也取 fetch_k 个候选（覆盖检索器自己的 k），与 BM25 这一路对等；
+        # score_threshold 仍然由向量检索器应用，BM25 候选不受它影响（原因见文件开头）
+        vector = self.vector_retriever.invoke(query, k=self.fetch_k, **vector_kwargs)
+        return reciprocal_rank_fusion([lexical, vector], k=self.k, rrf_k=self.rrf_k)
+
+
+def hybrid_or_vector_retriever(vector_retriever, index_path, route_sources=False, **kwargs):
+    """
+    索引文件存在时返回混合检索器，否则退回到原来的向量检索器（例如还没有重新运行入库脚本）
+    route_sources=True 时用 BM25 索引中每个来源的词频构建 SourceRouter（见 source_router.py）
+    """
+    if not os.path.exists(index_path):
+        print(f"BM25 index not found at {index_path}; using vector search only.")
+        return vector_retriever
+    bm25 = BM25Index.load(index_path)
+    if route_sources:
+        from source_router import SourceRouter
+
+        kwargs["router"] = SourceRouter.from_bm25(bm25)
+    return HybridRetriever(vector_retriever=vector_retriever, bm25=bm25, **kwargs)
@@ -0,0 +1,109 @@
+# 按 token 预算组装 RAG 上下文
+#
+# 3_rag_one_off_question.py 原来直接把 top-k 个块的 page_content 整段拼进 combined_input，
+# 从来不检查长度：块一多、一长，提示就会超出模型的上下文窗口，或者白白多花很多 token。
+#
+# pack_context 在拼接之前做三件事：
+# 1. 去重：完全相同、或被另一个块完整包含的块直接丢弃；
+#    与前一个块首尾重叠的部分（chunk_overlap 产生的）会被裁掉，不重复发送
+# 2. 按排名（或传入的分数）从高到低依次放入，直到用完 budget_tokens
+# 3. 放不下的第一个块，如果剩余预算还不少于 min_chunk_tokens，就按 token 截断后放入；
+#    其余排名更低的块丢弃
+# 最后返回实际使用的 token 数等统计信息。
+#
+# token 数用 tiktoken 计算（token_calculation.py 演示过它的基本用法），
+# 编码器和 count_tokens 来自 1_chat_models/token_counter.py：按模型名缓存，整个进程只创建一次。
+
+import os
+import sys
+
+from langchain_core.documents import Document
+
+# token_counter.py 在 1_chat_models 目录下；追加在搜索路径末尾，不会遮盖本目录的模块
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "1_chat_models"))
+from token_counter import DEFAULT_MODEL, count_tokens, get_encoder  # noqa: E402
+
+# 首尾重叠至少这么多个字符才认为是 chunk_overlap 造成的重叠
+_MIN_OVERLAP_CHARS = 20
+
+
+def _overlap_length(previous, current, max_overlap=1000):
+    """previous 的结尾与 current 的开头重叠的字符数"""
+    limit = min(len(previous), len(current), max_overlap)
+    for size in range(limit, _MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(current[:size]):
+            return size
+    return 0
+
+
+def _dedupe(docs):
+    """去掉重复和被包含的块，并裁掉与同来源已选块首尾重叠的部分"""
+    kept = []
+    removed = 0
+    for doc in docs:
+        text = doc.page_content
+        source = doc.metadata.get("source")
+        same_source = [k.page_content for k in kept if k.metadata.get("source") == source]
+        if any(text in other for other in same_source):
+            removed += 1
+            continue
+        overlap = max((_overlap_length(other, text) for other in same_source), default=0)
+        if overlap:
+            doc = Document(page_content=text[overlap:], metadata=doc.metadata, id=doc.id)
+        kept.append(doc)
+    return kept, removed
+
+
+def pack_context(docs, budget_tokens, scores=None, model=DEFAULT_MODEL, min_chunk_tokens=50):
+    """
+    在 token 预算内挑选并裁剪检索到的块
+
+    参数:
+        docs: 检索到的文档列表，默认认为已按相关性从高到低排列
+        budget_tokens: 上下文部分可以使用的最大 token 数
+        scores: 可选的相关性分数（越大越相关），提供时按分数重新排序
+        model: 用于选择 tiktoken 编码器的模型名
+        min_chunk_tokens: 截断后的块少于这么多 token 就不再放入
+    返回:
+        (放入的文档列表, 统计信息字典)
+    """
+    if scores is not None:
+        docs = [doc for _, doc in sorted(zip(scores, docs), key=lambda pair: pair[0], reverse=True)]
+    docs, deduped = _dedupe(list(docs))
+
+    encoder = get_encoder(model)
+    packed = []
+    used = 0
+    trimmed = 0
+    dropped = 0
+    # 块与块之间用 "\n\n" 连接，这部分也要计入预算
+    separator_tokens = count_tokens("\n\n", model)
+
+    for doc in docs:
+        # encode_ordinary：块中出现 <|endoftext|> 之类的特殊标记文本时按普通文本编码，不会报错
+        tokens = encoder.encode_ordinary(doc.page_content)
+        cost = len(tokens) + (separator_tokens if packed else 0)
+        if used + cost <= budget_tokens:
+            packed.append(doc)
+            used += cost
+            continue
+        remaining = budget_tokens - used - (separator_tokens if packed else 0)
+        if remaining >= min_chunk_tokens and not trimmed:
+            # 只截断第一个放不下的块，排名更低的直接丢弃
+            text = encoder.decode(tokens[:remaining])
+            packed.append(Document(page_content=text, metadata=doc.metadata, id=doc.id))
+            used += remaining + (separator_tokens if len(packed) > 1 else 0)
+            trimmed += 1
+        else:
+            dropped += 1
+
+    report = {
+        "budget_tokens": budget_tokens,
+        "tokens_used": used,
+        "docs_in": len(docs) + deduped,
+        "docs_packed": len(packed),
+        "deduped": deduped,
+        "trimmed": trimmed,
+        "dropped": dropped,
+    }
+    return packed, report
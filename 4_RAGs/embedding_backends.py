@@ -0,0 +1,145 @@
+# 可切换的嵌入后端：通过配置选择 OpenAI、本地哈希或本地小模型，并在索引中记录使用的后端
+#
+# 之前所有 RAG 脚本都写死了 OpenAIEmbeddings(model="text-embedding-3-small")：
+# 构建索引和每次查询都要访问网络、需要 API 密钥、按调用计费，离线环境完全无法运行。
+#
+# 后端由环境变量选择（调用了 load_dotenv() 的脚本也可以写在 .env 中）：
+#   EMBEDDING_BACKEND=openai       默认，OpenAIEmbeddings，向量缓存在本地 SQLite（见 embedding_cache.py）
+#   EMBEDDING_BACKEND=hashing      local_embeddings.HashingEmbeddings：纯 NumPy、不访问网络、完全可复现
+#   EMBEDDING_BACKEND=huggingface  本地 sentence-transformers 小模型，在 CPU 上运行
+#                                  （可选依赖：pip install langchain-huggingface sentence-transformers，
+#                                  第一次使用时需要下载模型，之后可以离线运行）
+#   EMBEDDING_MODEL=...            可选，覆盖后端的默认模型名（hashing 后端不使用）
+#
+# 不同后端（或同一后端的不同模型、维度）产生的向量互不可比：用哈希向量去查询 OpenAI 向量构建的索引，
+# 维度相同时不会报错，只会静默地返回毫无关系的结果。所以构建索引时把后端写进索引目录下的
+# embedding_backend.json：
+# {
+#     "version": 1,
+#     "backend": "hashing",
+#     "model": "feature-hashing-v1-s0:512"
+# }
+# 打开索引时与当前配置比较，不一致就拒绝加载（ValueError），提示删除索引重建或者改回原来的配置。
+# 没有这个文件的旧索引是之前用 OpenAI text-embedding-3-small 构建的，按它处理。
+
+import json
+import os
+
+from embedding_cache import CachedEmbeddings, model_name_of
+
+BACKEND_FILE = "embedding_backend.json"
+BACKEND_VERSION = 1
+
+DEFAULT_BACKEND = "openai"
+DEFAULT_MODELS = {
+    "openai": "text-embedding-3-small",
+    "huggingface": "sentence-transformers/all-MiniLM-L6-v2",
+}
+BACKENDS = ("openai", "hashing", "huggingface")
+# 嵌入模型类名 -> 后端名
+_BACKEND_CLASSES = {
+    "OpenAIEmbeddings": "openai",
+    "HashingEmbeddings": "hashing",
+    "HuggingFaceEmbeddings": "huggingface",
+}
+
+# 没有 embedding_backend.json 的旧索引使用的后端
+LEGACY_BACKEND = {"backend": "openai", "model": DEFAULT_MODELS["openai"]}
+
+
+def configured_backend():
+    """当前配置的后端名（EMBEDDING_BACKEND，默认 openai）"""
+    backend = os.getenv("EMBEDDING_BACKEND", DEFAULT_BACKEND).strip().lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND {backend!r}; expected one of {', '.join(BACKENDS)}.")
+    return backend
+
+
+def create_embeddings(backend=None, model=None):
+    """创建后端对应的 Embeddings 实例（不带缓存）"""
+    backend = backend or configured_backend()
+    model = model or os.getenv("EMBEDDING_MODEL") or DEFAULT_MODELS.get(backend)
+    if backend == "openai":
+        from langchain_openai import OpenAIEmbeddings
+
+        return OpenAIEmbeddings(model=model)
+    if backend == "hashing":
+        from local_embeddings import HashingEmbeddings
+
+        return HashingEmbeddings()
+    if backend == "huggingface":
+        try:
+            from langchain_huggingface import HuggingFaceEmbeddings
+        except ImportError as e:
+            raise ImportError(
+                "EMBEDDING_BACKEND=huggingface requires: pip install langchain-huggingface sentence-transformers"
+            ) from e
+        return HuggingFaceEmbeddings(model_name=model, encode_kwargs={"normalize_embeddings": True})
+    raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {', '.join(BACKENDS)}.")
+
+
+def get_embeddings(cache_path, backend=None, model=None):
+    """
+    按配置创建嵌入模型，RAG 脚本统一从这里获取
+
+    参数:
+        cache_path: 嵌入向量缓存（SQLite）的路径，openai / huggingface 后端使用
+        backend / model: 覆盖 EMBEDDING_BACKEND / EMBEDDING_MODEL
+    """
+    backend = backend or configured_backend()
+    embeddings = create_embeddings(backend, model)
+    if backend == "hashing":
+        # 哈希嵌入直接计算比查 SQLite 缓存还快，不需要缓存
+        return embeddings
+    return CachedEmbeddings(embeddings, cache_path=cache_path)
+
+
+def backend_of(embeddings):
+    """嵌入模型的后端描述：{"backend": ..., "model": ...}，model 与嵌入缓存使用的模型名相同"""
+    underlying = getattr(embeddings, "underlying", embeddings)
+    name = type(underlying).__name__
+    return {"backend": _BACKEND_CLASSES.get(name, name), "model": model_name_of(underlying)}
+
+
+def index_backend_path(index_directory):
+    return os.path.join(index_directory, BACKEND_FILE)
+
+
+def load_index_backend(index_directory):
+    """读取索引记录的后端；索引目录不存在时返回 None，旧索引没有记录时返回 LEGACY_BACKEND"""
+    if not os.path.isdir(index_directory):
+        return None
+    path = index_backend_path(index_directory)
+    if not os.path.exists(path):
+        return dict(LEGACY_BACKEND)
+    with open(path, "r", encoding="utf-8") as f:
+        record = json.load(f)
+    if record.get("version") != BACKEND_VERSION:
+        raise ValueError(f"Unsupported embedding backend record version {record.get('version')} in {path}.")
+    return {"backend": record["backend"], "model": record["model"]}
+
+
+def check_index_backend(index_directory, embeddings):
+    """
+    确认索引是用当前的嵌入后端构建的，不一致时抛出 ValueError
+    索引目录还不存在时直接通过（将要新建）
+    """
+    recorded = load_index_backend(index_directory)
+    current = backend_of(embeddings)
+    if recorded is not None and recorded != current:
+        raise ValueError(
+            f"Index {index_directory} was built with embedding backend {recorded['backend']} "
+            f"({recorded['model']}), but the configured backend is {current['backend']} ({current['model']}). "
+            f"Set EMBEDDING_BACKEND={recorded['backend']} or delete the index and rebuild it."
+        )
+    return current
+
+
+def record_index_backend(index_directory, embeddings):
+    """把嵌入后端写入索引目录（先写临时文件再替换）"""
+    os.makedirs(index_directory, exist_ok=True)
+    path = index_backend_path(index_directory)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": BACKEND_VERSION, **backend_of(embeddings)}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
@@ -0,0 +1,161 @@
+# 嵌入缓存：把嵌入向量持久化到本地 SQLite，重复的文本不再调用嵌入 API
+#
+# 之前每个 RAG 脚本都直接使用 OpenAIEmbeddings(model="text-embedding-3-small")：
+# - 1b / 2b / 3 每次运行都会重新嵌入同一个问题
+# - 1a / 2a 每次重建都会重新嵌入内容没有变化的块
+#
+# CachedEmbeddings 包装任意 Embeddings 实例：
+# - 缓存键是 (模型名, 文本的 sha256)，不同模型的向量互不干扰
+# - 向量以 float32 二进制（BLOB）存储，1536 维的向量只占 6KB，比 JSON 紧凑得多；
+#   未命中时新计算的向量也先转成 float32 再返回，同一段文本无论是否命中缓存，得到的向量完全相同
+# - 记录最近访问时间，条目数超过 max_entries 时按 LRU 淘汰最久未使用的向量
+# - 同一批文本只用一次 SQL 查询取回，未命中的文本再一次性交给底层模型
+#
+# 注意：OpenAI 的嵌入模型对查询和文档使用同一种向量，所以查询和文档共用一个缓存；
+# 如果底层模型对查询和文档做了不同处理，请设置 separate_query_cache=True。
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+# SQLite 单条语句的参数个数有上限，批量查询时按这个大小分段
+_SQL_BATCH = 500
+
+
+def _text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+
+def _to_blob(vector):
+    return array("f", vector).tobytes()
+
+
+def _from_blob(blob):
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+def model_name_of(embeddings):
+    """从嵌入模型实例中推断缓存用的模型名，包含维度参数（如果有）"""
+    name = getattr(embeddings, "model", None) or getattr(embeddings, "model_name", None)
+    name = name or type(embeddings).__name__
+    dimensions = getattr(embeddings, "dimensions", None)
+    return f"{name}:{dimensions}" if dimensions else name
+
+
+class CachedEmbeddings(Embeddings):
+    """带本地 SQLite 缓存的嵌入模型包装器"""
+
+    def __init__(
+        self,
+        underlying,
+        cache_path,
+        model_name=None,
+        max_entries=200_000,
+        separate_query_cache=False,
+    ):
+        self.underlying = underlying
+        self.model_name = model_name or model_name_of(underlying)
+        self.max_entries = max_entries
+        self.separate_query_cache = separate_query_cache
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+        # 批量嵌入时会有多个线程同时访问缓存，用一把锁保护连接
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash BLOB NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)"
+        )
+        self._conn.commit()
+
+    def _lookup(self, model, hashes):
+        """批量查询缓存，返回 {text_hash: vector}，并刷新命中条目的访问时间"""
+        found = {}
+        with self._lock:
+            for i in range(0, len(hashes), _SQL_BATCH):
+                part = hashes[i:i + _SQL_BATCH]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *part],
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[bytes(text_hash)] = _from_blob(blob)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, text_hash) for text_hash in found],
+                )
+                self._conn.commit()
+        return found
+
+    def _store(self, model, items):
+        """写入新向量（[(text_hash, blob)]），超出容量时淘汰最久未使用的条目"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_access) VALUES (?, ?, ?, ?)",
+                [(model, text_hash, blob, now) for text_hash, blob in items],
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if count > self.max_entries:
+                # 表是 WITHOUT ROWID 的，用 (model, text_hash) 主键定位要淘汰的行
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE (model, text_hash) IN "
+                    "(SELECT model, text_hash FROM embeddings ORDER BY last_access LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._conn.commit()
+
+    def _embed(self, model, texts, compute):
+        hashes = [_text_hash(text) for text in texts]
+        found = self._lookup(model, list(set(hashes)))
+
+        # 同一批中重复的文本只计算一次
+        missing = {}
+        for text_hash, text in zip(hashes, texts):
+            if text_hash not in found and text_hash not in missing:
+                missing[text_hash] = text
+        self.hits += len(texts) - sum(1 for h in hashes if h in missing)
+        self.misses += len(missing)
+
+        if missing:
+            vectors = compute(list(missing.values()))
+            blobs = [(text_hash, _to_blob(vector)) for text_hash, vector in zip(missing.keys(), vectors)]
+            self._store(model, blobs)
+            # 与命中时一样从 float32 解码，避免同一段文本因缓存状态不同而得到略有差异的向量
+            found.update((text_hash, _from_blob(blob)) for text_hash, blob in blobs)
+        return [found[text_hash] for text_hash in hashes]
+
+    def embed_documents(self, texts):
+        return self._embed(self.model_name, list(texts), self.underlying.embed_documents)
+
+    def embed_query(self, text):
+        model = f"{self.model_name}#query" if self.separate_query_cache else self.model_name
+        return self._embed(model, [text], lambda texts: [self.underlying.embed_query(texts[0])])[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
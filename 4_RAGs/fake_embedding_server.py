@@ -0,0 +1,133 @@
+# 本地假嵌入服务器：模拟 OpenAI 的 /v1/embeddings 接口
+#
+# 用途：在不花钱、不联网的情况下测试批量并发嵌入的吞吐量和限流退避逻辑
+# - 返回的向量由输入文本的哈希确定，同一文本每次都得到相同的向量
+# - --latency 模拟每个请求的网络/计算延迟
+# - --rate-limit 模拟每秒请求数上限，超过时返回 429 和 Retry-After 头
+#
+# 使用方法：
+#   python 4_RAGs/fake_embedding_server.py --port 8765 --latency 0.2
+# 然后把 OpenAIEmbeddings 指向它：
+#   OpenAIEmbeddings(model="text-embedding-3-small", base_url="http://127.0.0.1:8765/v1",
+#                    api_key="fake", check_embedding_ctx_length=False)
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_vector(value, dimensions):
+    """根据输入（字符串或 token 列表）生成确定性的单位向量"""
+    if not isinstance(value, str):
+        value = json.dumps(value)
+    seed = int.from_bytes(hashlib.sha256(value.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dimensions)]
+    norm = sum(x * x for x in vector) ** 0.5 or 1.0
+    return [x / norm for x in vector]
+
+
+class _RequestWindow:
+    """滑动一秒窗口内的请求计数，用于模拟限流"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.timestamps = []
+
+    def allow(self):
+        if not self.limit:
+            return True
+        now = time.monotonic()
+        with self.lock:
+            self.timestamps = [t for t in self.timestamps if now - t < 1.0]
+            if len(self.timestamps) >= self.limit:
+                return False
+            self.timestamps.append(now)
+            return True
+
+
+def make_handler(dimensions, latency, window):
+    class FakeEmbeddingHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            # 关闭默认的逐请求日志，避免刷屏影响基准测试
+            pass
+
+        def _send_json(self, status, payload, headers=None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/embeddings"):
+                self._send_json(404, {"error": {"message": "not found"}})
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+
+            if not window.allow():
+                self._send_json(
+                    429,
+                    {"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}},
+                    headers={"Retry-After": "1"},
+                )
+                return
+
+            if latency:
+                time.sleep(latency)
+
+            inputs = request.get("input", [])
+            if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+                inputs = [inputs]
+            dims = request.get("dimensions") or dimensions
+            data = [
+                {"object": "embedding", "index": i, "embedding": fake_vector(value, dims)}
+                for i, value in enumerate(inputs)
+            ]
+            self._send_json(
+                200,
+                {
+                    "object": "list",
+                    "data": data,
+                    "model": request.get("model", "fake-embedding"),
+                    "usage": {"prompt_tokens": 0, "total_tokens": 0},
+                },
+            )
+
+    return FakeEmbeddingHandler
+
+
+def start_server(host="127.0.0.1", port=0, dimensions=1536, latency=0.0, rate_limit=0):
+    """在后台线程中启动服务器，返回 (server, base_url)；port=0 表示自动选择空闲端口"""
+    handler = make_handler(dimensions, latency, _RequestWindow(rate_limit))
+    server = ThreadingHTTPServer((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible embedding server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds of simulated latency per request")
+    parser.add_argument("--rate-limit", type=int, default=0, help="max requests per second (0 = unlimited)")
+    args = parser.parse_args()
+
+    handler = make_handler(args.dimensions, args.latency, _RequestWindow(args.rate_limit))
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    print(f"Fake embedding server listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,207 @@
+# 增量索引：基于内容哈希的向量库增量更新
+#
+# 2a_rag_basics_metadata.py 原来的做法是：数据库目录不存在时才构建，一旦存在就跳过。
+# 这意味着新增或修改一本书，只能删掉整个数据库再把 documents/ 下所有文本重新向量化一遍。
+#
+# 这里的做法：
+# 1. 对每个源文件计算 sha256，文件没变就直接跳过（连加载和分割都省掉）
+# 2. 文件变了，就重新分割，并对每个块计算内容哈希，用它作为块的 ID
+# 3. 与上次记录的块 ID 做集合差：只向量化新增/修改的块，删除已经不存在的块
+# 4. 源文件被删除时，删除它对应的所有块
+#
+# 每次同步的状态记录在持久化目录下的 ingest_manifest.json 中：
+# {
+#     "version": 1,
+#     "files": {
+#         "Dracula.txt": {"sha256": "...", "chunk_ids": ["Dracula.txt::<hash>::0", ...]},
+#         ...
+#     }
+# }
+#
+# 这样重建的成本（以及嵌入 API 的花费）从 O(整个语料库) 降为 O(变化量)。
+
+import hashlib
+import json
+import os
+
+MANIFEST_FILE = "ingest_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_sha256(file_path, block_size=1 << 20):
+    """按块读取文件并计算 sha256，避免把大文件一次性读进内存"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def iter_chunk_ids(source, chunks):
+    """
+    为一个源文件的块逐个生成稳定的 ID，产出 (ID, 块)
+    ID 格式为 "<源文件>::<内容哈希>::<序号>"，序号用于区分同一文件里内容完全相同的块
+    块内容不变，ID 就不变；块内容一变，ID 就变，旧 ID 会被当作删除处理
+    """
+    seen = {}
+    for chunk in chunks:
+        content_hash = hashlib.sha256(chunk.page_content.encode("utf-8")).hexdigest()[:32]
+        n = seen.get(content_hash, 0)
+        seen[content_hash] = n + 1
+        yield f"{source}::{content_hash}::{n}", chunk
+
+
+def chunk_ids_for(source, chunks):
+    """为一个源文件的所有块生成稳定的 ID 列表"""
+    return [chunk_id for chunk_id, _ in iter_chunk_ids(source, chunks)]
+
+
+def manifest_path(persist_directory):
+    return os.path.join(persist_directory, MANIFEST_FILE)
+
+
+def load_manifest(persist_directory):
+    """读取清单文件，不存在时返回 None"""
+    path = manifest_path(persist_directory)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(
+            f"Unsupported manifest version {manifest.get('version')} in {path}."
+        )
+    return manifest
+
+
+def save_manifest(persist_directory, manifest):
+    """先写临时文件再替换，避免中途崩溃留下半个清单"""
+    os.makedirs(persist_directory, exist_ok=True)
+    path = manifest_path(persist_directory)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def manifest_from_existing_store(db):
+    """
+    为没有清单的旧数据库（例如用旧版 2a 构建的）生成一个清单
+    旧数据库里的块 ID 是随机 UUID，这里按 source 元数据分组记录下来，
+    文件哈希记为 None，这样第一次同步时每个文件都会被视为"已修改"，
+    旧块会被删除并替换成内容哈希 ID 的块（只需要这一次全量重建）
+    """
+    files = {}
+    existing = db.get(include=["metadatas"])
+    for chunk_id, metadata in zip(existing["ids"], existing["metadatas"]):
+        source = (metadata or {}).get("source", "")
+        entry = files.setdefault(source, {"sha256": None, "chunk_ids": []})
+        entry["chunk_ids"].append(chunk_id)
+    return {"version": MANIFEST_VERSION, "files": files}
+
+
+def sync_directory(
+    db,
+    books_dir,
+    persist_directory,
+    load_and_split,
+    extensions=(".txt",),
+    add_documents=None,
+    delete_documents=None,
+    flush_size=1000,
+):
+    """
+    将 books_dir 中的文件增量同步到向量数据库 db
+
+    参数:
+        db: 向量数据库（需要支持 get / add_documents / delete）
+        books_dir: 文档目录
+        persist_directory: 持久化目录，清单文件保存在这里
+        load_and_split: 函数 (file_path, source) -> 块的可迭代对象，负责加载和分割单个文件，
+            可以是生成器（例如 streaming_loader.stream_file_chunks），块会被流式处理
+        extensions: 需要处理的文件扩展名
+        add_documents: 可选的写入函数 (db, docs, ids) -> None，默认使用 db.add_documents，
+            可以换成 batch_embedding.add_documents_in_batches 实现批量并发嵌入
+        delete_documents: 可选的删除函数 (db, ids) -> None，默认使用 db.delete，
+            可以在删除向量的同时维护其他索引（例如 BM25 倒排索引）
+        flush_size: 新块攒够这么多就写入一次，内存中最多只保留这么多块的文本
+    返回:
+        统计信息字典
+    """
+    if add_documents is None:
+        def add_documents(db, docs, ids):
+            db.add_documents(docs, ids=ids)
+    if delete_documents is None:
+        def delete_documents(db, ids):
+            db.delete(ids=ids)
+
+    manifest = load_manifest(persist_directory)
+    if manifest is None:
+        manifest = manifest_from_existing_store(db)
+
+    stats = {
+        "files_unchanged": 0,
+        "files_changed": 0,
+        "files_removed": 0,
+        "chunks_added": 0,
+        "chunks_deleted": 0,
+        "chunks_kept": 0,
+    }
+
+    book_files = sorted(f for f in os.listdir(books_dir) if f.endswith(extensions))
+    current = set(book_files)
+
+    # 删除已经从目录中移除的文件对应的所有块
+    for source in sorted(set(manifest["files"]) - current):
+        stale_ids = manifest["files"][source]["chunk_ids"]
+        if stale_ids:
+            delete_documents(db, stale_ids)
+        stats["chunks_deleted"] += len(stale_ids)
+        stats["files_removed"] += 1
+        del manifest["files"][source]
+        save_manifest(persist_directory, manifest)
+
+    for book_file in book_files:
+        file_path = os.path.join(books_dir, book_file)
+        digest = file_sha256(file_path)
+        entry = manifest["files"].get(book_file)
+
+        # 文件内容没变：直接跳过，不加载、不分割、不向量化
+        if entry is not None and entry["sha256"] == digest:
+            stats["files_unchanged"] += 1
+            stats["chunks_kept"] += len(entry["chunk_ids"])
+            continue
+
+        old_ids = set(entry["chunk_ids"]) if entry is not None else set()
+        new_ids = []
+        pending = []
+        added = 0
+
+        # 边分割边写入：只有新出现的块需要向量化，攒够 flush_size 个就写一次
+        for chunk_id, chunk in iter_chunk_ids(book_file, load_and_split(file_path, book_file)):
+            new_ids.append(chunk_id)
+            if chunk_id not in old_ids:
+                pending.append((chunk_id, chunk))
+            if len(pending) >= flush_size:
+                add_documents(db, [c for _, c in pending], [i for i, _ in pending])
+                added += len(pending)
+                pending = []
+        if pending:
+            add_documents(db, [c for _, c in pending], [i for i, _ in pending])
+            added += len(pending)
+
+        # 集合差：不再出现的块需要删除
+        to_delete = list(old_ids - set(new_ids))
+        if to_delete:
+            delete_documents(db, to_delete)
+
+        stats["files_changed"] += 1
+        stats["chunks_deleted"] += len(to_delete)
+        stats["chunks_added"] += added
+        stats["chunks_kept"] += len(new_ids) - added
+
+        # 每处理完一个文件就保存清单，中途中断后下次可以从这里继续
+        manifest["files"][book_file] = {"sha256": digest, "chunk_ids": new_ids}
+        save_manifest(persist_directory, manifest)
+
+    return stats
@@ -0,0 +1,105 @@
+# 本地确定性嵌入模型：不访问网络、不需要 API 密钥，同样的文本在任何机器上得到完全相同的向量
+#
+# 用途：基准测试和 CI。OpenAIEmbeddings 需要网络和密钥，结果还会随模型更新而变化，
+# 不适合用来比较 k、score_threshold、chunk_size 这些参数；fake_embedding_server.py 返回的是随机向量，
+# 只能测吞吐量，测不了检索质量。
+#
+# HashingEmbeddings 使用特征哈希（feature hashing，也叫 hashing trick）：
+# - 文本按 bm25_index.tokenize 切词（小写、去停用词），特征是单词和相邻两词
+# - 每个特征用 crc32 哈希到 dimension 维中的一维，再用哈希的另一位决定符号（+1 / -1），减少冲突的影响
+#   （不用 Python 内置的 hash()：它对字符串的结果每次启动都不同）
+# - 词频取 1 + log(tf)，最后归一化为单位向量，余弦相似度就是点积
+# - 没有任何特征的文本（只有停用词、数字或标点）使用一个固定的占位特征，仍然是单位向量：
+#   如果返回零向量，在 Chroma 默认的 L2 距离下它与任何查询的距离都是 1，
+#   反而比真正相关的块（余弦相似度 0.2 时距离为 1.6）更"近"，会挤满检索结果
+# 它本质上是词袋模型，语义理解远不如真正的嵌入模型，但足够区分"哪本书、哪一段"，而且完全可复现。
+#
+# 批量嵌入时按 batch_size 分批：每批先收集所有 (行, 维度, 权重)，再用一次 np.bincount 累加成矩阵、
+# 一次按行归一化，不再逐个文本创建和归一化向量。
+# 作为 RAG 脚本的嵌入后端使用时见 embedding_backends.py（EMBEDDING_BACKEND=hashing）。
+
+import zlib
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from bm25_index import tokenize
+
+
+@lru_cache(maxsize=1 << 18)
+def _feature_slot(feature, dimension, seed):
+    """特征 -> (维度下标, 符号)"""
+    h = zlib.crc32(feature.encode("utf-8"), seed)
+    return h % dimension, 1.0 if (h >> 31) & 1 else -1.0
+
+
+# 没有任何特征的文本使用的占位特征（包含空格，不会与 tokenize 产生的单词冲突）
+_EMPTY_FEATURE = " empty "
+
+
+def _features(text):
+    words = tokenize(text)
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])] or [_EMPTY_FEATURE]
+
+
+class HashingEmbeddings(Embeddings):
+    """基于特征哈希的确定性词袋嵌入"""
+
+    def __init__(self, dimensions=512, seed=0, batch_size=1024):
+        """
+        参数:
+            dimensions: 向量维度
+            seed: 哈希种子，不同的种子得到不同（但同样确定）的向量
+            batch_size: 批量嵌入时每批的文本数
+        """
+        self.dimensions = dimensions
+        self.seed = seed
+        self.batch_size = batch_size
+        # 特征提取或加权方式改变时升级版本号，旧索引会因为模型名不同而被拒绝加载
+        self.model = f"feature-hashing-v1-s{seed}"
+
+    def _embed_batch(self, texts):
+        """返回 len(texts) x dimensions 的 float32 矩阵，每行是单位向量"""
+        rows, slots, weights = [], [], []
+        for row, text in enumerate(texts):
+            for feature, tf in Counter(_features(text)).items():
+                slot, sign = _feature_slot(feature, self.dimensions, self.seed)
+                rows.append(row)
+                slots.append(slot)
+                weights.append(sign * tf)
+        weights = np.asarray(weights, dtype=np.float64)
+        # 词频取 1 + log(tf)，符号保留
+        weights = np.sign(weights) * (1.0 + np.log(np.abs(weights)))
+        flat = np.asarray(rows, dtype=np.int64) * self.dimensions + np.asarray(slots, dtype=np.int64)
+        matrix = np.bincount(flat, weights=weights, minlength=len(texts) * self.dimensions)
+        matrix = matrix.reshape(len(texts), self.dimensions).astype(np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms > 0, norms, 1.0)
+
+    def embed_array(self, texts):
+        """批量嵌入，返回 NumPy 矩阵"""
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.dimensions), dtype=np.float32)
+        return np.vstack([self._embed_batch(texts[i:i + self.batch_size]) for i in range(0, len(texts), self.batch_size)])
+
+    def embed_documents(self, texts):
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text):
+        return self._embed_batch([text])[0].tolist()
+
+
+if __name__ == "__main__":
+    embeddings = HashingEmbeddings()
+    a, b, c = (
+        np.array(v)
+        for v in embeddings.embed_documents(
+            ["Dracula fears garlic and the crucifix.", "What does Dracula fear?", "Alice drank from the bottle."]
+        )
+    )
+    print(f"model={embeddings.model}, dimensions={embeddings.dimensions}")
+    print(f"similarity(dracula text, dracula question) = {a @ b:.3f}")
+    print(f"similarity(alice text, dracula question)   = {c @ b:.3f}")
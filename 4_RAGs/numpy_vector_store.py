@@ -0,0 +1,308 @@
+# 基于内存映射 NumPy 矩阵的本地向量存储
+#
+# 对于我们的语料规模（documents/ 下几千个块），Chroma 的 SQLite + HNSW 显得太重：
+# 每次运行脚本都要启动客户端、打开 SQLite、加载 HNSW 索引，查询还要经过好几层封装。
+#
+# NumpyVectorStore 的存储格式非常简单（一个目录）：
+#   vectors.npy     float32 矩阵 (块数, 维度)，每行已经归一化为单位向量
+#   metadata.jsonl  与矩阵逐行对齐：{"id": ..., "text": ..., "metadata": {...}}
+#   store.json      维度、块数等信息
+#   ivf.npz         可选的 IVF 分区（聚类中心 + 每个分区包含的行号）
+#
+# 查询时 vectors.npy 以内存映射（mmap）方式打开，几乎没有启动开销：
+# - 精确检索：一次矩阵-向量乘法得到所有余弦相似度，再用 argpartition 取 top-k
+# - IVF 检索：先和聚类中心比较，只在最近的 nprobe 个分区里做精确检索，适合更大的语料库
+#
+# 按元数据过滤（例如 filter={"source": "Dracula.txt"} 或 {"source": {"$in": [...]}}）时，
+# 使用加载时建好的元数据索引 (字段, 取值) -> 行号数组，相当于每个来源一个分区：
+# 只对这些行做精确检索，不再逐行检查元数据，检索范围按来源数缩小。
+#
+# 它实现了 LangChain 的 VectorStore 接口，所以和 Chroma 一样可以
+#   db.as_retriever(search_type="similarity" / "similarity_score_threshold", search_kwargs={...})
+# 为了让脚本中已有的 score_threshold 取值保持原来的含义，
+# similarity_search_with_score 返回的是与 Chroma 默认 L2 空间一致的平方欧氏距离（越小越相似），
+# 相关性分数的换算方式也与 Chroma 相同。
+
+import json
+import os
+import uuid
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from bm25_index import filter_values
+
+STORE_VERSION = 1
+VECTORS_FILE = "vectors.npy"
+METADATA_FILE = "metadata.jsonl"
+INFO_FILE = "store.json"
+IVF_FILE = "ivf.npz"
+
+
+def _normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _top_k(scores, k):
+    """从一维分数数组中取最大的 k 个的下标（按分数降序），不做全排序"""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    part = np.argpartition(-scores, k - 1)[:k]
+    return part[np.argsort(-scores[part])]
+
+
+class NumpyVectorStore(VectorStore):
+    """内存映射 float32 矩阵 + 对齐元数据文件的向量存储"""
+
+    def __init__(self, directory, embedding_function, nprobe=8):
+        self.directory = directory
+        self.embedding_function = embedding_function
+        self.nprobe = nprobe
+        self._load()
+
+    @property
+    def embeddings(self):
+        return self.embedding_function
+
+    # ===== 加载与保存 =====
+
+    def _load(self):
+        vectors_path = os.path.join(self.directory, VECTORS_FILE)
+        self.ids, self.texts, self.metadatas = [], [], []
+        self._row_of = {}
+        self.vectors = None
+        self.centroids = None
+        self.ivf_order = None
+        self.ivf_offsets = None
+        self._metadata_rows = None
+        if not os.path.exists(vectors_path):
+            return
+        # mmap_mode="r"：不把矩阵读进内存，由操作系统按需分页
+        self.vectors = np.load(vectors_path, mmap_mode="r")
+        with open(os.path.join(self.directory, METADATA_FILE), "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                self.ids.append(record["id"])
+                self.texts.append(record["text"])
+                self.metadatas.append(record["metadata"])
+        self._row_of = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        if len(self.ids) != self.vectors.shape[0]:
+            raise ValueError(
+                f"{METADATA_FILE} has {len(self.ids)} rows but {VECTORS_FILE} has {self.vectors.shape[0]}."
+            )
+        ivf_path = os.path.join(self.directory, IVF_FILE)
+        if os.path.exists(ivf_path):
+            ivf = np.load(ivf_path)
+            self.centroids = ivf["centroids"]
+            self.ivf_order = ivf["order"]
+            self.ivf_offsets = ivf["offsets"]
+
+    def _write(self, vectors, ids, texts, metadatas):
+        """整体重写存储目录（先写临时文件再替换），写完后重新以 mmap 方式打开"""
+        os.makedirs(self.directory, exist_ok=True)
+        vectors_path = os.path.join(self.directory, VECTORS_FILE)
+        metadata_path = os.path.join(self.directory, METADATA_FILE)
+        # 文件名以 .npy 结尾，np.save 不会再追加扩展名
+        np.save(vectors_path + ".tmp.npy", np.ascontiguousarray(vectors, dtype=np.float32))
+        with open(metadata_path + ".tmp", "w", encoding="utf-8") as f:
+            for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                f.write(json.dumps({"id": chunk_id, "text": text, "metadata": metadata}, ensure_ascii=False))
+                f.write("\n")
+        # 释放旧的内存映射后再替换文件
+        self.vectors = None
+        os.replace(vectors_path + ".tmp.npy", vectors_path)
+        os.replace(metadata_path + ".tmp", metadata_path)
+        with open(os.path.join(self.directory, INFO_FILE), "w", encoding="utf-8") as f:
+            json.dump(
+                {"version": STORE_VERSION, "count": len(ids), "dimension": int(vectors.shape[1])},
+                f,
+                indent=2,
+            )
+        # 数据变了，旧的 IVF 分区失效
+        ivf_path = os.path.join(self.directory, IVF_FILE)
+        if os.path.exists(ivf_path):
+            os.remove(ivf_path)
+        self._load()
+
+    # ===== 写入 =====
+
+    def add_embeddings(self, vectors, texts, metadatas=None, ids=None):
+        """写入已经计算好的向量（不调用嵌入模型），相同 ID 会被覆盖"""
+        texts = list(texts)
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in texts]
+        ids = list(ids) if ids is not None else [str(uuid.uuid4()) for _ in texts]
+        new_vectors = _normalize(vectors)
+
+        replaced = set(ids)
+        keep = [i for i, chunk_id in enumerate(self.ids) if chunk_id not in replaced]
+        if self.vectors is not None and keep:
+            old_vectors = np.asarray(self.vectors[keep])
+            all_vectors = np.vstack([old_vectors, new_vectors])
+        else:
+            all_vectors = new_vectors
+        self._write(
+            all_vectors,
+            [self.ids[i] for i in keep] + ids,
+            [self.texts[i] for i in keep] + texts,
+            [self.metadatas[i] for i in keep] + metadatas,
+        )
+        return ids
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        vectors = self.embedding_function.embed_documents(texts)
+        return self.add_embeddings(vectors, texts, metadatas=metadatas, ids=ids)
+
+    def delete(self, ids=None, **kwargs):
+        if not ids or self.vectors is None:
+            return False
+        removed = set(ids)
+        keep = [i for i, chunk_id in enumerate(self.ids) if chunk_id not in removed]
+        if len(keep) == len(self.ids):
+            return False
+        dimension = self.vectors.shape[1]
+        self._write(
+            np.asarray(self.vectors[keep]) if keep else np.empty((0, dimension), dtype=np.float32),
+            [self.ids[i] for i in keep],
+            [self.texts[i] for i in keep],
+            [self.metadatas[i] for i in keep],
+        )
+        return True
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, directory=None, **kwargs):
+        if directory is None:
+            raise ValueError("NumpyVectorStore.from_texts requires a directory.")
+        store = cls(directory, embedding, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+    @classmethod
+    def from_chroma(cls, chroma_db, directory, embedding_function, **kwargs):
+        """把已有 Chroma 库中的向量、文本和元数据原样导出，不需要重新调用嵌入 API"""
+        data = chroma_db.get(include=["embeddings", "documents", "metadatas"])
+        store = cls(directory, embedding_function, **kwargs)
+        store.add_embeddings(
+            np.asarray(data["embeddings"], dtype=np.float32),
+            data["documents"],
+            metadatas=[metadata or {} for metadata in data["metadatas"]],
+            ids=data["ids"],
+        )
+        return store
+
+    # ===== IVF 分区 =====
+
+    def build_ivf(self, n_lists=None, iterations=10, seed=0):
+        """
+        用球面 k-means 把所有向量分成 n_lists 个分区并保存
+        默认分区数约为 sqrt(块数)，查询时只扫描最近的 nprobe 个分区
+        """
+        n = len(self.ids)
+        if n == 0:
+            return
+        n_lists = n_lists or max(1, int(np.sqrt(n)))
+        vectors = np.asarray(self.vectors)
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(n, size=min(n_lists, n), replace=False)].copy()
+        for _ in range(iterations):
+            assignments = np.argmax(vectors @ centroids.T, axis=1)
+            for c in range(centroids.shape[0]):
+                members = vectors[assignments == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = _normalize(centroids)
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        # 按分区排序后的行号，以及每个分区在其中的起止位置
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.searchsorted(assignments[order], np.arange(centroids.shape[0] + 1))
+        np.savez(
+            os.path.join(self.directory, IVF_FILE), centroids=centroids, order=order, offsets=offsets
+        )
+        self.centroids, self.ivf_order, self.ivf_offsets = centroids, order, offsets
+
+    # ===== 查询 =====
+
+    def _candidate_rows(self, query_vector):
+        """IVF 存在时只返回最近 nprobe 个分区中的行号，否则返回 None 表示全量扫描"""
+        if self.centroids is None or self.nprobe >= self.centroids.shape[0]:
+            return None
+        nearest = _top_k(self.centroids @ query_vector, self.nprobe)
+        return np.concatenate(
+            [self.ivf_order[self.ivf_offsets[c]:self.ivf_offsets[c + 1]] for c in nearest]
+        )
+
+    def _filter_rows(self, filter):
+        """满足元数据过滤条件的行号（升序），用 (字段, 取值) -> 行号数组 的索引求并集/交集"""
+        if self._metadata_rows is None:
+            index = {}
+            for row, metadata in enumerate(self.metadatas):
+                for key, value in metadata.items():
+                    index.setdefault((key, value), []).append(row)
+            self._metadata_rows = {key: np.array(rows, dtype=np.int64) for key, rows in index.items()}
+        allowed = None
+        empty = np.empty(0, dtype=np.int64)
+        for key, condition in filter.items():
+            parts = [self._metadata_rows.get((key, value), empty) for value in filter_values(condition)]
+            rows = np.unique(np.concatenate(parts)) if parts else empty
+            allowed = rows if allowed is None else np.intersect1d(allowed, rows, assume_unique=True)
+        return allowed
+
+    def search_by_vector(self, query_vector, k=4, filter=None):
+        """返回 [(行号, 余弦相似度)]，按相似度降序"""
+        if self.vectors is None or len(self.ids) == 0:
+            return []
+        query_vector = _normalize(query_vector)
+        if filter:
+            # 过滤后的行就是一个分区，直接在其中做精确检索，不再经过 IVF
+            rows = self._filter_rows(filter)
+            if rows.size == 0:
+                return []
+        else:
+            rows = self._candidate_rows(query_vector)
+        if rows is None:
+            scores = self.vectors @ query_vector
+            best = _top_k(scores, k)
+            return [(int(row), float(scores[row])) for row in best]
+        # 行号排好序再读取，对内存映射文件的访问更接近顺序读
+        rows = np.sort(rows)
+        scores = self.vectors[rows] @ query_vector
+        best = _top_k(scores, k)
+        return [(int(rows[i]), float(scores[i])) for i in best]
+
+    def _document(self, row):
+        return Document(page_content=self.texts[row], metadata=dict(self.metadatas[row]), id=self.ids[row])
+
+    def similarity_search_with_score(self, query, k=4, filter=None, **kwargs):
+        """返回 [(Document, 平方欧氏距离)]，与 Chroma 默认的 L2 空间一致，越小越相似"""
+        query_vector = self.embedding_function.embed_query(query)
+        return [
+            (self._document(row), 2.0 - 2.0 * similarity)
+            for row, similarity in self.search_by_vector(query_vector, k=k, filter=filter)
+        ]
+
+    def similarity_search(self, query, k=4, filter=None, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def similarity_search_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        return [self._document(row) for row, _ in self.search_by_vector(embedding, k=k, filter=filter)]
+
+    def _select_relevance_score_fn(self):
+        # 与 Chroma 默认 L2 空间相同的换算：relevance = 1 - distance / sqrt(2)
+        return self._euclidean_relevance_score_fn
+
+    def get(self, ids=None, include=None, **kwargs):
+        """与 Chroma.get 返回格式相同的子集，方便复用增量入库等工具"""
+        if ids is None:
+            rows = list(range(len(self.ids)))
+        else:
+            rows = [self._row_of[chunk_id] for chunk_id in ids if chunk_id in self._row_of]
+        return {
+            "ids": [self.ids[row] for row in rows],
+            "documents": [self.texts[row] for row in rows],
+            "metadatas": [self.metadatas[row] for row in rows],
+        }
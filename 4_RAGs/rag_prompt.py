@@ -0,0 +1,27 @@
+# RAG 提示构建：把用户问题和检索到的文档组合成发送给模型的消息
+#
+# 3_rag_one_off_question.py 和 5_rag_query_service.py 使用同一套提示，
+# 放在这里避免两份提示文本慢慢变得不一致。
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+SYSTEM_PROMPT = "You are a helpful assistant."
+
+
+def build_combined_input(query, docs):
+    """将查询和相关文档内容组合成输入，这是 RAG 系统的核心：将检索到的文档与用户查询结合"""
+    return (
+        "Here are some documents that might help answer the question: "
+        + query
+        + "\n\nRelevant Documents:\n"
+        + "\n\n".join([doc.page_content for doc in docs])  # 将所有相关文档内容拼接
+        + "\n\nPlease provide a rough answer based only on the provided documents. If the answer is not found in the documents, respond with 'I'm not sure'."
+    )
+
+
+def build_messages(query, docs):
+    """使用系统消息和人类消息的标准格式定义发送给模型的消息"""
+    return [
+        SystemMessage(content=SYSTEM_PROMPT),  # 系统角色设定
+        HumanMessage(content=build_combined_input(query, docs)),  # 用户消息，包含查询和相关文档
+    ]
@@ -0,0 +1,181 @@
+# 语义答案缓存：相似的问题直接返回之前生成的回答，跳过检索和 LLM 调用
+#
+# 3_rag_one_off_question.py 每次运行都会：嵌入问题 -> 检索 k=3 个块 -> 拼接 combined_input -> 调用 ChatOpenAI。
+# 对于 FAQ 类的重复流量，大部分问题之前已经（几乎一字不差地）回答过，LLM 的延迟和费用完全可以省掉。
+#
+# SemanticAnswerCache 把每次回答记录为 (问题向量, 检索到的块 ID, 回答)，保存在本地 SQLite 中：
+# - 查询时计算新问题向量与所有缓存问题向量的余弦相似度（一次矩阵-向量乘法），
+#   最高分超过 threshold 就认为是"同一个问题"，直接返回缓存的回答
+# - ttl_seconds：条目超过这个时间就视为过期
+# - max_entries：条目数超过上限时按 LRU 淘汰最久未命中的条目
+# - 失效：块被重新入库（内容变化或文件删除）时，引用这些块 ID 的回答会被删除，
+#   见 invalidate_chunk_ids，2a 的增量入库在删除块时会调用它；
+#   2a 新建索引时（可能换了嵌入后端）会用 clear 清空整个缓存
+
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+
+def _normalize(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticAnswerCache:
+    """基于问题向量余弦相似度的答案缓存"""
+
+    def __init__(self, cache_path, threshold=0.95, ttl_seconds=7 * 24 * 3600, max_entries=1000):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+        self._conn = sqlite3.connect(cache_path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY,
+                query TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                doc_ids TEXT NOT NULL,
+                answer TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        # 块 ID -> 回答 的反向索引，用于按块失效
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS answer_chunks (
+                answer_id INTEGER NOT NULL REFERENCES answers (id) ON DELETE CASCADE,
+                chunk_id TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS answer_chunks_chunk_id ON answer_chunks (chunk_id)"
+        )
+        self._conn.commit()
+        self._load_matrix()
+
+    def _load_matrix(self):
+        """把所有缓存问题的向量读进内存，组成一个矩阵，查询时只需要一次矩阵-向量乘法"""
+        rows = self._conn.execute("SELECT id, embedding FROM answers ORDER BY id").fetchall()
+        self._ids = np.array([row[0] for row in rows], dtype=np.int64)
+        if rows:
+            self._matrix = np.vstack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+        else:
+            self._matrix = None
+
+    def __len__(self):
+        return len(self._ids)
+
+    def purge_expired(self):
+        """删除所有过期条目"""
+        if self.ttl_seconds is None:
+            return 0
+        cursor = self._conn.execute(
+            "DELETE FROM answers WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+        )
+        self._conn.commit()
+        if cursor.rowcount:
+            self._load_matrix()
+        return cursor.rowcount
+
+    def lookup(self, query_embedding, is_valid=None):
+        """
+        查找语义相同的问题，命中时返回 {"query", "answer", "doc_ids", "similarity"}，否则返回 None
+
+        参数:
+            query_embedding: 新问题的向量
+            is_valid: 可选的回调 (doc_ids) -> bool，用于确认缓存回答引用的块仍然存在于向量库中
+        """
+        self.purge_expired()
+        if self._matrix is None:
+            self.misses += 1
+            return None
+
+        similarities = self._matrix @ _normalize(query_embedding)
+        best = int(np.argmax(similarities))
+        similarity = float(similarities[best])
+        if similarity < self.threshold:
+            self.misses += 1
+            return None
+
+        answer_id = int(self._ids[best])
+        query, doc_ids, answer = self._conn.execute(
+            "SELECT query, doc_ids, answer FROM answers WHERE id = ?", (answer_id,)
+        ).fetchone()
+        doc_ids = json.loads(doc_ids)
+        if is_valid is not None and not is_valid(doc_ids):
+            # 引用的块已经不存在了（例如数据库被重建过），这个回答不再可信
+            self._delete([answer_id])
+            self.misses += 1
+            return None
+
+        self._conn.execute("UPDATE answers SET last_access = ? WHERE id = ?", (time.time(), answer_id))
+        self._conn.commit()
+        self.hits += 1
+        return {"query": query, "answer": answer, "doc_ids": doc_ids, "similarity": similarity}
+
+    def store(self, query, query_embedding, doc_ids, answer):
+        """保存一次回答，超出容量时淘汰最久未命中的条目"""
+        now = time.time()
+        cursor = self._conn.execute(
+            "INSERT INTO answers (query, embedding, doc_ids, answer, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+            (query, _normalize(query_embedding).tobytes(), json.dumps(doc_ids), answer, now, now),
+        )
+        self._conn.executemany(
+            "INSERT INTO answer_chunks (answer_id, chunk_id) VALUES (?, ?)",
+            [(cursor.lastrowid, chunk_id) for chunk_id in doc_ids],
+        )
+        count = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM answers WHERE id IN (SELECT id FROM answers ORDER BY last_access LIMIT ?)",
+                (count - self.max_entries,),
+            )
+        self._conn.commit()
+        self._load_matrix()
+
+    def invalidate_chunk_ids(self, chunk_ids):
+        """删除所有引用了这些块的回答，返回删除的条目数"""
+        chunk_ids = list(chunk_ids)
+        answer_ids = set()
+        for i in range(0, len(chunk_ids), 500):
+            part = chunk_ids[i:i + 500]
+            placeholders = ",".join("?" * len(part))
+            answer_ids.update(
+                row[0]
+                for row in self._conn.execute(
+                    f"SELECT answer_id FROM answer_chunks WHERE chunk_id IN ({placeholders})", part
+                )
+            )
+        if answer_ids:
+            self._delete(answer_ids)
+        return len(answer_ids)
+
+    def clear(self):
+        """删除所有回答（例如索引换了嵌入后端重建之后，缓存的问题向量不再可比），返回删除的条目数"""
+        cursor = self._conn.execute("DELETE FROM answers")
+        self._conn.commit()
+        self._load_matrix()
+        return cursor.rowcount
+
+    def _delete(self, answer_ids):
+        self._conn.executemany("DELETE FROM answers WHERE id = ?", [(answer_id,) for answer_id in answer_ids])
+        self._conn.commit()
+        self._load_matrix()
+
+    def close(self):
+        self._conn.close()
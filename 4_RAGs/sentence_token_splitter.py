@@ -0,0 +1,196 @@
+# 按 token 预算、在句子和段落边界处分割文本
+#
+# 1a / 2a 使用 CharacterTextSplitter(chunk_size=1000)：块的大小按字符计算，
+# 而嵌入模型和提示预算是按 token 计算的，同样 1000 个字符的块 token 数可能相差好几倍
+# （token_counter.py 统计 documents/ 时，chunk_size=1000 的块从几个 token 到 1200 个 token 都有）。
+# LangChain 的 from_tiktoken_encoder 版本虽然按 token 计算，但合并块的过程中会对每个片段反复编码，
+# 而且切分时会复制大量中间字符串，大文件很慢。
+#
+# SentenceTokenSplitter 的做法：
+# 1. 整个文本只编码一次：先在段落边界处切成若干大块，用 encode_ordinary_batch 在线程池中并行编码
+#    （tiktoken 编码时释放 GIL）
+# 2. 用 NumPy 把 token 映射回字符位置：预先为词表中每个 token 算好它包含的字符数（按编码器缓存），
+#    对 token 序列查表再做 cumsum，就得到每个 token 结束处的字符偏移，整个过程没有 Python 循环
+# 3. 用正则找到所有句子和段落的起始位置，再用 searchsorted 换算成 "这个位置之前有多少个 token"
+# 4. 贪心装箱：每个块尽量装满 chunk_size 个 token，并且只在句子边界处结束；
+#    如果块的后半部分有段落边界，优先在段落边界处结束
+# 5. 超过 chunk_size 的超长句子在它内部的空白处再切开
+# 所有中间结果都是偏移量，只有最后生成块时才对原文切片一次。
+#
+# 快速通道：整个文本不超过 chunk_size 个 token 时（例如 about_me.txt 这样的短文档），
+# 编码之后直接作为一个块返回，不再查找句子边界。
+#
+# 用法（与 LangChain 的文本分割器接口相同，可以直接替换 CharacterTextSplitter）：
+#   splitter = SentenceTokenSplitter(chunk_size=256, chunk_overlap=32)
+#   docs = splitter.split_documents(documents)
+#   spans = splitter.split_text_with_offsets(text)   # [(开始, 结束, token 数)]
+
+import os
+import re
+from bisect import bisect_right
+from functools import lru_cache
+
+import numpy as np
+from langchain.text_splitter import TextSplitter
+from langchain_core.documents import Document
+
+from context_packing import DEFAULT_MODEL, get_encoder
+
+# 句子结束：句末标点（可以跟引号、括号）之后的空白；段落结束：空行
+_BOUNDARY_RE = re.compile(r"[.!?]+[\"'”’)\]]*\s+|\n[ \t]*\n\s*")
+_PARAGRAPH_RE = re.compile(r"\n[ \t]*\n\s*")
+
+# 并行编码时每个大块的目标字符数
+_ENCODE_BLOCK_CHARS = 64 * 1024
+
+# UTF-8 的后续字节（0x80-0xBF），不是字符的开始
+_CONTINUATION_BYTES = bytes(range(0x80, 0xC0))
+
+
+@lru_cache(maxsize=None)
+def _token_char_lengths(encoder):
+    """词表中每个 token 包含的字符数（按 UTF-8 首字节计数，跨 token 的多字节字符算在第一个 token 上）"""
+    lengths = np.zeros(encoder.n_vocab, dtype=np.int64)
+    for token in range(encoder.n_vocab):
+        try:
+            data = encoder.decode_single_token_bytes(token)
+        except KeyError:
+            continue
+        lengths[token] = len(data.translate(None, _CONTINUATION_BYTES))
+    return lengths
+
+
+def _encode_blocks(text, encoder, num_threads):
+    """在段落边界处把文本切成大块并行编码，返回整个文本的 token 序列"""
+    if num_threads == 1 or len(text) <= _ENCODE_BLOCK_CHARS:
+        return np.asarray(encoder.encode_ordinary(text), dtype=np.int64)
+    cuts = [0]
+    while len(text) - cuts[-1] > _ENCODE_BLOCK_CHARS:
+        match = _PARAGRAPH_RE.search(text, cuts[-1] + _ENCODE_BLOCK_CHARS)
+        if match is None:
+            break
+        cuts.append(match.end())
+    cuts.append(len(text))
+    blocks = [text[start:end] for start, end in zip(cuts, cuts[1:])]
+    encoded = encoder.encode_ordinary_batch(blocks, num_threads=num_threads)
+    return np.concatenate([np.asarray(tokens, dtype=np.int64) for tokens in encoded])
+
+
+class SentenceTokenSplitter(TextSplitter):
+    """按 token 预算分割文本，块只在句子或段落边界处结束"""
+
+    def __init__(self, chunk_size=256, chunk_overlap=0, model=DEFAULT_MODEL, num_threads=None, **kwargs):
+        """
+        参数:
+            chunk_size: 每个块最多的 token 数
+            chunk_overlap: 相邻块之间重叠的 token 数（按整句回退，不超过这个值）
+            model: 用于选择 tiktoken 编码器的模型名
+            num_threads: 并行编码的线程数，默认 CPU 核数
+        """
+        super().__init__(chunk_size=chunk_size, chunk_overlap=chunk_overlap, **kwargs)
+        self._encoder = get_encoder(model)
+        self._num_threads = num_threads or os.cpu_count() or 1
+
+    def _boundaries(self, text, start):
+        """所有句子的起始位置（第一个是 start，最后一个是 len(text)），以及哪些是段落的开始"""
+        positions = [start] + [match.end() for match in _BOUNDARY_RE.finditer(text, start)]
+        paragraph_starts = {match.end() for match in _PARAGRAPH_RE.finditer(text, start)}
+        if positions[-1] < len(text):
+            positions.append(len(text))
+        paragraph = [position in paragraph_starts for position in positions]
+        paragraph[0] = paragraph[-1] = True
+        return positions, paragraph
+
+    def split_text_with_offsets(self, text):
+        """返回 [(开始, 结束, token 数)]，text[开始:结束] 就是块的内容（已去掉首尾空白）"""
+        start = len(text) - len(text.lstrip())
+        if start == len(text):
+            return []
+        tokens = _encode_blocks(text, self._encoder, self._num_threads)
+        if len(tokens) <= self._chunk_size:
+            # 快速通道：整个文本就是一个块
+            return [(start, len(text.rstrip()), len(tokens))]
+
+        # token_ends[i]：第 i 个 token 结束处的字符偏移
+        token_ends = np.cumsum(_token_char_lengths(self._encoder)[tokens])
+        positions, paragraph = self._boundaries(text, start)
+        # before[j]：positions[j] 之前结束的 token 数
+        before = np.searchsorted(token_ends, positions, side="right").tolist()
+        before[-1] = len(tokens)
+        positions, paragraph, before = self._split_long_sentences(text, positions, paragraph, before, token_ends)
+
+        paragraph_indexes = [j for j, is_paragraph in enumerate(paragraph) if is_paragraph]
+        spans = []
+        first = 0
+        last = len(positions) - 1
+        while first < last:
+            # 不超过 chunk_size 的最远句子边界
+            end = max(bisect_right(before, before[first] + self._chunk_size) - 1, first + 1)
+            end = min(end, last)
+            if end < last:
+                # 块的后半部分有段落边界时，在段落边界处结束
+                k = bisect_right(paragraph_indexes, end) - 1
+                p = paragraph_indexes[k] if k >= 0 else first
+                if p > first and before[p] - before[first] >= self._chunk_size // 2:
+                    end = p
+            chunk_end = positions[end]
+            while chunk_end > positions[first] and text[chunk_end - 1].isspace():
+                chunk_end -= 1
+            spans.append((positions[first], chunk_end, before[end] - before[first]))
+            if end == last:
+                break
+            # 重叠：从块的结尾往回退整句，重叠部分不超过 chunk_overlap 个 token，
+            # 并且下一个块至少还能再装下一句新内容
+            next_first = end
+            while (
+                next_first - 1 > first
+                and before[end] - before[next_first - 1] <= self._chunk_overlap
+                and before[end + 1] - before[next_first - 1] <= self._chunk_size
+            ):
+                next_first -= 1
+            first = next_first
+        return spans
+
+    def _split_long_sentences(self, text, positions, paragraph, before, token_ends):
+        """超过 chunk_size 的句子在内部的空白处再切开（按 chunk_size 个 token 估计位置）"""
+        if max(b - a for a, b in zip(before, before[1:])) <= self._chunk_size:
+            return positions, paragraph, before
+        new_positions, new_paragraph, new_before = [], [], []
+        for j in range(len(positions) - 1):
+            new_positions.append(positions[j])
+            new_paragraph.append(paragraph[j])
+            new_before.append(before[j])
+            tokens_at = before[j]
+            while before[j + 1] - tokens_at > self._chunk_size:
+                limit = int(token_ends[tokens_at + self._chunk_size - 1])
+                cut = text.rfind(" ", new_positions[-1] + 1, limit)
+                if cut < 0:
+                    # 没有空白（例如很长的 URL），直接在 token 边界处切开
+                    cut = limit
+                else:
+                    cut += 1
+                if int(np.searchsorted(token_ends, cut, side="right")) <= tokens_at:
+                    cut = limit
+                tokens_at = int(np.searchsorted(token_ends, cut, side="right"))
+                new_positions.append(cut)
+                new_paragraph.append(False)
+                new_before.append(tokens_at)
+        new_positions.append(positions[-1])
+        new_paragraph.append(paragraph[-1])
+        new_before.append(before[-1])
+        return new_positions, new_paragraph, new_before
+
+    def split_text(self, text):
+        return [text[start:end] for start, end, _ in self.split_text_with_offsets(text)]
+
+    def create_documents(self, texts, metadatas=None):
+        """与 TextSplitter.create_documents 相同，start_index 直接来自偏移量，不再在原文中查找块"""
+        documents = []
+        for i, text in enumerate(texts):
+            metadata = metadatas[i] if metadatas else {}
+            for start, end, _ in self.split_text_with_offsets(text):
+                chunk_metadata = dict(metadata)
+                if self._add_start_index:
+                    chunk_metadata["start_index"] = start
+                documents.append(Document(page_content=text[start:end], metadata=chunk_metadata))
+        return documents
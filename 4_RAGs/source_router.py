@@ -0,0 +1,105 @@
+# 来源路由：检索之前先判断问题涉及哪几本书，只在这些书中检索
+#
+# 2a 给每个块都加上了 {"source": 书名}，但 2b / 3 的检索从来没有用过它：
+# "What does dracula fear the most?" 也要在五本书的所有块里做向量检索和 BM25 检索，
+# 其他书里碰巧提到 fear 的块还会挤掉真正相关的块。
+#
+# SourceRouter 用 BM25 索引里已有的词频，为每个来源统计一份词表（不调用任何 API，亚毫秒级）：
+# 1. 对查询中的每个词，计算它在各来源中的相对频率（按来源的总词数归一化，避免长书占优），
+#    得到 P(来源 | 词)
+# 2. 只有"有区分度"的词参与路由：P(来源 | 词) 的最大值不低于 min_share，
+#    并且在这个来源中至少出现 min_count 次（只出现几次的词，比例再高也可能只是巧合）
+#    例如 "dracula" 只出现在 Dracula.txt，而 "fear"、"life" 在每本书里都有
+# 3. 把这些词的 P(来源 | 词) 取平均，按概率从高到低选择来源，直到累计概率达到 coverage，最多 max_sources 个
+# 4. 没有有区分度的词、或者选中了所有来源时返回 None，表示不过滤，照常检索全部来源
+#
+# 路由结果是 Chroma 写法的过滤条件，Chroma、NumpyVectorStore 和 BM25Index 都可以直接使用：
+#   {"source": "Dracula.txt"} 或 {"source": {"$in": ["Dracula.txt", "Frankenstein.txt"]}}
+
+from collections import Counter
+
+from bm25_index import tokenize
+
+
+def source_filter(sources, key="source"):
+    """来源列表 -> 元数据过滤条件；None 或空列表表示不过滤"""
+    if not sources:
+        return None
+    sources = sorted(sources)
+    return {key: sources[0]} if len(sources) == 1 else {key: {"$in": sources}}
+
+
+class SourceRouter:
+    """按查询中有区分度的词选择可能相关的来源"""
+
+    def __init__(self, term_counts, key="source", min_share=0.6, min_count=10, coverage=0.9, max_sources=2):
+        """
+        参数:
+            term_counts: {来源: Counter(词 -> 出现次数)}
+            key: 过滤条件使用的元数据字段
+            min_share: 词的 P(来源 | 词) 最大值不低于这个值才参与路由
+            min_count: 词在最可能的来源中至少出现这么多次才参与路由
+            coverage: 选中来源的累计概率达到这个值就停止
+            max_sources: 最多选择的来源数
+        """
+        self.key = key
+        self.min_share = min_share
+        self.min_count = min_count
+        self.coverage = coverage
+        self.max_sources = max_sources
+        self.sources = sorted(term_counts)
+        self.term_counts = term_counts
+        self.source_totals = {source: sum(counts.values()) or 1 for source, counts in term_counts.items()}
+
+    @classmethod
+    def from_bm25(cls, index, key="source", **kwargs):
+        """从 BM25Index 的倒排表和块元数据中统计每个来源的词频"""
+        chunk_source = {chunk_id: metadata.get(key) for chunk_id, (_, metadata) in index.docs.items()}
+        term_counts = {source: Counter() for source in set(chunk_source.values()) if source is not None}
+        for term, posting in index.postings.items():
+            for chunk_id, tf in posting.items():
+                source = chunk_source.get(chunk_id)
+                if source is not None:
+                    term_counts[source][term] += tf
+        return cls(term_counts, key=key, **kwargs)
+
+    def term_shares(self, term):
+        """P(来源 | 词)：按来源总词数归一化后的相对频率"""
+        rates = {source: self.term_counts[source][term] / self.source_totals[source] for source in self.sources}
+        total = sum(rates.values())
+        if total == 0:
+            return None
+        return {source: rate / total for source, rate in rates.items()}
+
+    def scores(self, query):
+        """返回 {来源: 概率}，只由有区分度的词决定；没有这样的词时返回空字典"""
+        distinctive = []
+        for term in set(tokenize(query)):
+            shares = self.term_shares(term)
+            if shares is None:
+                continue
+            best = max(shares, key=shares.get)
+            if shares[best] >= self.min_share and self.term_counts[best][term] >= self.min_count:
+                distinctive.append(shares)
+        if not distinctive:
+            return {}
+        return {source: sum(shares[source] for shares in distinctive) / len(distinctive) for source in self.sources}
+
+    def route(self, query):
+        """返回可能相关的来源列表（按概率降序）；无法判断时返回 None，表示检索全部来源"""
+        scores = self.scores(query)
+        if not scores:
+            return None
+        selected = []
+        cumulative = 0.0
+        for source in sorted(scores, key=scores.get, reverse=True):
+            if cumulative >= self.coverage or len(selected) >= self.max_sources:
+                break
+            selected.append(source)
+            cumulative += scores[source]
+        if len(selected) == len(self.sources):
+            return None
+        return selected
+
+    def filter_for(self, query):
+        return source_filter(self.route(query), key=self.key)
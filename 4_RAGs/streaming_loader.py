@@ -0,0 +1,127 @@
+# 流式并行加载与分割：按段读取文件，在进程池中分割，边产生边交给嵌入阶段
+#
+# 2a 原来的做法是：
+#   for book_file in os.listdir(books_dir): documents += TextLoader(...).load()
+#   docs = text_splitter.split_documents(documents)
+# 内存峰值 = 整个语料库的文本 + 所有的块，documents/ 从几 MB 增长到几 GB 时会直接撑爆内存。
+#
+# 这里的做法（类似 Hadoop 的输入分片）：
+# 1. 只根据文件大小把每个文件切成若干个约 segment_size 字节的段，主进程不读取文件内容
+# 2. 每个段交给进程池中的一个工作进程：它自己从磁盘读取这一段，
+#    把段的起止位置对齐到段落分隔符 "\n\n" 之后，再用 CharacterTextSplitter 分割
+#    （相邻两个段对同一个位置计算出的对齐点完全相同，所以不会丢失或重复文本）
+# 3. 主进程按顺序取回结果、逐个 yield 带有 source 元数据的 Document
+# 4. 同时在途的段数不超过 max_in_flight，下游（嵌入阶段）消费慢时不会继续读取
+#
+# 内存占用约为 max_in_flight × segment_size，与语料库大小无关。
+#
+# 注意：使用进程池的脚本必须把执行代码放在 if __name__ == "__main__": 之下，
+# 否则在 spawn/forkserver 启动方式下，子进程导入主模块时会重复执行脚本。
+
+import os
+from collections import deque
+
+from langchain.text_splitter import CharacterTextSplitter
+from langchain_core.documents import Document
+
+SEPARATOR = b"\n\n"
+DEFAULT_SEGMENT_SIZE = 4 * 1024 * 1024
+_SCAN_BLOCK = 64 * 1024
+
+# 每个工作进程只创建一次分割器
+_splitters = {}
+
+
+def _get_splitter(chunk_size, chunk_overlap):
+    key = (chunk_size, chunk_overlap)
+    if key not in _splitters:
+        _splitters[key] = CharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    return _splitters[key]
+
+
+def _aligned_offset(f, position, file_size):
+    """
+    返回 position 处或之后第一个段落分隔符结束的位置
+    position 为 0 或已到文件末尾时直接返回，找不到分隔符时返回文件末尾
+    """
+    if position <= 0:
+        return 0
+    if position >= file_size:
+        return file_size
+    f.seek(position)
+    offset = position
+    tail = b""
+    while True:
+        block = f.read(_SCAN_BLOCK)
+        if not block:
+            return file_size
+        window = tail + block
+        index = window.find(SEPARATOR)
+        if index >= 0:
+            return offset - len(tail) + index + len(SEPARATOR)
+        # 保留最后一个字节，防止分隔符恰好跨越两个块
+        tail = window[-(len(SEPARATOR) - 1):]
+        offset += len(block)
+
+
+def _split_segment(file_path, start, end, chunk_size, chunk_overlap, encoding):
+    """工作进程：读取 [start, end) 对齐后的那一段文本并分割成块，只返回块的文本"""
+    file_size = os.path.getsize(file_path)
+    with open(file_path, "rb") as f:
+        real_start = _aligned_offset(f, start, file_size)
+        real_end = _aligned_offset(f, end, file_size)
+        if real_end <= real_start:
+            return []
+        f.seek(real_start)
+        text = f.read(real_end - real_start).decode(encoding)
+    return _get_splitter(chunk_size, chunk_overlap).split_text(text)
+
+
+def _segments(file_path, segment_size):
+    file_size = os.path.getsize(file_path)
+    for start in range(0, max(file_size, 1), segment_size):
+        yield start, min(start + segment_size, file_size)
+
+
+def stream_file_chunks(
+    file_path,
+    source,
+    executor,
+    chunk_size=1000,
+    chunk_overlap=0,
+    segment_size=DEFAULT_SEGMENT_SIZE,
+    max_in_flight=None,
+    encoding="utf-8",
+):
+    """
+    流式地把单个文件分割成 Document 块
+
+    参数:
+        file_path: 文件路径
+        source: 写入 metadata["source"] 的来源名称
+        executor: concurrent.futures 的进程池（多个文件可以共用一个）
+        chunk_size / chunk_overlap: 传给 CharacterTextSplitter 的参数
+        segment_size: 每个工作进程一次处理的字节数
+        max_in_flight: 同时在途的段数上限，默认是进程池大小的 2 倍
+    """
+    if max_in_flight is None:
+        max_in_flight = 2 * getattr(executor, "_max_workers", os.cpu_count() or 1)
+
+    pending = deque()
+    for start, end in _segments(file_path, segment_size):
+        pending.append(
+            executor.submit(_split_segment, file_path, start, end, chunk_size, chunk_overlap, encoding)
+        )
+        # 在途段数达到上限时，先把最早的段的结果交出去，再提交新的段
+        while len(pending) >= max_in_flight:
+            for text in pending.popleft().result():
+                yield Document(page_content=text, metadata={"source": source})
+    while pending:
+        for text in pending.popleft().result():
+            yield Document(page_content=text, metadata={"source": source})
+
+
+def stream_directory(books_dir, executor, extensions=(".txt",), **kwargs):
+    """按文件名顺序流式地分割目录下的所有文件，每个块的 source 元数据是文件名"""
+    for book_file in sorted(f for f in os.listdir(books_dir) if f.endswith(extensions)):
+        yield from stream_file_chunks(os.path.join(books_dir, book_file), book_file, executor, **kwargs)
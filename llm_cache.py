@@ -0,0 +1,135 @@
+# LLM 响应缓存：相同的模型、参数和消息，直接返回上次的回复
+#
+# 1_chat_models / 2_prompt_templates / 3_chains 下的脚本每次运行都用完全相同的提示调用模型，
+# 例如 chain.invoke({"animal": "elephant", "fact_count": 2})，每次都要等网络往返、都要付费。
+#
+# SQLiteLLMCache 实现 LangChain 的 BaseCache 接口，通过 set_llm_cache 全局安装后，
+# 进程内所有聊天模型（ChatOpenAI、ChatAnthropic……）在调用 API 之前都会先查缓存：
+# - 缓存键是 sha256(llm_string + prompt)：llm_string 由 LangChain 生成，包含模型名和所有参数
+#   （temperature、stop 等），prompt 是序列化后的完整消息列表，任何一项不同都不会命中
+# - 回复存成 JSON（消息用 message_to_dict 序列化），保留 usage_metadata 等元数据
+# - 记录最近访问时间，条目数超过 max_entries 时按 LRU 淘汰最久未使用的回复（与 4_RAGs/embedding_cache.py 相同）
+# - hits / misses 计数器记录命中情况
+#
+# 使用方法（1_chat_models / 2_prompt_templates / 3_chains 下的脚本先把仓库根目录追加到 sys.path，
+# 与 4_RAGs/context_packing.py 导入 1_chat_models/token_counter.py 的方式相同）：
+#   sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+#   from llm_cache import install_llm_cache  # noqa: E402
+#   install_llm_cache()
+# 环境变量：
+#   LLM_CACHE=off          关闭缓存，每次都调用模型
+#   LLM_CACHE_PATH=...     缓存文件路径，默认是仓库根目录下的 llm_cache.sqlite3
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from langchain_core.caches import BaseCache
+from langchain_core.globals import set_llm_cache
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, Generation
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_cache.sqlite3")
+
+
+def _cache_key(prompt, llm_string):
+    return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).digest()
+
+
+def _dump_generations(generations):
+    records = []
+    for generation in generations:
+        record = {"text": generation.text, "generation_info": generation.generation_info}
+        if isinstance(generation, ChatGeneration):
+            record["message"] = message_to_dict(generation.message)
+        records.append(record)
+    return json.dumps(records)
+
+
+def _load_generations(value):
+    generations = []
+    for record in json.loads(value):
+        if "message" in record:
+            message = messages_from_dict([record["message"]])[0]
+            generations.append(ChatGeneration(message=message, generation_info=record["generation_info"]))
+        else:
+            generations.append(Generation(text=record["text"], generation_info=record["generation_info"]))
+    return generations
+
+
+class SQLiteLLMCache(BaseCache):
+    """持久化到本地 SQLite 的 LLM 响应缓存，带 LRU 淘汰和命中计数"""
+
+    def __init__(self, cache_path=DEFAULT_CACHE_PATH, max_entries=10_000):
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+        # RunnableParallel 等会在多个线程中同时调用模型，用一把锁保护连接
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key BLOB PRIMARY KEY,
+                value TEXT NOT NULL,
+                last_access REAL NOT NULL
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self._conn.commit()
+
+    def lookup(self, prompt, llm_string):
+        key = _cache_key(prompt, llm_string)
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+        return _load_generations(row[0])
+
+    def update(self, prompt, llm_string, return_val):
+        key = _cache_key(prompt, llm_string)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, last_access) VALUES (?, ?, ?)",
+                (key, _dump_generations(return_val), time.time()),
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY last_access LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._conn.commit()
+
+    def clear(self, **kwargs):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+def install_llm_cache(cache_path=None, max_entries=10_000):
+    """创建缓存并通过 set_llm_cache 全局安装；LLM_CACHE=off 时不安装，返回 None"""
+    if os.getenv("LLM_CACHE", "on").lower() in ("0", "off", "false", "no"):
+        return None
+    cache = SQLiteLLMCache(cache_path or os.getenv("LLM_CACHE_PATH") or DEFAULT_CACHE_PATH, max_entries)
+    set_llm_cache(cache)
+    return cache